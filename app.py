@@ -7,10 +7,12 @@ from functools import wraps
 import os
 from datetime import datetime, timedelta
 import jwt
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.exc import StaleDataError
 import secrets
 import string
 from config import Config
-from database import db, init_db
+from database import db, init_db, seed_admin_user
 from models.user import User
 from models.voucher import Voucher
 from models.network import Network
@@ -20,16 +22,41 @@ from routes.admin import admin_bp
 from routes.vouchers import vouchers_bp
 from routes.networks import networks_bp
 from routes.network_control import network_control_bp
+from routes.events import events_bp
+from routes.usage import usage_bp
+from routes.analytics import analytics_bp
 from utils.network_manager import start_network_monitoring
 from utils.auth import token_required, admin_required
+from utils.event_bus import publish_event, init_event_bus
+from utils.stats import get_dashboard_stats
+from utils.metrics import init_metrics
+from utils.query_audit import init_query_audit
+from utils.router_oplog import init_router_oplog, recover_router_operations
+from utils.cache import init_cache
+from utils.sqlite_writer import configure_sqlite
+from utils.replica import configure_database_pools, replica_reads
+from commands import register_commands
 
-def create_app():
+migrate = Migrate()
+
+def create_app(config_overrides=None):
     app = Flask(__name__)
     app.config.from_object(Config)
+    if config_overrides:
+        app.config.update(config_overrides)
     
     # Initialize extensions
+    configure_sqlite(app)
+    configure_database_pools(app)
     db.init_app(app)
+    migrate.init_app(app, db)
     CORS(app, origins="*")
+    init_metrics(app)
+    init_query_audit(app)
+    init_cache(app)
+    init_event_bus(app)
+    init_router_oplog(app)
+    register_commands(app)
     
     # Register blueprints
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
@@ -37,6 +64,9 @@ def create_app():
     app.register_blueprint(vouchers_bp, url_prefix='/api/vouchers')
     app.register_blueprint(networks_bp, url_prefix='/api/networks')
     app.register_blueprint(network_control_bp, url_prefix='/api/control')
+    app.register_blueprint(events_bp, url_prefix='/api/events')
+    app.register_blueprint(usage_bp, url_prefix='/api/usage')
+    app.register_blueprint(analytics_bp, url_prefix='/api/analytics')
     
     @app.route('/')
     def index():
@@ -75,31 +105,11 @@ def create_app():
     
     @app.route('/api/stats/dashboard')
     @token_required
+    @replica_reads
     def dashboard_stats(current_user):
         """Get dashboard statistics"""
         try:
-            total_vouchers = Voucher.query.count()
-            active_vouchers = Voucher.query.filter_by(status='active').count()
-            used_vouchers = Voucher.query.filter_by(status='used').count()
-            total_networks = Network.query.count()
-            total_routers = Router.query.count()
-            
-            # Recent activity
-            recent_vouchers = Voucher.query.order_by(Voucher.created_at.desc()).limit(5).all()
-            
-            stats = {
-                'total_vouchers': total_vouchers,
-                'active_vouchers': active_vouchers,
-                'used_vouchers': used_vouchers,
-                'total_networks': total_networks,
-                'total_routers': total_routers,
-                'recent_vouchers': [{
-                    'id': v.id,
-                    'code': v.code,
-                    'status': v.status,
-                    'created_at': v.created_at.isoformat()
-                } for v in recent_vouchers]
-            }
+            stats = get_dashboard_stats()
             
             return jsonify(stats)
         except Exception as e:
@@ -115,7 +125,9 @@ def create_app():
             if not voucher_code:
                 return jsonify({'error': 'كود الكرت مطلوب'}), 400
             
-            voucher = Voucher.query.filter_by(code=voucher_code, status='active').first()
+            # The plan is needed for the sales summary and the response
+            voucher = Voucher.query.options(joinedload(Voucher.plan)).filter_by(
+                code=voucher_code, status='active').first()
             
             if not voucher:
                 return jsonify({'error': 'كود غير صحيح أو منتهي الصلاحية'}), 404
@@ -134,7 +146,14 @@ def create_app():
             session_token = secrets.token_urlsafe(32)
             voucher.session_token = session_token
             
-            db.session.commit()
+            try:
+                db.session.commit()
+            except StaleDataError:
+                # Another request redeemed the same code first
+                db.session.rollback()
+                return jsonify({'error': 'الكرت مستخدم مسبقاً'}), 409
+            
+            publish_event('voucher.redeemed', {'code': voucher.code, 'status': voucher.status})
             
             return jsonify({
                 'message': 'تم تفعيل الكرت بنجاح',
@@ -154,29 +173,35 @@ def create_app():
     def internal_error(error):
         return render_template('500.html'), 500
     
-    with app.app_context():
-        init_db()
-        
-        # Create default admin user if not exists
-        admin_user = User.query.filter_by(username='admin').first()
-        if not admin_user:
-            admin_user = User()
-            admin_user.username = 'admin'
-            admin_user.email = 'admin@wifi-manager.local'
-            admin_user.password_hash = generate_password_hash('admin123')
-            admin_user.role = 'admin'
-            admin_user.is_active = True
-            db.session.add(admin_user)
-            db.session.commit()
-            print("Created default admin user: admin/admin123")
-        
-        # Start network monitoring
+    # One-time setup; production workers skip this (see wsgi.py and commands.py)
+    if app.config.get('AUTO_INIT_DB', True):
+        with app.app_context():
+            init_db()
+            seed_admin_user(
+                app.config.get('ADMIN_USERNAME', 'admin'),
+                app.config.get('ADMIN_PASSWORD', 'admin123'),
+                app.config.get('ADMIN_EMAIL', 'admin@wifi-manager.local')
+            )
+    
+    # Router operations a previous run left unapplied
+    recover_router_operations()
+    
+    # Start network monitoring
+    if app.config.get('NETWORK_MONITOR_ENABLED', True):
         try:
             start_network_monitoring(app)
             print("Network monitoring started")
         except Exception as e:
             print(f"Failed to start network monitoring: {e}")
     
+    # Built-in RADIUS server (production runs `flask radius` as its own process)
+    if app.config.get('RADIUS_ENABLED'):
+        try:
+            from utils.radius import start_radius_server
+            start_radius_server(app)
+        except Exception as e:
+            print(f"Failed to start RADIUS server: {e}")
+    
     return app
 
 if __name__ == '__main__':
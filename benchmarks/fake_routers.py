@@ -0,0 +1,599 @@
+"""
+Local Router Simulators
+In-process fake MikroTik API, UniFi controller and Cisco SSH servers with
+configurable latency and failure rates, so router-bound code paths can be
+benchmarked offline. Each server listens on 127.0.0.1 and an ephemeral port
+that a `Router` row can point at through `ip_address` / `api_port`.
+"""
+
+import json
+import random
+import secrets
+import socket
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class SimulatedBehavior:
+    """Latency and failure injection shared by all simulators"""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, failure_rate=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def apply(self):
+        """Sleep for the simulated latency; returns False for an injected failure"""
+        with self._lock:
+            self.calls += 1
+        delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+        return random.random() >= self.failure_rate
+
+class _ThreadedServer:
+    """Run a server object's serve_forever in a daemon thread"""
+
+    def __init__(self, server):
+        self.server = server
+        self.thread = threading.Thread(target=server.serve_forever, daemon=True)
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+# ---------------------------------------------------------------------------
+# MikroTik RouterOS API (binary word protocol on TCP)
+# ---------------------------------------------------------------------------
+
+def encode_length(length):
+    """Encode a RouterOS API word length"""
+    if length < 0x80:
+        return bytes([length])
+    if length < 0x4000:
+        return (length | 0x8000).to_bytes(2, 'big')
+    if length < 0x200000:
+        return (length | 0xC00000).to_bytes(3, 'big')
+    if length < 0x10000000:
+        return (length | 0xE0000000).to_bytes(4, 'big')
+    return b'\xf0' + length.to_bytes(4, 'big')
+
+def encode_sentence(words):
+    """Encode a RouterOS API sentence (list of str words)"""
+    data = bytearray()
+    for word in words:
+        raw = word.encode('utf-8')
+        data += encode_length(len(raw)) + raw
+    data += b'\x00'
+    return bytes(data)
+
+def _read_exact(stream, count):
+    data = stream.read(count)
+    if len(data) < count:
+        raise EOFError
+    return data
+
+def read_length(stream):
+    """Decode a RouterOS API word length from a binary stream"""
+    first = _read_exact(stream, 1)[0]
+    if first < 0x80:
+        return first
+    if first < 0xC0:
+        return ((first & 0x3F) << 8) | _read_exact(stream, 1)[0]
+    if first < 0xE0:
+        return ((first & 0x1F) << 16) | int.from_bytes(_read_exact(stream, 2), 'big')
+    if first < 0xF0:
+        return ((first & 0x0F) << 24) | int.from_bytes(_read_exact(stream, 3), 'big')
+    return int.from_bytes(_read_exact(stream, 4), 'big')
+
+def read_sentence(stream):
+    """Read one sentence; returns a list of str words"""
+    words = []
+    while True:
+        length = read_length(stream)
+        if length == 0:
+            return words
+        words.append(_read_exact(stream, length).decode('utf-8'))
+
+class MikroTikState:
+    """Hotspot users and profiles held by a simulated RouterOS device"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next_id = 1
+        self.users = {}  # .id -> attributes
+        self.profiles = {'*0': {'.id': '*0', 'name': 'default'}}
+        self.active = {}  # .id -> attributes of /ip/hotspot/active entries
+
+    def new_id(self):
+        item_id = f'*{self.next_id:X}'
+        self.next_id += 1
+        return item_id
+
+    def table(self, path):
+        return {
+            '/ip/hotspot/user': self.users,
+            '/ip/hotspot/user/profile': self.profiles,
+            '/ip/hotspot/active': self.active,
+        }.get(path)
+
+class _MikroTikHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        simulator = self.server.simulator
+        while True:
+            try:
+                words = read_sentence(self.rfile)
+            except (EOFError, ConnectionError, OSError):
+                return
+            if not words:
+                continue
+
+            command = words[0]
+            attributes = {}
+            tag = None
+            for word in words[1:]:
+                if word.startswith('.tag='):
+                    tag = word[5:]
+                elif word.startswith('='):
+                    key, _, value = word[1:].partition('=')
+                    attributes[key] = value
+                elif word.startswith('?'):
+                    key, _, value = word[1:].partition('=')
+                    attributes.setdefault('?', {})[key] = value
+
+            replies = simulator.execute(command, attributes)
+            payload = b''
+            for reply in replies:
+                if tag is not None:
+                    reply = reply + [f'.tag={tag}']
+                payload += encode_sentence(reply)
+            self.wfile.write(payload)
+            self.wfile.flush()
+
+class FakeMikroTikServer:
+    """Simulated RouterOS API endpoint supporting the hotspot commands we use"""
+
+    def __init__(self, username='admin', password='admin', behavior=None, host='127.0.0.1', port=0):
+        self.username = username
+        self.password = password
+        self.behavior = behavior or SimulatedBehavior()
+        self.state = MikroTikState()
+        server = socketserver.ThreadingTCPServer((host, port), _MikroTikHandler)
+        server.daemon_threads = True
+        server.simulator = self
+        self._runner = _ThreadedServer(server)
+
+    @property
+    def port(self):
+        return self._runner.port
+
+    def start(self):
+        self._runner.start()
+        return self
+
+    def stop(self):
+        self._runner.stop()
+
+    def execute(self, command, attributes):
+        """Run one API command; returns the reply sentences"""
+        if command == '/login':
+            if attributes.get('name') == self.username and attributes.get('password') == self.password:
+                return [['!done']]
+            return [['!trap', '=message=invalid user name or password'], ['!done']]
+
+        if not self.behavior.apply():
+            return [['!trap', '=message=simulated failure'], ['!done']]
+
+        if command == '/system/resource/print':
+            return [['!re', '=uptime=1d2h3m4s', '=cpu-load=3', '=version=7.14 (simulated)'], ['!done']]
+
+        path, _, action = command.rpartition('/')
+        with self.state.lock:
+            table = self.state.table(path)
+            if table is None:
+                return [['!trap', f'=message=no such command prefix {path}'], ['!done']]
+
+            if action == 'print':
+                proplist = attributes.get('.proplist')
+                fields = proplist.split(',') if proplist else None
+                filters = attributes.get('?', {})
+                replies = []
+                for item in table.values():
+                    if any(item.get(k) != v for k, v in filters.items()):
+                        continue
+                    keys = fields or list(item.keys())
+                    replies.append(['!re'] + [f'={k}={item[k]}' for k in keys if k in item])
+                return replies + [['!done']]
+
+            if action == 'add':
+                name = attributes.get('name')
+                if name and any(item.get('name') == name for item in table.values()):
+                    return [['!trap', '=message=failure: already have user with this name'], ['!done']]
+                item_id = self.state.new_id()
+                table[item_id] = {'.id': item_id, **attributes}
+                return [['!done', f'=ret={item_id}']]
+
+            if action == 'remove':
+                for item_id in attributes.get('.id', '').split(','):
+                    table.pop(item_id, None)
+                return [['!done']]
+
+            if action == 'set':
+                item = table.get(attributes.get('.id'))
+                if item is not None:
+                    item.update({k: v for k, v in attributes.items() if k not in ('.id', '?')})
+                return [['!done']]
+
+        return [['!trap', f'=message=unknown command {command}'], ['!done']]
+
+# ---------------------------------------------------------------------------
+# UniFi controller (JSON over HTTP; plain HTTP unless a certificate is given)
+# ---------------------------------------------------------------------------
+
+class _UniFiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=None, headers=None):
+        payload = json.dumps(body if body is not None else {'meta': {'rc': 'ok'}, 'data': []}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _authorized(self):
+        cookie = self.headers.get('Cookie') or ''
+        return any(f'unifises={token}' in cookie for token in self.server.simulator.sessions)
+
+    def do_POST(self):
+        simulator = self.server.simulator
+        body = self._read_json()
+
+        if self.path == '/api/login':
+            simulator.logins += 1
+            if body.get('username') == simulator.username and body.get('password') == simulator.password:
+                token = secrets.token_hex(16)
+                simulator.sessions.add(token)
+                return self._send(200, headers={'Set-Cookie': f'unifises={token}; Path=/'})
+            return self._send(400, {'meta': {'rc': 'error', 'msg': 'api.err.Invalid'}, 'data': []})
+
+        if not self._authorized():
+            return self._send(401, {'meta': {'rc': 'error', 'msg': 'api.err.LoginRequired'}, 'data': []})
+        if not simulator.behavior.apply():
+            return self._send(500, {'meta': {'rc': 'error', 'msg': 'simulated failure'}, 'data': []})
+
+        if self.path.endswith('/cmd/hotspot'):
+            return self._send(200, simulator.hotspot_command(body))
+        if self.path.endswith('/cmd/stamgr'):
+            return self._send(200, simulator.stamgr_command(body))
+        if self.path.endswith('/stat/sta'):
+            macs = set(body.get('macs') or [])
+            with simulator.lock:
+                data = [s for mac, s in simulator.stations.items() if not macs or mac in macs]
+            return self._send(200, {'meta': {'rc': 'ok'}, 'data': data})
+        return self._send(404)
+
+    def do_GET(self):
+        simulator = self.server.simulator
+        if not self._authorized():
+            return self._send(401, {'meta': {'rc': 'error', 'msg': 'api.err.LoginRequired'}, 'data': []})
+        if not simulator.behavior.apply():
+            return self._send(500, {'meta': {'rc': 'error', 'msg': 'simulated failure'}, 'data': []})
+
+        if self.path == '/api/self/sites':
+            return self._send(200, {'meta': {'rc': 'ok'}, 'data': [{'name': 'default', 'desc': 'Default'}]})
+        if self.path.endswith('/stat/sta'):
+            with simulator.lock:
+                data = list(simulator.stations.values())
+            return self._send(200, {'meta': {'rc': 'ok'}, 'data': data})
+        if self.path.endswith('/stat/voucher'):
+            with simulator.lock:
+                data = list(simulator.vouchers.values())
+            return self._send(200, {'meta': {'rc': 'ok'}, 'data': data})
+        return self._send(404)
+
+class FakeUniFiServer:
+    """Simulated UniFi controller supporting login, sites, vouchers and stations"""
+
+    def __init__(self, username='admin', password='admin', behavior=None, host='127.0.0.1', port=0, certfile=None):
+        self.username = username
+        self.password = password
+        self.behavior = behavior or SimulatedBehavior()
+        self.lock = threading.Lock()
+        self.sessions = set()
+        self.vouchers = {}
+        self.stations = {}
+        self.logins = 0
+        server = ThreadingHTTPServer((host, port), _UniFiHandler)
+        server.daemon_threads = True
+        server.simulator = self
+        if certfile:
+            import ssl
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile)
+            server.socket = context.wrap_socket(server.socket, server_side=True)
+        self._runner = _ThreadedServer(server)
+
+    @property
+    def port(self):
+        return self._runner.port
+
+    def start(self):
+        self._runner.start()
+        return self
+
+    def stop(self):
+        self._runner.stop()
+
+    def expire_sessions(self):
+        """Invalidate all login cookies (forces clients to re-authenticate)"""
+        self.sessions.clear()
+
+    def hotspot_command(self, body):
+        with self.lock:
+            if body.get('cmd') == 'create-voucher':
+                count = int(body.get('n', 1))
+                create_time = int(time.time() * 1000)
+                created = []
+                for _ in range(count):
+                    code = body.get('name') if count == 1 and body.get('name') else secrets.token_hex(5)
+                    voucher = {
+                        '_id': secrets.token_hex(12),
+                        'code': code,
+                        'duration': body.get('duration') or body.get('expire'),
+                        'qos_rate_max_up': body.get('up', 0),
+                        'qos_rate_max_down': body.get('down', 0),
+                        'qos_usage_quota': body.get('bytes', 0),
+                        'note': body.get('note'),
+                        'create_time': create_time
+                    }
+                    self.vouchers[voucher['_id']] = voucher
+                    created.append(voucher)
+                return {'meta': {'rc': 'ok'}, 'data': [{'create_time': create_time}], 'vouchers': created}
+            if body.get('cmd') == 'delete-voucher':
+                self.vouchers.pop(body.get('_id'), None)
+                return {'meta': {'rc': 'ok'}, 'data': []}
+        return {'meta': {'rc': 'error', 'msg': 'api.err.UnknownCommand'}, 'data': []}
+
+    def stamgr_command(self, body):
+        with self.lock:
+            if body.get('cmd') in ('kick-sta', 'unauthorize-guest'):
+                self.stations.pop(body.get('mac'), None)
+        return {'meta': {'rc': 'ok'}, 'data': []}
+
+    def add_station(self, mac, ip=None, tx_bytes=0, rx_bytes=0, voucher_code=None):
+        """Register a connected guest station for stat/sta reads"""
+        with self.lock:
+            self.stations[mac] = {
+                'mac': mac, 'ip': ip, 'is_guest': True, 'authorized': True,
+                'tx_bytes': tx_bytes, 'rx_bytes': rx_bytes, 'voucher_code': voucher_code
+            }
+
+# ---------------------------------------------------------------------------
+# Cisco IOS over SSH (requires paramiko, like the real Cisco manager)
+# ---------------------------------------------------------------------------
+
+class CiscoState:
+    """Local user database of a simulated IOS device"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.usernames = {}
+
+    def run(self, line, mode):
+        """Execute one CLI line; returns (output, new_mode)"""
+        words = line.strip().split()
+        if not words:
+            return '', mode
+        with self.lock:
+            if words[:2] == ['configure', 'terminal'] or words == ['conf', 't']:
+                return 'Enter configuration commands, one per line.  End with CNTL/Z.', 'config'
+            if words[0] in ('end', 'exit') and mode == 'config':
+                return '', 'exec'
+            if words[0] == 'terminal':
+                return '', mode
+            if mode == 'config' and words[0] == 'username' and len(words) >= 2:
+                self.usernames[words[1]] = ' '.join(words[2:])
+                return '', mode
+            if mode == 'config' and words[:2] == ['no', 'username'] and len(words) >= 3:
+                self.usernames.pop(words[2], None)
+                return '', mode
+            if words[:2] == ['show', 'running-config'] or words[:2] == ['show', 'run']:
+                return '\n'.join(f'username {u} {rest}' for u, rest in self.usernames.items()), mode
+            if words[:2] == ['show', 'users']:
+                return '\n'.join(f'  vty 0     {u}       idle' for u in self.usernames), mode
+        return f"% Invalid input detected at '^' marker.\n{line}", mode
+
+class FakeCiscoSSHServer:
+    """Simulated Cisco IOS SSH endpoint with exec and interactive shell channels"""
+
+    def __init__(self, username='admin', password='admin', behavior=None, host='127.0.0.1', port=0,
+                 hostname='Router'):
+        import paramiko
+
+        self.paramiko = paramiko
+        self.username = username
+        self.password = password
+        self.behavior = behavior or SimulatedBehavior()
+        self.hostname = hostname
+        self.state = CiscoState()
+        self.handshakes = 0
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(100)
+        self.running = False
+        self.thread = threading.Thread(target=self._accept_loop, daemon=True)
+
+    @property
+    def port(self):
+        return self.sock.getsockname()[1]
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        self.sock.close()
+
+    def prompt(self, mode):
+        return f'{self.hostname}(config)#' if mode == 'config' else f'{self.hostname}#'
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                client, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve_client, args=(client,), daemon=True).start()
+
+    def _serve_client(self, client):
+        paramiko = self.paramiko
+        simulator = self
+
+        class Interface(paramiko.ServerInterface):
+            def check_auth_password(self, username, password):
+                if username == simulator.username and password == simulator.password:
+                    return paramiko.AUTH_SUCCESSFUL
+                return paramiko.AUTH_FAILED
+
+            def get_allowed_auths(self, username):
+                return 'password'
+
+            def check_channel_request(self, kind, chanid):
+                return paramiko.OPEN_SUCCEEDED if kind == 'session' else \
+                    paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+            def check_channel_pty_request(self, *args):
+                return True
+
+            def check_channel_shell_request(self, channel):
+                threading.Thread(target=simulator._run_shell, args=(channel,), daemon=True).start()
+                return True
+
+            def check_channel_exec_request(self, channel, command):
+                threading.Thread(target=simulator._run_exec, args=(channel, command), daemon=True).start()
+                return True
+
+        transport = paramiko.Transport(client)
+        transport.add_server_key(self.host_key)
+        try:
+            transport.start_server(server=Interface())
+            self.handshakes += 1
+            while transport.is_active() and self.running:
+                channel = transport.accept(timeout=1)
+                if channel is None:
+                    continue
+        except Exception:
+            pass
+        finally:
+            transport.close()
+
+    def _run_exec(self, channel, command):
+        try:
+            if not self.behavior.apply():
+                channel.sendall(b'% simulated failure\n')
+                channel.send_exit_status(1)
+                return
+            output, _ = self.state.run(command.decode('utf-8'), 'exec')
+            channel.sendall((output + '\n').encode())
+            channel.send_exit_status(0)
+        finally:
+            channel.close()
+
+    def _run_shell(self, channel):
+        mode = 'exec'
+        buffer = b''
+        try:
+            channel.sendall(f'\r\n{self.prompt(mode)}'.encode())
+            while True:
+                data = channel.recv(4096)
+                if not data:
+                    return
+                buffer += data
+                while b'\n' in buffer:
+                    raw, buffer = buffer.split(b'\n', 1)
+                    line = raw.decode('utf-8').rstrip('\r')
+                    if line.strip() in ('quit', 'logout') or (line.strip() == 'exit' and mode == 'exec'):
+                        return
+                    if not self.behavior.apply():
+                        output = '% simulated failure'
+                    else:
+                        output, mode = self.state.run(line, mode)
+                    response = f'{line}\r\n'
+                    if output:
+                        response += output.replace('\n', '\r\n') + '\r\n'
+                    channel.sendall((response + self.prompt(mode)).encode())
+        except Exception:
+            pass
+        finally:
+            channel.close()
+
+# ---------------------------------------------------------------------------
+# Convenience wrapper
+# ---------------------------------------------------------------------------
+
+class RouterSimulator:
+    """Start one simulator per brand and describe them as Router rows"""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, failure_rate=0.0, brands=('MikroTik', 'Ubiquiti', 'Cisco'),
+                 username='admin', password='admin'):
+        self.username = username
+        self.password = password
+        self.servers = {}
+        behavior = lambda: SimulatedBehavior(latency_ms, jitter_ms, failure_rate)
+        if 'MikroTik' in brands:
+            self.servers['MikroTik'] = FakeMikroTikServer(username, password, behavior())
+        if 'Ubiquiti' in brands:
+            self.servers['Ubiquiti'] = FakeUniFiServer(username, password, behavior())
+        if 'Cisco' in brands:
+            try:
+                self.servers['Cisco'] = FakeCiscoSSHServer(username, password, behavior())
+            except ImportError:
+                print("paramiko not installed; Cisco simulator disabled")
+
+    def __enter__(self):
+        for server in self.servers.values():
+            server.start()
+        return self
+
+    def __exit__(self, *exc):
+        for server in self.servers.values():
+            server.stop()
+
+    def router_rows(self):
+        """Keyword arguments for Router(...) rows pointing at the simulators"""
+        return [{
+            'name': f'Simulated {brand}',
+            'brand': brand,
+            'model': 'simulator',
+            'ip_address': '127.0.0.1',
+            'api_port': server.port,
+            'username': self.username,
+            'password': self.password,
+            'is_active': True
+        } for brand, server in self.servers.items()]
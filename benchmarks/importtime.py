@@ -0,0 +1,83 @@
+"""
+Import-Time Budget
+Imports a module in a fresh interpreter with `python -X importtime` and fails
+if startup exceeds the budget or pulls in dependencies that should load lazily.
+
+Usage:
+    python -m benchmarks.importtime                    # checks `import wsgi`
+    python -m benchmarks.importtime --module app --budget-ms 600 --top 15
+
+The same check runs under pytest in tests/test_import_time.py.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only needed once a router, QR code or exporter is actually used (numpy:
+# once the monitor sweeps its session table)
+LAZY_MODULES = ('paramiko', 'requests', 'qrcode', 'PIL', 'librouteros', 'numpy')
+
+# Building the app must not touch the database or start threads
+APP_ENV = {
+    'AUTO_INIT_DB': 'false',
+    'NETWORK_MONITOR_ENABLED': 'false',
+    'DATABASE_URL': 'sqlite://'
+}
+
+def default_budget_ms():
+    return float(os.environ.get('IMPORT_BUDGET_MS') or 1000)
+
+def measure_import(module, env=None):
+    """Import `module` in a subprocess; returns {module: (self_us, cumulative_us)}"""
+    environment = dict(os.environ, **(env or {}))
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT_DIR, env=environment, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+def eager_imports(timings):
+    """Modules from LAZY_MODULES (or their submodules) that were imported"""
+    return sorted(name for name in timings
+                  if any(name == lazy or name.startswith(lazy + '.') for lazy in LAZY_MODULES))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check application import time')
+    parser.add_argument('--module', default='wsgi')
+    parser.add_argument('--budget-ms', type=float, default=default_budget_ms())
+    parser.add_argument('--top', type=int, default=10, help='show the N slowest imports')
+    args = parser.parse_args(argv)
+
+    timings = measure_import(args.module, APP_ENV)
+    total_ms = timings.get(args.module, (0, 0))[1] / 1000.0
+
+    print(f"import {args.module}: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    for name, (self_us, cumulative_us) in sorted(timings.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"  {self_us / 1000.0:8.1f} ms self {cumulative_us / 1000.0:9.1f} ms cumulative  {name}")
+
+    failures = []
+    eager = eager_imports(timings)
+    if eager:
+        failures.append(f"imported eagerly: {', '.join(eager[:10])}")
+    if total_ms > args.budget_ms:
+        failures.append(f"{total_ms:.1f} ms exceeds the {args.budget_ms:.0f} ms budget")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,281 @@
+"""
+Captive Portal Load Test
+Simulates a redemption storm (a stadium or event where thousands of guests
+redeem vouchers within a minute) against a running app, and reports latency
+percentiles, error rates and duplicate redemptions.
+
+Usage:
+    python -m benchmarks.loadtest                          # in-process app + simulated routers
+    python -m benchmarks.loadtest --guests 5000 --window 60 --concurrency 200
+    python -m benchmarks.loadtest --url http://10.0.0.5:5000 --username admin --password admin123
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEED_BATCH_SIZE = 1000  # Upper bound of POST /api/vouchers/batch
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+class LoadStats:
+    """Thread-safe latency and outcome collection per operation"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.exceptions = Counter()
+        self.granted = Counter()  # code -> successful redemptions/activations
+
+    def record(self, operation, seconds, status):
+        with self.lock:
+            self.latencies[operation].append(seconds)
+            self.statuses[operation][status] += 1
+
+    def record_exception(self, operation, error):
+        with self.lock:
+            self.statuses[operation]['exception'] += 1
+            self.exceptions[type(error).__name__] += 1
+
+    def record_grant(self, code):
+        with self.lock:
+            self.granted[code] += 1
+
+    def summary(self, elapsed):
+        operations = {}
+        for operation, statuses in self.statuses.items():
+            latencies = self.latencies[operation]
+            total = sum(statuses.values())
+            errors = sum(count for status, count in statuses.items()
+                         if status == 'exception' or int(status) >= 500)
+            rejected = sum(count for status, count in statuses.items()
+                           if status != 'exception' and 400 <= int(status) < 500)
+            operations[operation] = {
+                'requests': total,
+                'p50_ms': _ms(percentile(latencies, 50)),
+                'p95_ms': _ms(percentile(latencies, 95)),
+                'p99_ms': _ms(percentile(latencies, 99)),
+                'max_ms': _ms(max(latencies) if latencies else None),
+                'error_rate': errors / total if total else 0.0,
+                'rejected_rate': rejected / total if total else 0.0,
+                'statuses': {str(k): v for k, v in statuses.items()}
+            }
+        duplicates = {code: count for code, count in self.granted.items() if count > 1}
+        return {
+            'elapsed_seconds': elapsed,
+            'requests_per_second': sum(s['requests'] for s in operations.values()) / elapsed if elapsed else None,
+            'operations': operations,
+            'exceptions': dict(self.exceptions),
+            'codes_granted': len(self.granted),
+            'duplicate_redemptions': sum(count - 1 for count in duplicates.values()),
+            'duplicate_codes': sorted(duplicates)[:20]
+        }
+
+def _ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+class LoadTest:
+    """Seed vouchers on a running app and replay a captive-portal storm"""
+
+    def __init__(self, base_url, username, password, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.headers = {}
+        self.stats = LoadStats()
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        # One keep-alive connection pool per worker thread, like real browsers
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def login(self):
+        response = requests.post(f"{self.base_url}/api/auth/login", json={
+            'username': self.username, 'password': self.password
+        }, timeout=self.timeout)
+        response.raise_for_status()
+        self.headers = {'Authorization': f"Bearer {response.json()['token']}"}
+
+    def register_routers(self, simulator):
+        """Add the simulated routers to the target app"""
+        for row in simulator.router_rows():
+            requests.post(f"{self.base_url}/api/control/routers", json=row,
+                          headers=self.headers, timeout=self.timeout).raise_for_status()
+
+    def seed_vouchers(self, count, duration_hours=2):
+        """Create `count` fresh vouchers through the API; returns their codes"""
+        codes = []
+        while len(codes) < count:
+            batch = min(SEED_BATCH_SIZE, count - len(codes))
+            response = requests.post(f"{self.base_url}/api/vouchers/batch", json={
+                'count': batch, 'duration_hours': duration_hours, 'data_limit_mb': 1024
+            }, headers=self.headers, timeout=max(self.timeout, 120))
+            response.raise_for_status()
+            codes.extend(voucher['code'] for voucher in response.json()['vouchers'])
+        return codes
+
+    def _call(self, operation, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            self.stats.record_exception(operation, e)
+            return None
+        self.stats.record(operation, time.perf_counter() - start, response.status_code)
+        return response
+
+    def guest(self, index, code, activate, polls, poll_interval):
+        """One guest: open the portal, redeem or activate, then poll usage"""
+        self._call('captive_page', 'GET', f"/captive?code={code}")
+
+        if activate:
+            response = self._call('activate', 'POST', f"/api/control/vouchers/{code}/activate", json={
+                'client_mac': f"02:{(index >> 24) & 0xff:02x}:{(index >> 16) & 0xff:02x}:"
+                              f"{(index >> 8) & 0xff:02x}:{index & 0xff:02x}:01",
+                'client_ip': f"10.{(index >> 16) & 0xff}.{(index >> 8) & 0xff}.{index & 0xff}"
+            })
+        else:
+            response = self._call('redeem', 'POST', '/api/voucher/redeem', json={'code': code})
+
+        if response is None or response.status_code != 200:
+            return
+        self.stats.record_grant(code)
+
+        for _ in range(polls):
+            time.sleep(poll_interval)
+            self._call('usage_poll', 'GET', f"/api/control/vouchers/{code}/usage")
+
+    def run(self, codes, guests, window, concurrency, activate_ratio, duplicate_ratio, polls, poll_interval):
+        """Fire `guests` arrivals spread uniformly over `window` seconds"""
+        plan = []
+        for index in range(guests):
+            if plan and random.random() < duplicate_ratio:
+                # Same code submitted again (double taps, shared screenshots)
+                code = random.choice(plan)[1]
+            else:
+                code = codes[index % len(codes)]
+            plan.append((index, code, random.random() < activate_ratio))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = []
+            for index, code, activate in plan:
+                delay = start + window * index / max(guests, 1) - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                futures.append(pool.submit(self.guest, index, code, activate, polls, poll_interval))
+            for future in futures:
+                future.result()
+        return self.stats.summary(time.perf_counter() - start)
+
+def start_local_app(port=0):
+    """Serve a fresh app on a scratch SQLite database in a background thread"""
+    workdir = tempfile.mkdtemp(prefix='wnm-load-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'load.db')}"
+    os.environ['NETWORK_MONITOR_ENABLED'] = 'false'
+    os.environ['UNIFI_SCHEME'] = 'http'
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    server = make_server('127.0.0.1', port, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def print_report(report):
+    print(f"\nElapsed {report['elapsed_seconds']:.1f}s, {report['requests_per_second']:.1f} req/s")
+    print(f"{'operation':<14}{'requests':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}{'4xx':>8}")
+    for operation, stats in sorted(report['operations'].items()):
+        print(f"{operation:<14}{stats['requests']:>9}{stats['p50_ms'] or 0:>10.1f}{stats['p95_ms'] or 0:>10.1f}"
+              f"{stats['p99_ms'] or 0:>10.1f}{stats['error_rate']:>9.1%}{stats['rejected_rate']:>8.1%}")
+    if report['exceptions']:
+        print(f"Exceptions: {report['exceptions']}")
+    print(f"Codes granted: {report['codes_granted']}, duplicate redemptions: {report['duplicate_redemptions']}")
+    if report['duplicate_codes']:
+        print(f"  e.g. {', '.join(report['duplicate_codes'])}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Captive portal redemption storm')
+    parser.add_argument('--url', help='base URL of a running app (default: start one in-process)')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin123')
+    parser.add_argument('--guests', type=int, default=2000)
+    parser.add_argument('--window', type=float, default=60.0, help='seconds over which guests arrive')
+    parser.add_argument('--concurrency', type=int, default=100, help='concurrent client threads')
+    parser.add_argument('--activate-ratio', type=float, default=0.5,
+                        help='share of guests using /activate instead of /redeem')
+    parser.add_argument('--duplicate-ratio', type=float, default=0.05,
+                        help='share of guests re-submitting an already used code')
+    parser.add_argument('--polls', type=int, default=3, help='usage polls per guest')
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    parser.add_argument('--routers', action='store_true',
+                        help='start local router simulators and register them with the app')
+    parser.add_argument('--router-latency-ms', type=float, default=20.0)
+    parser.add_argument('--router-failure-rate', type=float, default=0.0)
+    parser.add_argument('--output', help='write the report as JSON to this path')
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.url:
+        base_url = args.url
+    else:
+        server, base_url = start_local_app()
+        args.routers = True
+
+    simulator = None
+    if args.routers:
+        from benchmarks.fake_routers import RouterSimulator
+        simulator = RouterSimulator(args.router_latency_ms, failure_rate=args.router_failure_rate).__enter__()
+
+    try:
+        load = LoadTest(base_url, args.username, args.password)
+        load.login()
+        if simulator:
+            load.register_routers(simulator)
+
+        unique_guests = max(1, int(args.guests * (1 - args.duplicate_ratio)))
+        print(f"Seeding {unique_guests} vouchers on {base_url}...")
+        codes = load.seed_vouchers(unique_guests)
+
+        print(f"Running {args.guests} guests over {args.window:.0f}s with {args.concurrency} workers...")
+        report = load.run(codes, args.guests, args.window, args.concurrency, args.activate_ratio,
+                          args.duplicate_ratio, args.polls, args.poll_interval)
+    finally:
+        if simulator:
+            simulator.__exit__(None, None, None)
+        if server:
+            server.shutdown()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    return 1 if report['duplicate_redemptions'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""
+RADIUS Test Client
+Minimal RADIUS client for exercising the built-in server locally: single
+logins (PAP or CHAP), accounting updates and concurrent load runs.
+
+    python -m benchmarks.radius_client --secret s3cret --code ABCD2345
+    python -m benchmarks.radius_client --secret s3cret --code ABCD2345 --count 5000 --concurrency 50
+    python -m benchmarks.radius_client --secret s3cret --code ABCD2345 --accounting --count 20000 --concurrency 20
+"""
+
+import argparse
+import hashlib
+import os
+import socket
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.radius import packet as rad
+from utils.radius.accounting import INTERIM_UPDATE, ACCT_TERMINATE_CAUSE
+
+RESULT_NAMES = {rad.ACCESS_ACCEPT: 'accept', rad.ACCESS_REJECT: 'reject'}
+
+class RadiusClient:
+    """Blocking RADIUS client with retransmission"""
+
+    def __init__(self, host='127.0.0.1', port=1812, secret='testing123', timeout=2.0, retries=2):
+        self.address = (host, port)
+        self.secret = secret.encode('utf-8') if isinstance(secret, str) else secret
+        self.timeout = timeout
+        self.retries = retries
+        self._identifier = 0
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.settimeout(timeout)
+
+    def close(self):
+        self._sock.close()
+
+    def _next_identifier(self):
+        self._identifier = (self._identifier + 1) % 256
+        return self._identifier
+
+    def access_request(self, username, password=None, mac=None, chap=False, message_authenticator=True):
+        """Build a signed Access-Request packet and return (packet, wire bytes)"""
+        request = rad.Packet(rad.ACCESS_REQUEST, self._next_identifier(), os.urandom(16))
+        request.add(rad.USER_NAME, username)
+        if password is not None:
+            if chap:
+                ident = os.urandom(1)
+                challenge = os.urandom(16)
+                request.add(rad.CHAP_PASSWORD, ident + hashlib.md5(ident + password.encode('utf-8') + challenge).digest())
+                request.add(rad.CHAP_CHALLENGE, challenge)
+            else:
+                request.add(rad.USER_PASSWORD, rad.encrypt_password(password, self.secret, request.authenticator))
+        if mac:
+            request.add(rad.CALLING_STATION_ID, mac)
+        request.add(rad.NAS_IDENTIFIER, 'benchmark-client')
+
+        return request, request.encode_access_request(self.secret, message_authenticator)
+
+    def send(self, request, data):
+        """Send with retransmission; returns the verified response packet"""
+        for attempt in range(self.retries + 1):
+            self._sock.sendto(data, self.address)
+            try:
+                while True:
+                    response_data, _ = self._sock.recvfrom(rad.MAX_PACKET_SIZE)
+                    response = rad.Packet.decode(response_data)
+                    if response.identifier != request.identifier:
+                        continue  # Late answer to an earlier request
+                    if not rad.verify_response(response_data, request.authenticator, self.secret):
+                        raise rad.PacketError('Response authenticator mismatch')
+                    return response
+            except socket.timeout:
+                continue
+        raise TimeoutError(f"No RADIUS response from {self.address[0]}:{self.address[1]}")
+
+    def authenticate(self, username, password=None, mac=None, chap=False):
+        """Access-Request for a voucher; returns the Access-Accept/Reject packet"""
+        if password is None:
+            password = username
+        request, data = self.access_request(username, password, mac, chap)
+        return self.send(request, data)
+
+    def account(self, status, session_id, username, input_octets=0, output_octets=0,
+                session_time=0, mac=None, voucher_class=None, terminate_cause=None):
+        """Send an Accounting-Request; returns the verified Accounting-Response"""
+        request = rad.Packet(rad.ACCOUNTING_REQUEST, self._next_identifier())
+        request.add(rad.ACCT_STATUS_TYPE, status)
+        request.add(rad.ACCT_SESSION_ID, session_id)
+        request.add(rad.USER_NAME, username)
+        request.add(rad.ACCT_INPUT_OCTETS, input_octets & 0xFFFFFFFF)
+        request.add(rad.ACCT_OUTPUT_OCTETS, output_octets & 0xFFFFFFFF)
+        if input_octets >> 32:
+            request.add(rad.ACCT_INPUT_GIGAWORDS, input_octets >> 32)
+        if output_octets >> 32:
+            request.add(rad.ACCT_OUTPUT_GIGAWORDS, output_octets >> 32)
+        request.add(rad.ACCT_SESSION_TIME, session_time)
+        if mac:
+            request.add(rad.CALLING_STATION_ID, mac)
+        if voucher_class:
+            request.add(rad.CLASS, voucher_class)
+        if terminate_cause is not None:
+            request.add(ACCT_TERMINATE_CAUSE, terminate_cause)
+        data = request.encode_request(self.secret)
+        request.authenticator = data[4:20]
+        return self.send(request, data)
+
+def describe(response):
+    """Readable summary of a reply's attributes"""
+    names = {
+        rad.SESSION_TIMEOUT: 'Session-Timeout',
+        rad.CLASS: 'Class',
+        rad.REPLY_MESSAGE: 'Reply-Message',
+        rad.ACCT_INTERIM_INTERVAL: 'Acct-Interim-Interval',
+        rad.MIKROTIK_RATE_LIMIT: 'Mikrotik-Rate-Limit',
+        rad.MIKROTIK_TOTAL_LIMIT: 'Mikrotik-Total-Limit',
+        rad.MIKROTIK_TOTAL_LIMIT_GIGAWORDS: 'Mikrotik-Total-Limit-Gigawords',
+        rad.WISPR_BANDWIDTH_MAX_UP: 'WISPr-Bandwidth-Max-Up',
+        rad.WISPR_BANDWIDTH_MAX_DOWN: 'WISPr-Bandwidth-Max-Down',
+    }
+    text = {rad.CLASS, rad.REPLY_MESSAGE, rad.MIKROTIK_RATE_LIMIT}
+    lines = [RESULT_NAMES.get(response.code, f"code {response.code}")]
+    for key, value in response.attributes:
+        if key == rad.MESSAGE_AUTHENTICATOR:
+            continue
+        shown = value.decode('utf-8', 'replace') if key in text else int.from_bytes(value, 'big')
+        lines.append(f"  {names.get(key, key)} = {shown}")
+    return '\n'.join(lines)
+
+def run_load(args):
+    """Authenticate (or account for) the same code from many clients and report latency"""
+    latencies = []
+    results = {}
+
+    def worker(count):
+        client = RadiusClient(args.host, args.port, args.secret, args.timeout)
+        session_id = os.urandom(4).hex()
+        try:
+            for i in range(count):
+                start = time.perf_counter()
+                try:
+                    if args.accounting:
+                        # One session per worker with counters growing 64 KiB per update
+                        client.account(INTERIM_UPDATE, session_id, args.code, i * 65536, i * 8192, i, args.mac)
+                        name = 'ok'
+                    else:
+                        name = RESULT_NAMES.get(client.authenticate(args.code, args.password, args.mac, args.chap).code, 'other')
+                except (TimeoutError, rad.PacketError):
+                    name = 'error'
+                latencies.append(time.perf_counter() - start)
+                results[name] = results.get(name, 0) + 1
+        finally:
+            client.close()
+
+    per_worker = [args.count // args.concurrency + (1 if i < args.count % args.concurrency else 0)
+                  for i in range(args.concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(worker, per_worker))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0
+    print(f"{args.count} requests in {elapsed:.2f}s ({args.count / elapsed:.0f}/s): {results}")
+    print(f"latency ms p50={pct(0.5):.2f} p95={pct(0.95):.2f} p99={pct(0.99):.2f} "
+          f"mean={statistics.mean(latencies) * 1000 if latencies else 0:.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description='RADIUS test client for the built-in server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=None, help='Defaults to 1812 (1813 with --accounting)')
+    parser.add_argument('--secret', required=True, help="The router's radius_secret")
+    parser.add_argument('--code', required=True, help='Voucher code (User-Name)')
+    parser.add_argument('--password', default=None, help='Defaults to the voucher code')
+    parser.add_argument('--mac', default=None, help='Calling-Station-Id')
+    parser.add_argument('--chap', action='store_true', help='Use CHAP instead of PAP')
+    parser.add_argument('--timeout', type=float, default=2.0)
+    parser.add_argument('--count', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--accounting', action='store_true', help='Send Interim-Updates instead of logins')
+    args = parser.parse_args()
+    if args.port is None:
+        args.port = 1813 if args.accounting else 1812
+
+    if args.count == 1 and not args.accounting:
+        client = RadiusClient(args.host, args.port, args.secret, args.timeout)
+        try:
+            print(describe(client.authenticate(args.code, args.password, args.mac, args.chap)))
+        finally:
+            client.close()
+    else:
+        run_load(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,351 @@
+"""
+Benchmark Runner
+Times the hot paths of the application against a throwaway SQLite database
+and the local router simulators, and records results per commit so
+regressions can be compared across revisions.
+
+Usage:
+    python -m benchmarks.run                       # all benchmarks, 1k/10k/100k vouchers
+    python -m benchmarks.run --sizes 1000 --only redeem,dashboard_stats
+    python -m benchmarks.run --latency-ms 20 --failure-rate 0.05
+    python -m benchmarks.run --compare benchmarks/results/<sha>.json
+"""
+
+import argparse
+import json
+import os
+import secrets
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _configure_environment(db_path):
+    """Point the app at a scratch database before config is imported"""
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['NETWORK_MONITOR_ENABLED'] = 'false'
+    os.environ['UNIFI_SCHEME'] = 'http'
+    os.environ.setdefault('QUERY_AUDIT_ENABLED', 'false')
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, text=True
+        ).strip()
+    except Exception:
+        return 'unknown'
+
+class BenchmarkResult:
+    """Timings of one benchmark at one dataset size"""
+
+    def __init__(self, name, size, timings, operations=1, extra=None):
+        self.name = name
+        self.size = size
+        self.timings = timings
+        self.operations = operations
+        self.extra = extra or {}
+
+    @property
+    def key(self):
+        return f"{self.name}@{self.size}"
+
+    def to_dict(self):
+        median = statistics.median(self.timings)
+        return {
+            'name': self.name,
+            'size': self.size,
+            'rounds': len(self.timings),
+            'min': min(self.timings),
+            'median': median,
+            'mean': statistics.mean(self.timings),
+            'ops_per_second': self.operations / median if median else None,
+            **self.extra
+        }
+
+def measure(func, rounds, setup=None):
+    """Run `func` `rounds` times; `setup` runs untimed before each round"""
+    timings = []
+    for _ in range(rounds):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        func(state) if setup else func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+class BenchmarkSuite:
+    """Seeded application plus the benchmarks that run against it"""
+
+    def __init__(self, app, simulator, rounds=5):
+        self.app = app
+        self.simulator = simulator
+        self.rounds = rounds
+        self.client = app.test_client()
+        self.headers = {}
+        self.batch_id = None
+
+    # -- setup -------------------------------------------------------------
+
+    def setup(self, size):
+        """Reset the database and seed `size` vouchers plus simulated routers"""
+        from database import db
+        from models.router import Router
+        from models.user import User
+        from models.voucher import Voucher
+        from models.voucher_plan import VoucherPlan
+        from werkzeug.security import generate_password_hash
+        from config import Config
+        import jwt
+
+        with self.app.app_context():
+            db.drop_all()
+            db.create_all()
+
+            admin = User()
+            admin.username = 'bench'
+            admin.email = 'bench@wifi-manager.local'
+            admin.password_hash = generate_password_hash('bench')
+            admin.role = 'admin'
+            admin.is_active = True
+            db.session.add(admin)
+
+            for row in self.simulator.router_rows():
+                db.session.add(Router(**row))
+            db.session.commit()
+
+            token = jwt.encode({
+                'user_id': admin.id,
+                'username': admin.username,
+                'role': admin.role,
+                'exp': datetime.utcnow() + timedelta(hours=1)
+            }, Config.JWT_SECRET_KEY, algorithm='HS256')
+            self.headers = {'Authorization': f'Bearer {token}'}
+
+            # Core inserts: seeding is not what is being measured
+            now = datetime.utcnow()
+            self.batch_id = 'BENCH_PRINT'
+            plans = [VoucherPlan.get_or_create(
+                duration_hours=24,
+                data_limit_mb=1024 if i % 3 else None,
+                speed_limit_kbps=256 if i % 2 else None,
+                voucher_type=('standard', 'premium', 'unlimited')[i % 3],
+                price=(1.0, 2.5, 5.0)[i % 3]
+            ) for i in range(6)]
+            db.session.flush()
+            rows = []
+            for i in range(size):
+                code = f"B{i:09d}"
+                used = i % 4 == 0
+                rows.append({
+                    'code': code,
+                    'batch_id': self.batch_id if i < 100 else f"BENCH_{i // 1000}",
+                    'status': 'used' if used else 'active',
+                    'plan_id': plans[i % 6].id,
+                    'created_at': now - timedelta(minutes=i % 10080),
+                    'expires_at': now + timedelta(days=30),
+                    'used_at': now - timedelta(minutes=i % 600) if used else None,
+                    'session_start': now - timedelta(minutes=i % 600) if used else None,
+                    'session_end': now + timedelta(hours=1) if used else None,
+                    'session_token': secrets.token_urlsafe(16) if used else None,
+                    'client_ip': f"10.0.{(i // 250) % 250}.{i % 250 + 1}" if used else None,
+                    'data_used_mb': 0.0,
+                    'created_by': admin.id
+                })
+                if len(rows) == 5000:
+                    db.session.execute(Voucher.__table__.insert(), rows)
+                    rows = []
+            if rows:
+                db.session.execute(Voucher.__table__.insert(), rows)
+            db.session.commit()
+
+            from utils.analytics import rebuild_sales_summaries
+            rebuild_sales_summaries()
+
+    def _unused_codes(self, count):
+        from models.voucher import Voucher
+
+        with self.app.app_context():
+            return [code for (code,) in Voucher.query.with_entities(Voucher.code)
+                    .filter_by(status='active').limit(count).all()]
+
+    # -- benchmarks --------------------------------------------------------
+
+    def bench_batch_create(self, size):
+        payload = {'count': 100, 'duration_hours': 24, 'data_limit_mb': 500}
+        timings = measure(
+            lambda: self.client.post('/api/vouchers/batch', json=payload, headers=self.headers),
+            self.rounds)
+        return BenchmarkResult('batch_create', size, timings, operations=100)
+
+    def bench_redeem(self, size):
+        per_round = 50
+        codes = iter(self._unused_codes(per_round * self.rounds))
+
+        def redeem_round():
+            for _ in range(per_round):
+                self.client.post('/api/voucher/redeem', json={'code': next(codes)})
+
+        return BenchmarkResult('redeem', size, measure(redeem_round, self.rounds), operations=per_round)
+
+    def bench_list_pagination(self, size):
+        last_page = max(1, size // 50)
+
+        def paginate():
+            self.client.get('/api/vouchers/?page=1&per_page=50', headers=self.headers)
+            self.client.get(f'/api/vouchers/?page={last_page}&per_page=50', headers=self.headers)
+            self.client.get('/api/vouchers/?status=used&page=2&per_page=50', headers=self.headers)
+
+        return BenchmarkResult('list_pagination', size, measure(paginate, self.rounds), operations=3)
+
+    def bench_dashboard_stats(self, size):
+        timings = measure(
+            lambda: self.client.get('/api/stats/dashboard', headers=self.headers), self.rounds)
+        return BenchmarkResult('dashboard_stats', size, timings)
+
+    def bench_qr_batch(self, size):
+        timings = measure(
+            lambda: self.client.get(f'/api/vouchers/batch/{self.batch_id}/print', headers=self.headers),
+            self.rounds)
+        return BenchmarkResult('qr_batch_print', size, timings, operations=min(size, 100))
+
+    def bench_export(self, size):
+        from models.voucher import Voucher
+        from utils.network_manager import VoucherManager
+
+        def export():
+            with self.app.app_context():
+                vouchers = Voucher.query.all()
+                VoucherManager.export_vouchers(vouchers, 'csv')
+
+        return BenchmarkResult('export_csv', size, measure(export, self.rounds), operations=size)
+
+    def bench_monitor_cycle(self, size):
+        from utils.network_manager import NetworkMonitor
+
+        monitor = NetworkMonitor(self.app)
+        timings = measure(monitor.run_cycle, self.rounds)
+        return BenchmarkResult('monitor_cycle', size, timings, extra={
+            'sessions': len(monitor.active_sessions),
+            'session_table_kb': round(monitor.active_sessions.nbytes / 1024, 1)
+        })
+
+    def bench_router_activation(self, size):
+        per_round = 10
+        codes = iter(self._unused_codes(per_round * self.rounds))
+        calls_before = {brand: server.behavior.calls for brand, server in self.simulator.servers.items()}
+
+        def activate_round():
+            for i in range(per_round):
+                self.client.post(f'/api/control/vouchers/{next(codes)}/activate', json={
+                    'client_mac': f"02:00:00:00:{i // 256:02x}:{i % 256:02x}",
+                    'client_ip': f"10.9.0.{i + 1}"
+                })
+
+        timings = measure(activate_round, self.rounds)
+        router_calls = {brand: server.behavior.calls - calls_before[brand]
+                        for brand, server in self.simulator.servers.items()}
+        return BenchmarkResult('router_activation', size, timings, operations=per_round,
+                               extra={'router_calls': router_calls})
+
+    BENCHMARKS = {
+        'batch_create': bench_batch_create,
+        'redeem': bench_redeem,
+        'list_pagination': bench_list_pagination,
+        'dashboard_stats': bench_dashboard_stats,
+        'qr_batch_print': bench_qr_batch,
+        'export_csv': bench_export,
+        'monitor_cycle': bench_monitor_cycle,
+        'router_activation': bench_router_activation,
+    }
+
+    def run(self, sizes, only=None):
+        results = []
+        for size in sizes:
+            print(f"Seeding {size} vouchers...")
+            self.setup(size)
+            for name, bench in self.BENCHMARKS.items():
+                if only and name not in only:
+                    continue
+                result = bench(self, size)
+                summary = result.to_dict()
+                print(f"  {result.key:<32} median {summary['median'] * 1000:9.2f} ms"
+                      f"  min {summary['min'] * 1000:9.2f} ms")
+                results.append(result)
+        return results
+
+def compare(current, baseline_path, threshold):
+    """Print benchmarks whose median regressed by more than `threshold`"""
+    with open(baseline_path) as f:
+        baseline = {f"{r['name']}@{r['size']}": r for r in json.load(f)['results']}
+
+    regressions = []
+    for result in current:
+        previous = baseline.get(f"{result['name']}@{result['size']}")
+        if not previous or not previous['median']:
+            continue
+        ratio = result['median'] / previous['median']
+        marker = 'REGRESSION' if ratio > 1 + threshold else ''
+        print(f"  {result['name']}@{result['size']:<10} {previous['median'] * 1000:9.2f} ms"
+              f" -> {result['median'] * 1000:9.2f} ms ({ratio:5.2f}x) {marker}")
+        if marker:
+            regressions.append(result)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run WiFi Network Manager benchmarks')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='comma-separated voucher counts')
+    parser.add_argument('--only', help='comma-separated benchmark names')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='simulated router latency')
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='simulated router failure rate')
+    parser.add_argument('--compare', help='baseline results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='regression threshold (0.2 = 20%%)')
+    parser.add_argument('--no-save', action='store_true', help='do not write results JSON')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='wnm-bench-')
+    _configure_environment(os.path.join(workdir, 'bench.db'))
+
+    from app import create_app
+    from benchmarks.fake_routers import RouterSimulator
+
+    app = create_app()
+    sizes = [int(size) for size in args.sizes.split(',')]
+    only = set(args.only.split(',')) if args.only else None
+
+    with RouterSimulator(args.latency_ms, args.jitter_ms, args.failure_rate) as simulator:
+        results = BenchmarkSuite(app, simulator, args.rounds).run(sizes, only)
+
+    summaries = [result.to_dict() for result in results]
+    revision = git_revision()
+    report = {
+        'revision': revision,
+        'created_at': datetime.utcnow().isoformat(),
+        'python': sys.version.split()[0],
+        'router_latency_ms': args.latency_ms,
+        'router_failure_rate': args.failure_rate,
+        'results': summaries
+    }
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f'{revision}.json')
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {path}")
+
+    if args.compare:
+        print(f"Comparing against {args.compare}:")
+        if compare(summaries, args.compare, args.threshold):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""
+CLI Commands
+One-time setup and background services, run once per deployment instead of
+inside every web worker:
+
+    flask --app wsgi init-db
+    flask --app wsgi seed-admin
+    flask --app wsgi monitor
+    flask --app wsgi radius
+    flask --app wsgi reconcile --dry-run
+    flask --app wsgi archive-vouchers --dry-run
+    flask --app wsgi migrate-voucher-plans
+    flask --app wsgi rebuild-sales-summaries
+    flask --app wsgi db upgrade      (Flask-Migrate)
+"""
+
+import click
+
+def register_commands(app):
+    """Attach the management commands to the app's CLI"""
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create database tables and backfill the sales summaries"""
+        from database import init_db
+        init_db()
+
+    @app.cli.command('seed-admin')
+    @click.option('--username', default=None, help='Admin username (default: ADMIN_USERNAME)')
+    @click.option('--password', default=None, help='Admin password (default: ADMIN_PASSWORD)')
+    @click.option('--email', default=None, help='Admin email (default: ADMIN_EMAIL)')
+    def seed_admin_command(username, password, email):
+        """Create the default admin user if missing"""
+        from database import seed_admin_user
+        seed_admin_user(
+            username or app.config['ADMIN_USERNAME'],
+            password or app.config['ADMIN_PASSWORD'],
+            email or app.config['ADMIN_EMAIL']
+        )
+
+    @app.cli.command('monitor')
+    def monitor_command():
+        """Run the network monitor in the foreground"""
+        from utils.network_manager import NetworkMonitor
+        print("Network monitoring started")
+        try:
+            NetworkMonitor(app).run_forever()
+        except KeyboardInterrupt:
+            print("Network monitoring stopped")
+    
+    @app.cli.command('radius')
+    def radius_command():
+        """Run the RADIUS server in the foreground"""
+        from utils.radius import RadiusServer
+        try:
+            RadiusServer(app).run_forever()
+        except KeyboardInterrupt:
+            print("RADIUS server stopped")
+    
+    @app.cli.command('reconcile')
+    @click.option('--dry-run', is_flag=True, help='Report differences without changing routers')
+    @click.option('--router-id', 'router_ids', type=int, multiple=True, help='Limit to these routers')
+    def reconcile_command(dry_run, router_ids):
+        """Bring router user lists in line with the database"""
+        from utils.reconcile import reconcile_routers
+        result = reconcile_routers(list(router_ids) or None, dry_run=dry_run)
+        for report in result['routers']:
+            if 'error' in report:
+                print(f"{report['name']} ({report['brand']}): error: {report['error']}")
+                continue
+            line = (f"{report['name']} ({report['brand']}): {report['router_users']} users, "
+                    f"{report['missing']} missing, {report['extra']} extra")
+            if not dry_run and 'added' in report:
+                line += f" -> added {report['added']}, removed {report['removed']}, failed {report['failed']}"
+            print(line)
+        print(f"{'Dry run' if dry_run else 'Reconciled'} in {result['seconds']}s")
+    
+    @app.cli.command('rebuild-sales-summaries')
+    def rebuild_sales_summaries_command():
+        """Recompute the daily sales summaries from the vouchers"""
+        from utils.analytics import rebuild_sales_summaries
+        print(f"Sales summaries rebuilt: {rebuild_sales_summaries()} rows")
+    
+    @app.cli.command('archive-vouchers')
+    @click.option('--days', type=int, default=None, help='Age in days (default: VOUCHER_ARCHIVE_AFTER_DAYS)')
+    @click.option('--chunk-size', type=int, default=None, help='Vouchers moved per transaction')
+    @click.option('--dry-run', is_flag=True, help='Only count the vouchers that would be archived')
+    def archive_vouchers_command(days, chunk_size, dry_run):
+        """Move old expired vouchers to the archive table"""
+        from utils.archive import archive_vouchers
+        result = archive_vouchers(days, chunk_size, dry_run=dry_run)
+        if dry_run:
+            print(f"{result['eligible']} vouchers created before {result['cutoff']} would be archived")
+        else:
+            print(f"Archived {result['archived']} vouchers in {result['chunks']} chunks ({result['seconds']}s)")
+    
+    @app.cli.command('migrate-voucher-plans')
+    @click.option('--chunk-size', type=int, default=5000, help='Vouchers backfilled per transaction')
+    @click.option('--drop-columns', is_flag=True, help='Drop the per-voucher columns once every row has a plan')
+    def migrate_voucher_plans_command(chunk_size, drop_columns):
+        """Move shared voucher settings into voucher plans"""
+        from utils.voucher_plans import migrate_voucher_plans
+        report = migrate_voucher_plans(chunk_size, drop_columns, app.config.get('VOUCHER_QR_BASE_URL'))
+        for table_name in ('vouchers', 'vouchers_archive'):
+            entry = report.get(table_name)
+            if entry is None:
+                continue
+            line = f"{table_name}: {entry['backfilled']} rows backfilled"
+            if 'dropped' in entry:
+                line += f", dropped {', '.join(entry['dropped']) or 'nothing'}"
+            if 'error' in entry:
+                line += f" ({entry['error']})"
+            print(line)
+        print(f"{report['plans']} voucher plans")
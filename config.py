@@ -14,6 +14,56 @@ class Config:
     
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Connection pool sizing for the primary (ignored for SQLite)
+    SQLALCHEMY_POOL_SIZE = int(os.environ.get('SQLALCHEMY_POOL_SIZE') or 10)
+    SQLALCHEMY_MAX_OVERFLOW = int(os.environ.get('SQLALCHEMY_MAX_OVERFLOW') or 10)
+    SQLALCHEMY_POOL_TIMEOUT = int(os.environ.get('SQLALCHEMY_POOL_TIMEOUT') or 20)
+    SQLALCHEMY_POOL_RECYCLE = int(os.environ.get('SQLALCHEMY_POOL_RECYCLE') or 3600)
+    
+    # Read replica (PostgreSQL streaming standby): dashboards, listings and
+    # reports read from it with their own pool; reads fall back to the primary
+    # while its lag exceeds REPLICA_MAX_LAG_SECONDS or it is unreachable
+    DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+    REPLICA_POOL_SIZE = int(os.environ.get('REPLICA_POOL_SIZE') or 5)
+    REPLICA_MAX_OVERFLOW = int(os.environ.get('REPLICA_MAX_OVERFLOW') or 10)
+    REPLICA_POOL_TIMEOUT = int(os.environ.get('REPLICA_POOL_TIMEOUT') or 10)
+    REPLICA_POOL_RECYCLE = int(os.environ.get('REPLICA_POOL_RECYCLE') or 3600)
+    REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS') or 5)
+    REPLICA_LAG_CHECK_SECONDS = float(os.environ.get('REPLICA_LAG_CHECK_SECONDS') or 2)
+    
+    # SQLite profile (file databases only): WAL, busy timeout and cache pragmas,
+    # with commits serialized through one writer thread per process
+    SQLITE_PRODUCTION_MODE = os.environ.get('SQLITE_PRODUCTION_MODE', 'true').lower() == 'true'
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS') or 5000)
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL'  # NORMAL is durable at checkpoints in WAL mode
+    SQLITE_CACHE_SIZE_KIB = int(os.environ.get('SQLITE_CACHE_SIZE_KIB') or 65536)
+    SQLITE_MMAP_SIZE_MB = int(os.environ.get('SQLITE_MMAP_SIZE_MB') or 256)
+    SQLITE_WRITE_BATCH_SIZE = int(os.environ.get('SQLITE_WRITE_BATCH_SIZE') or 64)
+    SQLITE_WRITE_WINDOW_MS = float(os.environ.get('SQLITE_WRITE_WINDOW_MS') or 2)  # Group-commit window
+    
+    # Connected-client change log retention (clients older than this get a full resync)
+    VOUCHER_CHANGE_RETENTION_HOURS = int(os.environ.get('VOUCHER_CHANGE_RETENTION_HOURS') or 24)
+    # Longest a transaction may hold a change log entry before committing; readers
+    # wait this long for a missing revision before treating it as rolled back
+    VOUCHER_CHANGE_SETTLE_SECONDS = float(os.environ.get('VOUCHER_CHANGE_SETTLE_SECONDS') or 30)
+    
+    # Usage history retention in days (0 keeps data forever)
+    USAGE_SAMPLE_RETENTION_DAYS = int(os.environ.get('USAGE_SAMPLE_RETENTION_DAYS') or 7)
+    USAGE_MINUTE_RETENTION_DAYS = int(os.environ.get('USAGE_MINUTE_RETENTION_DAYS') or 2)
+    USAGE_HOUR_RETENTION_DAYS = int(os.environ.get('USAGE_HOUR_RETENTION_DAYS') or 90)
+    USAGE_DAY_RETENTION_DAYS = int(os.environ.get('USAGE_DAY_RETENTION_DAYS') or 0)
+    
+    # Voucher archival: vouchers in these states older than N days move to
+    # vouchers_archive in chunks; the monitor runs it every N hours (0 disables)
+    VOUCHER_ARCHIVE_AFTER_DAYS = int(os.environ.get('VOUCHER_ARCHIVE_AFTER_DAYS') or 90)
+    VOUCHER_ARCHIVE_STATUSES = (os.environ.get('VOUCHER_ARCHIVE_STATUSES') or 'expired').split(',')
+    VOUCHER_ARCHIVE_CHUNK_SIZE = int(os.environ.get('VOUCHER_ARCHIVE_CHUNK_SIZE') or 5000)
+    VOUCHER_ARCHIVE_INTERVAL_HOURS = int(os.environ.get('VOUCHER_ARCHIVE_INTERVAL_HOURS') or 24)
+    
+    # Captive portal base URL for voucher QR codes; the redemption link is
+    # derived from it and the voucher code (a batch's plan may override it)
+    VOUCHER_QR_BASE_URL = os.environ.get('VOUCHER_QR_BASE_URL') or 'http://localhost:5000'
+    
     # JWT configuration
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-secret-change-in-production'
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
@@ -25,14 +75,114 @@ class Config:
     # Redis configuration (optional)
     REDIS_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
     
+    # Shared cache (utils/cache): per-worker L1 over Redis, invalidated over
+    # pub/sub; falls back to a short-lived in-memory store while Redis is
+    # unreachable and retries it every CACHE_RETRY_SECONDS
+    CACHE_ENABLED = os.environ.get('CACHE_ENABLED', 'true').lower() == 'true'
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', REDIS_URL)  # Empty for in-memory only
+    CACHE_TTL_SECONDS = int(os.environ.get('CACHE_TTL_SECONDS') or 300)
+    CACHE_L1_TTL_SECONDS = float(os.environ.get('CACHE_L1_TTL_SECONDS') or 5)  # Bounds staleness if a message is lost
+    CACHE_L1_MAX_ENTRIES = int(os.environ.get('CACHE_L1_MAX_ENTRIES') or 10000)
+    CACHE_RETRY_SECONDS = float(os.environ.get('CACHE_RETRY_SECONDS') or 10)
+    
+    # Live events are relayed between web workers, the monitor and the RADIUS
+    # server over Redis pub/sub (empty: events stay in the publishing process)
+    EVENT_BUS_REDIS_URL = os.environ.get('EVENT_BUS_REDIS_URL', REDIS_URL)
+    EVENT_BUS_RETRY_SECONDS = float(os.environ.get('EVENT_BUS_RETRY_SECONDS') or 10)
+    # Browsers open streams with a single-use ticket from POST /api/events/ticket.
+    # Each stream holds a worker thread, so keep the cap below GUNICORN_THREADS
+    EVENT_STREAM_TICKET_SECONDS = int(os.environ.get('EVENT_STREAM_TICKET_SECONDS') or 30)
+    EVENT_STREAM_MAX_PER_WORKER = int(os.environ.get('EVENT_STREAM_MAX_PER_WORKER') or 8)  # 0: no cap
+    
     # Router API configuration
     MIKROTIK_API_PORT = 8728
     UBIQUITI_API_PORT = 443
     CISCO_API_PORT = 22
+    UNIFI_SCHEME = os.environ.get('UNIFI_SCHEME') or 'https'  # http only for local simulators
+    UNIFI_MAX_CONNECTIONS = int(os.environ.get('UNIFI_MAX_CONNECTIONS') or 20)  # Keep-alive pool per controller
+    UNIFI_SITE_CACHE_SECONDS = int(os.environ.get('UNIFI_SITE_CACHE_SECONDS') or 300)  # Site name lookups
+    
+    # Router drivers: 'async' runs all routers concurrently on one event loop
+    # (utils/drivers), 'sync' uses the blocking per-brand managers
+    ROUTER_DRIVER_MODE = os.environ.get('ROUTER_DRIVER_MODE') or 'async'
+    ROUTER_DRIVER_CONCURRENCY = int(os.environ.get('ROUTER_DRIVER_CONCURRENCY') or 100)
+    ROUTER_DRIVER_TIMEOUT = int(os.environ.get('ROUTER_DRIVER_TIMEOUT') or 10)
+    
+    # Router operation log: activations and disconnects are written (fsynced in
+    # small groups) to a local write-ahead log and applied by a replayer thread
+    ROUTER_OPLOG_ENABLED = os.environ.get('ROUTER_OPLOG_ENABLED', 'true').lower() == 'true'
+    ROUTER_OPLOG_DIR = os.environ.get('ROUTER_OPLOG_DIR') or None  # Default: router-oplog in the instance folder
+    ROUTER_OPLOG_FSYNC_MS = float(os.environ.get('ROUTER_OPLOG_FSYNC_MS') or 2)  # Group-commit window
+    ROUTER_OPLOG_SEGMENT_BYTES = int(os.environ.get('ROUTER_OPLOG_SEGMENT_BYTES') or 4 * 1024 * 1024)
+    ROUTER_OPLOG_RETRY_SECONDS = int(os.environ.get('ROUTER_OPLOG_RETRY_SECONDS') or 15)
+    
+    # Built-in RADIUS server for routers with a radius_secret (`flask radius`,
+    # or in-process when RADIUS_ENABLED is set)
+    RADIUS_ENABLED = os.environ.get('RADIUS_ENABLED', 'false').lower() == 'true'
+    RADIUS_BIND = os.environ.get('RADIUS_BIND') or '0.0.0.0'
+    RADIUS_AUTH_PORT = int(os.environ.get('RADIUS_AUTH_PORT') or 1812)
+    RADIUS_INDEX_REFRESH_SECONDS = float(os.environ.get('RADIUS_INDEX_REFRESH_SECONDS') or 1)
+    RADIUS_INDEX_RELOAD_SECONDS = int(os.environ.get('RADIUS_INDEX_RELOAD_SECONDS') or 300)
+    RADIUS_NAS_REFRESH_SECONDS = int(os.environ.get('RADIUS_NAS_REFRESH_SECONDS') or 30)
+    # Access-Requests without Message-Authenticator are dropped (Blast-RADIUS);
+    # comma-separated router IPs listed here are still accepted without it
+    RADIUS_REQUIRE_MESSAGE_AUTHENTICATOR = os.environ.get('RADIUS_REQUIRE_MESSAGE_AUTHENTICATOR', 'true').lower() == 'true'
+    RADIUS_MESSAGE_AUTHENTICATOR_EXEMPT = os.environ.get('RADIUS_MESSAGE_AUTHENTICATOR_EXEMPT') or ''
+    
+    # RADIUS accounting replaces usage polling in the monitor when enabled
+    RADIUS_ACCOUNTING_ENABLED = os.environ.get('RADIUS_ACCOUNTING_ENABLED', 'false').lower() == 'true'
+    RADIUS_ACCT_PORT = int(os.environ.get('RADIUS_ACCT_PORT') or 1813)
+    RADIUS_ACCT_INTERIM_SECONDS = int(os.environ.get('RADIUS_ACCT_INTERIM_SECONDS') or 60)
+    RADIUS_ACCT_FLUSH_MS = int(os.environ.get('RADIUS_ACCT_FLUSH_MS') or 1000)  # Batched DB writes
+    RADIUS_COA_PORT = int(os.environ.get('RADIUS_COA_PORT') or 3799)  # Disconnect-Message (RFC 5176)
+    RADIUS_COA_TIMEOUT_SECONDS = float(os.environ.get('RADIUS_COA_TIMEOUT_SECONDS') or 2)
+    
+    # Router reconciliation (`flask reconcile`): bulk diff of router users
+    # against the database; the monitor runs it every N minutes (0 disables)
+    RECONCILE_BATCH_SIZE = int(os.environ.get('RECONCILE_BATCH_SIZE') or 1000)
+    RECONCILE_MAX_OPS_PER_SECOND = int(os.environ.get('RECONCILE_MAX_OPS_PER_SECOND') or 5000)  # Per router
+    RECONCILE_INTERVAL_MINUTES = int(os.environ.get('RECONCILE_INTERVAL_MINUTES') or 0)
+    
+    # Background network monitor (disable for benchmarks and one-off commands)
+    NETWORK_MONITOR_ENABLED = os.environ.get('NETWORK_MONITOR_ENABLED', 'true').lower() == 'true'
+    # The monitor keeps open sessions in memory (utils/session_table), updated
+    # from the voucher change log and fully reloaded every N minutes
+    SESSION_TABLE_RESYNC_MINUTES = float(os.environ.get('SESSION_TABLE_RESYNC_MINUTES') or 10)
+    
+    # Adaptive usage polling: each session's next check is planned from its
+    # remaining quota and consumption rate, checking again after
+    # USAGE_POLL_SAFETY_FACTOR of the time the quota would last
+    USAGE_POLL_ADAPTIVE = os.environ.get('USAGE_POLL_ADAPTIVE', 'true').lower() == 'true'  # false: every DEFAULT seconds
+    USAGE_POLL_DEFAULT_SECONDS = float(os.environ.get('USAGE_POLL_DEFAULT_SECONDS') or 30)  # Rate not known yet
+    USAGE_POLL_MIN_SECONDS = float(os.environ.get('USAGE_POLL_MIN_SECONDS') or 5)
+    USAGE_POLL_MAX_SECONDS = float(os.environ.get('USAGE_POLL_MAX_SECONDS') or 300)  # Idle and unlimited sessions
+    USAGE_POLL_SAFETY_FACTOR = float(os.environ.get('USAGE_POLL_SAFETY_FACTOR') or 0.5)
+    USAGE_POLL_RATE_SMOOTHING = float(os.environ.get('USAGE_POLL_RATE_SMOOTHING') or 0.5)  # Weight of the newest rate
+    
+    # Create tables and the admin user when the app is created (development);
+    # production runs `flask init-db` / `flask seed-admin` once instead
+    AUTO_INIT_DB = os.environ.get('AUTO_INIT_DB', 'true').lower() == 'true'
+    ADMIN_USERNAME = os.environ.get('ADMIN_USERNAME') or 'admin'
+    ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD') or 'admin123'
+    ADMIN_EMAIL = os.environ.get('ADMIN_EMAIL') or 'admin@wifi-manager.local'
     
     # Security settings
     WTF_CSRF_ENABLED = True
     WTF_CSRF_TIME_LIMIT = None
     
+    # Metrics and profiling
+    METRICS_ENDPOINT = os.environ.get('METRICS_ENDPOINT') or '/metrics'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # Optional bearer token for scrapers
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'false').lower() == 'true'
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE') or 0.0)
+    PROFILE_DIR = os.environ.get('PROFILE_DIR') or 'profiles'
+    
+    # Query auditing (development/test mode N+1 detection)
+    QUERY_AUDIT_ENABLED = os.environ.get('QUERY_AUDIT_ENABLED', 'false').lower() == 'true'
+    QUERY_AUDIT_STRICT = os.environ.get('QUERY_AUDIT_STRICT', 'false').lower() == 'true'
+    QUERY_AUDIT_REPEAT_THRESHOLD = int(os.environ.get('QUERY_AUDIT_REPEAT_THRESHOLD') or 5)
+    QUERY_BUDGET_PER_REQUEST = int(os.environ.get('QUERY_BUDGET_PER_REQUEST') or 25)
+    MONITOR_QUERY_BUDGET = int(os.environ.get('MONITOR_QUERY_BUDGET') or 50)
+    
     # CORS settings - Allow all hosts for Replit proxy
     CORS_ORIGINS = ['*']
@@ -1,15 +1,58 @@
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSession
 from datetime import datetime
 
-db = SQLAlchemy()
+class Session(FlaskSession):
+    """Hands commits with pending writes to the SQLite writer thread when it is enabled,
+    and sends reads inside utils.replica.use_replica() to the read replica"""
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get('use_replica'):
+            from utils.replica import replica_router
+            engine = replica_router.engine_for(self, clause)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+    
+    def commit(self):
+        from utils.sqlite_writer import sqlite_writer
+        if sqlite_writer.should_queue(self):
+            return sqlite_writer.commit(super().commit)
+        return super().commit()
+
+db = SQLAlchemy(session_options={'class_': Session})
 
 def init_db():
     """Initialize database tables"""
     db.create_all()
     print("Database tables created successfully")
+    
+    # Installs upgraded from before the sales summaries need them backfilled
+    from utils.analytics import ensure_sales_summaries
+    ensure_sales_summaries()
 
 def reset_db():
     """Reset database - WARNING: This will delete all data"""
     db.drop_all()
     db.create_all()
     print("Database reset completed")
+
+def seed_admin_user(username='admin', password='admin123', email='admin@wifi-manager.local'):
+    """Create the default admin user if it does not exist yet"""
+    from werkzeug.security import generate_password_hash
+    from models.user import User
+    
+    admin_user = User.query.filter_by(username=username).first()
+    if admin_user:
+        return admin_user
+    
+    admin_user = User()
+    admin_user.username = username
+    admin_user.email = email
+    admin_user.password_hash = generate_password_hash(password)
+    admin_user.role = 'admin'
+    admin_user.is_active = True
+    db.session.add(admin_user)
+    db.session.commit()
+    print(f"Created default admin user: {username}/{password}")
+    return admin_user
@@ -0,0 +1,43 @@
+"""
+Gunicorn Configuration
+Handlers mostly wait on router APIs and the database, so each worker process
+runs a thread pool (gthread) rather than one request at a time. The app is
+preloaded in the master so workers fork with all imports done.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+import multiprocessing
+import os
+
+bind = f"{os.environ.get('HOST') or '0.0.0.0'}:{os.environ.get('PORT') or 5000}"
+
+# Processes for CPU (QR rendering, JSON), threads for router/DB I/O
+workers = int(os.environ.get('WEB_CONCURRENCY') or min(multiprocessing.cpu_count() * 2 + 1, 8))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS') or 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS') or 16)
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS') or 1000)  # gevent only
+
+# gevent must monkey-patch before the app imports sockets/ssl, so it cannot preload
+preload_app = worker_class != 'gevent'
+
+# Router calls can take several seconds; SSE streams are kept alive by heartbeats
+timeout = int(os.environ.get('GUNICORN_TIMEOUT') or 60)
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers periodically to bound memory growth
+max_requests = 5000
+max_requests_jitter = 500
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or '-'
+errorlog = '-'
+
+def post_fork(server, worker):
+    """Drop database connections inherited from the preloading master"""
+    if not preload_app:
+        return
+    from wsgi import app
+    from database import db
+    with app.app_context():
+        db.engine.dispose()
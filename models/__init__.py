@@ -1,6 +1,12 @@
 from .user import User
+from .voucher_plan import VoucherPlan
 from .voucher import Voucher
 from .network import Network
 from .router import Router
+from .voucher_change import VoucherChange
+from .usage import UsageSample, UsageRollup
+from .analytics import DailySalesSummary
+from .voucher_archive import ArchivedVoucher, VoucherArchiveSummary
 
-__all__ = ['User', 'Voucher', 'Network', 'Router']
+__all__ = ['User', 'VoucherPlan', 'Voucher', 'Network', 'Router', 'VoucherChange', 'UsageSample', 'UsageRollup', 'DailySalesSummary',
+           'ArchivedVoucher', 'VoucherArchiveSummary']
@@ -0,0 +1,149 @@
+from database import db
+from datetime import datetime
+from collections import defaultdict
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from models.voucher import Voucher
+
+class DailySalesSummary(db.Model):
+    """Per-day voucher sales counters, maintained incrementally on state transitions
+
+    Rows are additive: several rows may exist for the same key and readers
+    always SUM them, so concurrent writers never need to coordinate.
+    """
+    __tablename__ = 'daily_sales_summaries'
+    __table_args__ = (
+        db.Index('ix_sales_summary_key', 'day', 'voucher_type', 'created_by', 'batch_id'),
+        db.Index('ix_sales_summary_batch', 'batch_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    voucher_type = db.Column(db.String(20), nullable=True)
+    created_by = db.Column(db.Integer, nullable=True)
+    batch_id = db.Column(db.String(50), nullable=True)
+
+    created_count = db.Column(db.Integer, default=0)
+    issued_value = db.Column(db.Float, default=0.0)  # Face value of created vouchers
+    redeemed_count = db.Column(db.Integer, default=0)
+    revenue = db.Column(db.Float, default=0.0)  # Face value of redeemed vouchers
+    redeem_seconds = db.Column(db.Float, default=0.0)  # Sum of creation-to-redemption times
+    expired_count = db.Column(db.Integer, default=0)
+    active_delta = db.Column(db.Integer, default=0)  # Net change in unused vouchers
+    used_delta = db.Column(db.Integer, default=0)  # Net change in vouchers in session
+    first_created_at = db.Column(db.DateTime, nullable=True)  # Earliest creation time counted in the row
+
+    def __repr__(self):
+        return f'<DailySalesSummary {self.day} {self.voucher_type} {self.batch_id}>'
+
+COUNTER_FIELDS = (
+    'created_count', 'issued_value', 'redeemed_count', 'revenue',
+    'redeem_seconds', 'expired_count', 'active_delta', 'used_delta'
+)
+INTEGER_FIELDS = ('created_count', 'redeemed_count', 'expired_count', 'active_delta', 'used_delta')
+
+def voucher_transition_deltas(voucher, previous_status, status, now=None):
+    """Summary counter deltas for a voucher moving between statuses
+
+    `previous_status` is None for a newly created voucher and `status` is
+    None for a deleted one. Returns a list of (day, counters) pairs.
+    """
+    now = now or datetime.utcnow()
+    created_day = (voucher.created_at or now).date()
+    price = voucher.price or 0.0
+    deltas = []
+
+    if previous_status is None:
+        deltas.append((created_day, {'created_count': 1, 'issued_value': price,
+                                     'first_created_at': voucher.created_at or now}))
+    if status is None:
+        deltas.append((created_day, {'created_count': -1, 'issued_value': -price}))
+
+    if status == 'used' and previous_status != 'used':
+        used_at = voucher.used_at or now
+        seconds = (used_at - voucher.created_at).total_seconds() if voucher.created_at else 0.0
+        deltas.append((used_at.date(), {'redeemed_count': 1, 'revenue': price, 'redeem_seconds': seconds}))
+
+    if status == 'expired' and previous_status != 'expired':
+        deltas.append((now.date(), {'expired_count': 1}))
+
+    if (status == 'active') != (previous_status == 'active'):
+        deltas.append((now.date(), {'active_delta': 1 if status == 'active' else -1}))
+
+    if (status == 'used') != (previous_status == 'used'):
+        deltas.append((now.date(), {'used_delta': 1 if status == 'used' else -1}))
+
+    return deltas
+
+def add_deltas(bucket, counters):
+    """Add counters to a pending bucket; first_created_at keeps the earliest"""
+    for field, value in counters.items():
+        if field == 'first_created_at':
+            current = bucket.get(field)
+            bucket[field] = value if current is None or value < current else current
+        else:
+            bucket[field] += value
+
+def _queue_deltas(target, previous_status, status):
+    session = object_session(target)
+    if session is None:
+        return
+
+    key = (target.voucher_type, target.created_by, target.batch_id)
+    pending = session.info.setdefault('sales_summary_deltas', defaultdict(lambda: defaultdict(float)))
+    for day, counters in voucher_transition_deltas(target, previous_status, status):
+        add_deltas(pending[(day,) + key], counters)
+
+def apply_summary_deltas(connection, pending):
+    """Add aggregated deltas to the summary table, one row per key"""
+    table = DailySalesSummary.__table__
+
+    for (day, voucher_type, created_by, batch_id), counters in pending.items():
+        first_created_at = counters.get('first_created_at')
+        counters = {f: int(v) if f in INTEGER_FIELDS else v for f, v in counters.items()
+                    if v and f in COUNTER_FIELDS}
+        if not counters and first_created_at is None:
+            continue
+
+        values = {field: table.c[field] + value for field, value in counters.items()}
+        if first_created_at is not None:
+            values['first_created_at'] = db.case(
+                (db.or_(table.c.first_created_at.is_(None), table.c.first_created_at > first_created_at),
+                 first_created_at),
+                else_=table.c.first_created_at
+            )
+        result = connection.execute(
+            table.update().where(
+                table.c.day == day,
+                table.c.voucher_type == voucher_type,
+                table.c.created_by == created_by,
+                table.c.batch_id == batch_id
+            ).values(values)
+        )
+        if result.rowcount == 0:
+            row = {field: 0 for field in COUNTER_FIELDS}
+            row.update(counters)
+            connection.execute(table.insert().values(
+                day=day, voucher_type=voucher_type, created_by=created_by, batch_id=batch_id,
+                first_created_at=first_created_at, **row
+            ))
+
+@event.listens_for(Voucher, 'after_insert')
+def _summarize_voucher_insert(mapper, connection, target):
+    _queue_deltas(target, None, target.status or 'active')
+
+@event.listens_for(Voucher, 'after_update')
+def _summarize_voucher_update(mapper, connection, target):
+    history = db.inspect(target).attrs.status.history
+    if history.deleted and history.deleted[0] != target.status:
+        _queue_deltas(target, history.deleted[0], target.status)
+
+@event.listens_for(Voucher, 'after_delete')
+def _summarize_voucher_delete(mapper, connection, target):
+    _queue_deltas(target, target.status, None)
+
+@event.listens_for(Session, 'after_flush')
+def _flush_summary_deltas(session, flush_context):
+    pending = session.info.pop('sales_summary_deltas', None)
+    if pending:
+        apply_summary_deltas(session.connection(), pending)
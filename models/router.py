@@ -1,5 +1,6 @@
 from database import db
 from datetime import datetime
+from sqlalchemy.ext.hybrid import hybrid_property
 
 class Router(db.Model):
     __tablename__ = 'routers'
@@ -40,6 +41,16 @@ class Router(db.Model):
         }
         return port_mapping.get(self.brand, 22)
     
+    @hybrid_property
+    def uses_radius(self):
+        """Guests are authenticated by our RADIUS server instead of local users"""
+        return bool(self.radius_server and self.radius_secret)
+    
+    @uses_radius.expression
+    def uses_radius(cls):
+        return db.and_(cls.radius_server.isnot(None), cls.radius_server != '',
+                       cls.radius_secret.isnot(None), cls.radius_secret != '')
+    
     def to_dict(self):
         """Convert router to dictionary"""
         return {
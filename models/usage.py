@@ -0,0 +1,53 @@
+from database import db
+from datetime import datetime
+
+class UsageSample(db.Model):
+    """Append-only raw usage deltas written in batches by the network monitor"""
+    __tablename__ = 'usage_samples'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    voucher_id = db.Column(db.Integer, nullable=False, index=True)
+    network_id = db.Column(db.Integer, nullable=True)
+    router_id = db.Column(db.Integer, nullable=True)
+    recorded_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    data_mb = db.Column(db.Float, default=0.0)  # Data transferred since the previous sample
+    
+    def to_dict(self):
+        """Convert sample to dictionary"""
+        return {
+            'voucher_id': self.voucher_id,
+            'network_id': self.network_id,
+            'router_id': self.router_id,
+            'recorded_at': self.recorded_at.isoformat() if self.recorded_at else None,
+            'data_mb': self.data_mb
+        }
+    
+    def __repr__(self):
+        return f'<UsageSample {self.voucher_id} {self.recorded_at}>'
+
+class UsageRollup(db.Model):
+    """Pre-aggregated usage per scope and time bucket, maintained incrementally"""
+    __tablename__ = 'usage_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('resolution', 'scope', 'scope_id', 'bucket_start', name='uq_usage_rollup_bucket'),
+        db.Index('ix_usage_rollup_lookup', 'scope', 'scope_id', 'resolution', 'bucket_start'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    resolution = db.Column(db.String(10), nullable=False)  # minute, hour, day
+    scope = db.Column(db.String(10), nullable=False)  # voucher, network, router
+    scope_id = db.Column(db.Integer, nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    data_mb = db.Column(db.Float, default=0.0)
+    samples = db.Column(db.Integer, default=0)
+    
+    def to_dict(self):
+        """Convert rollup bucket to dictionary"""
+        return {
+            'bucket_start': self.bucket_start.isoformat() if self.bucket_start else None,
+            'data_mb': self.data_mb,
+            'samples': self.samples
+        }
+    
+    def __repr__(self):
+        return f'<UsageRollup {self.scope}:{self.scope_id} {self.resolution} {self.bucket_start}>'
@@ -1,18 +1,18 @@
 from database import db
 from datetime import datetime, timedelta
+from flask import current_app, has_app_context
+from models.voucher_plan import VoucherPlan, PlanFieldsMixin, PLAN_FIELDS
+import math
 import secrets
 import string
 
-class Voucher(db.Model):
+class Voucher(PlanFieldsMixin, db.Model):
     __tablename__ = 'vouchers'
     
     id = db.Column(db.Integer, primary_key=True)
     code = db.Column(db.String(20), unique=True, nullable=False)
     batch_id = db.Column(db.String(50), nullable=True)
     status = db.Column(db.String(20), default='active')  # active, used, expired, disabled
-    duration_hours = db.Column(db.Integer, default=24)
-    data_limit_mb = db.Column(db.Integer, nullable=True)  # Data limit in MB
-    speed_limit_kbps = db.Column(db.Integer, nullable=True)  # Speed limit in KB/s
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     expires_at = db.Column(db.DateTime, nullable=True)
     used_at = db.Column(db.DateTime, nullable=True)
@@ -26,17 +26,24 @@ class Voucher(db.Model):
     client_mac = db.Column(db.String(17), nullable=True)  # MAC address of client
     client_ip = db.Column(db.String(15), nullable=True)   # IP address of client
     
-    # QR code data
-    qr_code_data = db.Column(db.Text, nullable=True)
+    # Duration, limits, type, price and network restrictions shared by the
+    # batch; read through the PlanFieldsMixin properties
+    plan_id = db.Column(db.Integer, db.ForeignKey('voucher_plans.id'), nullable=True, index=True)
+    plan = db.relationship(VoucherPlan, lazy='select')
     
-    # Voucher type and pricing
-    voucher_type = db.Column(db.String(20), default='standard')  # standard, premium, unlimited
-    price = db.Column(db.Float, default=0.0)  # Price in local currency
-    
-    # Network restrictions
-    allowed_networks = db.Column(db.Text, nullable=True)  # JSON array of network IDs
+    # Status doubles as an optimistic lock: every UPDATE is conditional on the
+    # status that was loaded, so two concurrent redemptions cannot both succeed
+    # (the loser gets StaleDataError on flush)
+    __mapper_args__ = {
+        'version_id_col': status,
+        'version_id_generator': False
+    }
     
     def __init__(self, **kwargs):
+        # Plan settings may still be passed one by one; they resolve to a shared plan
+        fields = {field: kwargs.pop(field) for field in PLAN_FIELDS if field in kwargs}
+        if fields or ('plan' not in kwargs and 'plan_id' not in kwargs):
+            kwargs['plan'] = VoucherPlan.get_or_create(**fields)
         super(Voucher, self).__init__(**kwargs)
         if not self.code:
             self.code = self.generate_code()
@@ -65,9 +72,30 @@ class Voucher(db.Model):
         self.used_at = datetime.utcnow()
         self.session_token = secrets.token_urlsafe(32)
     
-    def generate_qr_data(self, base_url='http://localhost:5000'):
+    def start_session(self, client_mac=None, client_ip=None, now=None):
+        """Mark voucher as used and open its session for a client"""
+        now = now or datetime.utcnow()
+        self.mark_as_used()
+        self.session_start = now
+        self.client_mac = client_mac
+        self.client_ip = client_ip
+        
+        # Calculate session end time
+        if self.duration_hours:
+            self.session_end = now + timedelta(hours=self.duration_hours)
+    
+    @property
+    def qr_code_data(self):
+        """Redemption URL for the voucher's QR code, derived from its code"""
+        base_url = self.plan.qr_base_url if self.plan is not None else None
+        if not base_url:
+            base_url = current_app.config.get('VOUCHER_QR_BASE_URL') if has_app_context() else None
+        return f"{base_url or 'http://localhost:5000'}/captive?code={self.code}"
+    
+    def generate_qr_data(self, base_url=None):
         """Generate QR code data for voucher"""
-        self.qr_code_data = f"{base_url}/captive?code={self.code}"
+        if base_url:
+            return f"{base_url}/captive?code={self.code}"
         return self.qr_code_data
     
     def to_dict(self):
@@ -93,5 +121,39 @@ class Voucher(db.Model):
             'qr_code_data': self.qr_code_data
         }
     
+    def to_client_dict(self, now=None):
+        """Convert an active session to the connected-client representation"""
+        now = now or datetime.utcnow()
+        remaining_time = 0
+        if self.session_end:
+            remaining_time = max(0, (self.session_end - now).total_seconds() / 60)
+        
+        return {
+            'voucher_code': self.code,
+            'client_mac': self.client_mac,
+            'client_ip': self.client_ip,
+            'session_start': self.session_start.isoformat() if self.session_start else None,
+            'remaining_minutes': int(remaining_time),
+            'data_used_mb': self.data_used_mb,
+            'data_limit_mb': self.data_limit_mb
+        }
+    
+    def session_allowance(self, now=None):
+        """(minutes, quota_mb) a router should grant, quota 0 meaning unlimited
+
+        A running session gets what is left of it, so re-adding the user (by
+        reconciliation or a retried operation) never restarts its clock or quota.
+        """
+        now = now or datetime.utcnow()
+        if self.session_end:
+            minutes = max(1, math.ceil((self.session_end - now).total_seconds() / 60))
+        else:
+            minutes = self.duration_hours * 60 if self.duration_hours else 1440
+        
+        quota_mb = 0
+        if self.data_limit_mb:
+            quota_mb = max(1, math.ceil(self.data_limit_mb - (self.data_used_mb or 0)))
+        return minutes, quota_mb
+    
     def __repr__(self):
         return f'<Voucher {self.code}>'
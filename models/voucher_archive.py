@@ -0,0 +1,84 @@
+from database import db
+from datetime import datetime
+from models.voucher_plan import VoucherPlan, PlanFieldsMixin
+
+class ArchivedVoucher(PlanFieldsMixin, db.Model):
+    """Vouchers moved out of the hot table in a terminal state
+
+    Rows keep their original id, so usage history stays attached. On
+    PostgreSQL the table is range-partitioned by created_at (one partition
+    per month, created on demand by utils.archive), which is why created_at
+    is part of the primary key and codes are indexed rather than unique.
+    """
+    __tablename__ = 'vouchers_archive'
+    __table_args__ = (
+        db.Index('ix_vouchers_archive_code', 'code'),
+        db.Index('ix_vouchers_archive_batch', 'batch_id'),
+        {'postgresql_partition_by': 'RANGE (created_at)'}
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    created_at = db.Column(db.DateTime, primary_key=True)
+    code = db.Column(db.String(20), nullable=False)
+    batch_id = db.Column(db.String(50), nullable=True)
+    status = db.Column(db.String(20), nullable=False)
+    plan_id = db.Column(db.Integer, db.ForeignKey('voucher_plans.id'), nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True)
+    used_at = db.Column(db.DateTime, nullable=True)
+    created_by = db.Column(db.Integer, nullable=True)
+    data_used_mb = db.Column(db.Float, default=0.0)
+    session_start = db.Column(db.DateTime, nullable=True)
+    session_end = db.Column(db.DateTime, nullable=True)
+    client_mac = db.Column(db.String(17), nullable=True)
+    client_ip = db.Column(db.String(15), nullable=True)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    plan = db.relationship(VoucherPlan, lazy='select')
+
+    def to_dict(self):
+        """Convert archived voucher to the same dictionary as a live voucher"""
+        return {
+            'id': self.id,
+            'code': self.code,
+            'batch_id': self.batch_id,
+            'status': self.status,
+            'duration_hours': self.duration_hours,
+            'data_limit_mb': self.data_limit_mb,
+            'speed_limit_kbps': self.speed_limit_kbps,
+            'data_used_mb': self.data_used_mb,
+            'voucher_type': self.voucher_type,
+            'price': self.price,
+            'client_mac': self.client_mac,
+            'client_ip': self.client_ip,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None,
+            'used_at': self.used_at.isoformat() if self.used_at else None,
+            'session_start': self.session_start.isoformat() if self.session_start else None,
+            'session_end': self.session_end.isoformat() if self.session_end else None,
+            'qr_code_data': None,
+            'archived': True,
+            'archived_at': self.archived_at.isoformat() if self.archived_at else None
+        }
+
+    def __repr__(self):
+        return f'<ArchivedVoucher {self.code}>'
+
+class VoucherArchiveSummary(db.Model):
+    """Counts of archived vouchers, additive like the daily sales summaries
+
+    Lets totals include archived vouchers without scanning the archive.
+    """
+    __tablename__ = 'voucher_archive_summaries'
+    __table_args__ = (
+        db.Index('ix_archive_summary_key', 'status', 'voucher_type', 'batch_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), nullable=False)
+    voucher_type = db.Column(db.String(20), nullable=True)
+    batch_id = db.Column(db.String(50), nullable=True)
+    voucher_count = db.Column(db.Integer, default=0)
+    data_used_mb = db.Column(db.Float, default=0.0)
+
+    def __repr__(self):
+        return f'<VoucherArchiveSummary {self.status} {self.voucher_type} {self.batch_id}>'
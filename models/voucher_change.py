@@ -0,0 +1,115 @@
+from database import db
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event
+from models.voucher import Voucher
+
+class VoucherChange(db.Model):
+    """Append-only change log of voucher sessions; the id is the revision number"""
+    __tablename__ = 'voucher_changes'
+    __table_args__ = {'sqlite_autoincrement': True}  # Revisions must never be reused
+    
+    id = db.Column(db.Integer, primary_key=True)
+    voucher_id = db.Column(db.Integer, nullable=False, index=True)
+    code = db.Column(db.String(20), nullable=False)
+    change_type = db.Column(db.String(20), nullable=False)  # started, updated, ended
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def to_dict(self):
+        """Convert change to dictionary"""
+        return {
+            'revision': self.id,
+            'voucher_id': self.voucher_id,
+            'code': self.code,
+            'change_type': self.change_type,
+            'changed_at': self.changed_at.isoformat() if self.changed_at else None
+        }
+    
+    def __repr__(self):
+        return f'<VoucherChange {self.id} {self.code} {self.change_type}>'
+
+def settled_revision(session=None):
+    """Highest revision below which no change can still appear
+
+    Ids are taken when a change is flushed but become visible when its
+    transaction commits, so on PostgreSQL a reader can see revision 106
+    before 105 commits. A missing id is treated as a transaction still in
+    flight until the change after it is VOUCHER_CHANGE_SETTLE_SECONDS old,
+    after which it is taken to be a rollback. Readers that stop at this
+    revision see every change exactly once as long as no transaction takes
+    longer than that between writing a change and committing it.
+    """
+    session = session or db.session
+    settle = timedelta(seconds=current_app.config.get('VOUCHER_CHANGE_SETTLE_SECONDS', 30))
+    
+    # Every id up to the newest settled change is final
+    base = session.query(db.func.max(VoucherChange.id)).filter(
+        VoucherChange.changed_at < datetime.utcnow() - settle
+    ).scalar() or 0
+    
+    # First recent change whose predecessor is missing
+    previous = db.aliased(VoucherChange)
+    gap_after = session.query(db.func.min(VoucherChange.id)).filter(
+        VoucherChange.id > base + 1,
+        ~session.query(previous.id).filter(previous.id == VoucherChange.id - 1).exists()
+    ).scalar()
+    
+    latest = session.query(db.func.max(VoucherChange.id)).filter(VoucherChange.id > base)
+    if gap_after is not None:
+        latest = latest.filter(VoucherChange.id < gap_after)
+    return latest.scalar() or base
+
+# Session fields whose changes are visible to connected-client views
+SESSION_FIELDS = ('data_used_mb', 'session_start', 'session_end', 'client_mac', 'client_ip')
+
+def classify_change(previous_status, status):
+    """Map a status transition to a change type, or None if not session-relevant"""
+    if status == 'used' and previous_status != 'used':
+        return 'started'
+    if previous_status == 'used' and status != 'used':
+        return 'ended'
+    if status == 'used':
+        return 'updated'
+    return None
+
+def record_voucher_changes(changes, connection=None):
+    """Append change log rows in one statement
+
+    Bulk UPDATE paths that bypass ORM events must call this themselves.
+    `changes` is an iterable of (voucher_id, code, change_type) tuples.
+    """
+    rows = [{
+        'voucher_id': voucher_id,
+        'code': code,
+        'change_type': change_type,
+        'changed_at': datetime.utcnow()
+    } for voucher_id, code, change_type in changes]
+    
+    if not rows:
+        return
+    
+    if connection is None:
+        from utils.cache import invalidate_after_commit, voucher_key
+        db.session.execute(VoucherChange.__table__.insert(), rows)
+        invalidate_after_commit(db.session(), [voucher_key(row['code']) for row in rows])
+    else:
+        connection.execute(VoucherChange.__table__.insert(), rows)
+
+@event.listens_for(Voucher, 'after_update')
+def _log_voucher_update(mapper, connection, target):
+    status_history = db.inspect(target).attrs.status.history
+    previous_status = status_history.deleted[0] if status_history.deleted else target.status
+    change_type = classify_change(previous_status, target.status)
+    
+    if change_type == 'updated':
+        state = db.inspect(target)
+        if not any(state.attrs[field].history.has_changes() for field in SESSION_FIELDS):
+            return
+    
+    if change_type:
+        record_voucher_changes([(target.id, target.code, change_type)], connection)
+
+@event.listens_for(Voucher, 'after_delete')
+def _log_voucher_delete(mapper, connection, target):
+    if target.status == 'used':
+        record_voucher_changes([(target.id, target.code, 'ended')], connection)
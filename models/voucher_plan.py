@@ -0,0 +1,91 @@
+from database import db
+from datetime import datetime
+
+# Settings every card of a batch shares, with the defaults of a plain voucher
+PLAN_FIELDS = {
+    'duration_hours': 24,
+    'data_limit_mb': None,
+    'speed_limit_kbps': None,
+    'voucher_type': 'standard',
+    'price': 0.0,
+    'allowed_networks': None,
+    'qr_base_url': None
+}
+
+class VoucherPlan(db.Model):
+    """Duration, limits, type and price shared by the vouchers that reference it
+
+    Plans are immutable values: changing a voucher's settings points it at
+    another plan, so a plan can be shared by any number of batches. Identical
+    plans created concurrently are harmless duplicates.
+    """
+    __tablename__ = 'voucher_plans'
+
+    id = db.Column(db.Integer, primary_key=True)
+    duration_hours = db.Column(db.Integer, default=24)
+    data_limit_mb = db.Column(db.Integer, nullable=True)  # Data limit in MB
+    speed_limit_kbps = db.Column(db.Integer, nullable=True)  # Speed limit in KB/s
+    voucher_type = db.Column(db.String(20), default='standard')  # standard, premium, unlimited
+    price = db.Column(db.Float, default=0.0)  # Price in local currency
+    allowed_networks = db.Column(db.Text, nullable=True)  # JSON array of network IDs
+    qr_base_url = db.Column(db.String(255), nullable=True)  # Portal URL override for QR codes
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @classmethod
+    def get_or_create(cls, session=None, **fields):
+        """Plan with exactly these settings, added to the session if new"""
+        session = session or db.session()
+        values = dict(PLAN_FIELDS)
+        values.update(fields)
+        key = tuple(values[field] for field in PLAN_FIELDS)
+
+        # Batches create many vouchers with the same settings
+        cache = session.info.setdefault('voucher_plans', {})
+        plan = cache.get(key)
+        if plan is not None and plan in session:
+            return plan
+
+        with session.no_autoflush:
+            plan = session.query(cls).filter(*[
+                getattr(cls, field).is_(None) if value is None else getattr(cls, field) == value
+                for field, value in values.items()
+            ]).order_by(cls.id).first()
+        if plan is None:
+            plan = cls(**values)
+            session.add(plan)
+        cache[key] = plan
+        return plan
+
+    def replace(self, session=None, **changes):
+        """Plan with some settings changed; the plan itself is left as it is"""
+        fields = {field: getattr(self, field) for field in PLAN_FIELDS}
+        fields.update(changes)
+        return VoucherPlan.get_or_create(session, **fields)
+
+    def to_dict(self):
+        """Convert plan to dictionary"""
+        return {
+            'id': self.id,
+            'duration_hours': self.duration_hours,
+            'data_limit_mb': self.data_limit_mb,
+            'speed_limit_kbps': self.speed_limit_kbps,
+            'voucher_type': self.voucher_type,
+            'price': self.price,
+            'allowed_networks': self.allowed_networks
+        }
+
+    def __repr__(self):
+        return f'<VoucherPlan {self.id} {self.voucher_type} {self.duration_hours}h>'
+
+def _plan_field(name):
+    return property(lambda self: getattr(self.plan, name) if self.plan is not None else None,
+                    doc=f"{name} of the voucher's plan (read-only)")
+
+class PlanFieldsMixin:
+    """Read-only voucher attributes that live on the referenced VoucherPlan"""
+    duration_hours = _plan_field('duration_hours')
+    data_limit_mb = _plan_field('data_limit_mb')
+    speed_limit_kbps = _plan_field('speed_limit_kbps')
+    voucher_type = _plan_field('voucher_type')
+    price = _plan_field('price')
+    allowed_networks = _plan_field('allowed_networks')
@@ -3,6 +3,7 @@ from werkzeug.security import generate_password_hash
 from models.user import User
 from database import db
 from utils.auth import token_required, admin_required
+from utils.replica import replica_reads
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -129,12 +130,14 @@ def delete_user(current_user, user_id):
 
 @admin_bp.route('/stats', methods=['GET'])
 @admin_required
+@replica_reads
 def get_admin_stats(current_user):
     """Get admin statistics"""
     try:
         from models.voucher import Voucher
         from models.network import Network
         from models.router import Router
+        from utils.archive import archived_count
         
         stats = {
             'total_users': User.query.count(),
@@ -142,7 +145,7 @@ def get_admin_stats(current_user):
             'admin_users': User.query.filter_by(role='admin').count(),
             'operator_users': User.query.filter_by(role='operator').count(),
             'regular_users': User.query.filter_by(role='user').count(),
-            'total_vouchers': Voucher.query.count(),
+            'total_vouchers': Voucher.query.count() + archived_count(),
             'active_vouchers': Voucher.query.filter_by(status='active').count(),
             'used_vouchers': Voucher.query.filter_by(status='used').count(),
             'total_networks': Network.query.count(),
@@ -0,0 +1,69 @@
+from flask import Blueprint, request, jsonify, Response
+from datetime import date
+from utils.auth import token_required, admin_required
+from utils.analytics import get_sales_report, get_sales_totals, export_sales_report, rebuild_sales_summaries
+from utils.replica import replica_reads
+
+analytics_bp = Blueprint('analytics', __name__)
+
+def _get_period():
+    """Parse optional ISO start/end dates from the query string"""
+    start = request.args.get('start')
+    end = request.args.get('end')
+    return (
+        date.fromisoformat(start) if start else None,
+        date.fromisoformat(end) if end else None
+    )
+
+@analytics_bp.route('/sales', methods=['GET'])
+@token_required
+@replica_reads
+def get_sales(current_user):
+    """Get revenue and redemption figures grouped by day, type, operator or batch"""
+    try:
+        group_by = request.args.get('group_by', 'day')
+        start, end = _get_period()
+        
+        return jsonify({
+            'group_by': group_by,
+            'totals': get_sales_totals(start, end),
+            'rows': get_sales_report(group_by, start, end)
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@analytics_bp.route('/sales/export', methods=['GET'])
+@token_required
+@replica_reads
+def export_sales(current_user):
+    """Export a sales report as CSV or JSON"""
+    try:
+        group_by = request.args.get('group_by', 'day')
+        format = request.args.get('format', 'csv')
+        start, end = _get_period()
+        
+        content = export_sales_report(get_sales_report(group_by, start, end), format)
+        mimetype = 'application/json' if format == 'json' else 'text/csv'
+        
+        return Response(content, mimetype=mimetype, headers={
+            'Content-Disposition': f'attachment; filename=sales_by_{group_by}.{format}'
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@analytics_bp.route('/rebuild', methods=['POST'])
+@admin_required
+def rebuild_summaries(current_user):
+    """Recompute sales summaries from the vouchers table"""
+    try:
+        rows = rebuild_sales_summaries()
+        return jsonify({'message': 'تم إعادة بناء الإحصائيات بنجاح', 'summary_rows': rows})
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
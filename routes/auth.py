@@ -5,11 +5,13 @@ import jwt
 from models.user import User
 from database import db
 from utils.auth import token_required
+from utils.query_audit import query_budget_limit
 from config import Config
 
 auth_bp = Blueprint('auth', __name__)
 
 @auth_bp.route('/login', methods=['POST'])
+@query_budget_limit(3)
 def login():
     """User login endpoint"""
     try:
@@ -63,6 +65,7 @@ def logout(current_user):
 
 @auth_bp.route('/profile', methods=['GET'])
 @token_required
+@query_budget_limit(1)
 def get_profile(current_user):
     """Get current user profile"""
     try:
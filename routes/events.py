@@ -0,0 +1,47 @@
+from flask import Blueprint, Response, request, jsonify, current_app
+from utils.auth import token_required, stream_token_required, issue_stream_ticket
+from utils.event_bus import event_bus, format_sse
+
+events_bp = Blueprint('events', __name__)
+
+KEEPALIVE_SECONDS = 15
+
+@events_bp.route('/ticket', methods=['POST'])
+@token_required
+def create_stream_ticket(current_user):
+    """Single-use ticket for opening the stream (EventSource cannot send headers)"""
+    return jsonify({
+        'ticket': issue_stream_ticket(current_user),
+        'expires_in': current_app.config.get('EVENT_STREAM_TICKET_SECONDS', 30)
+    })
+
+@events_bp.route('/stream', methods=['GET'])
+@stream_token_required
+def stream_events(current_user):
+    """Server-Sent Events stream of live session, usage, router and stats updates"""
+    topics = request.args.get('topics')
+    subscription = event_bus.subscribe(topics.split(',') if topics else None)
+    
+    # Every open stream holds a worker thread; past the cap clients fall back
+    # to polling and retry later instead of starving API requests
+    limit = current_app.config.get('EVENT_STREAM_MAX_PER_WORKER') or 0
+    if limit and event_bus.subscriber_count() > limit:
+        event_bus.unsubscribe(subscription)
+        return jsonify({'error': 'عدد كبير من البث المباشر المفتوح، حاول لاحقاً'}), 503, {'Retry-After': '30'}
+    
+    def generate():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                event = subscription.get(timeout=KEEPALIVE_SECONDS)
+                if event is None:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield format_sse(event)
+        finally:
+            event_bus.unsubscribe(subscription)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
@@ -1,10 +1,22 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from utils.auth import token_required, admin_required
+from utils.query_audit import query_budget_limit
 from models.voucher import Voucher
+from models.voucher_plan import VoucherPlan
 from models.router import Router
 from models.network import Network
+from models.voucher_change import VoucherChange, settled_revision
+from models.voucher_archive import ArchivedVoucher
 from utils.router_manager import get_router_manager
+from utils.event_bus import publish_event
+from utils.router_oplog import (
+    log_router_operation, cancel_router_operation, replay_router_operations, apply_router_operation
+)
+from utils.reconcile import reconcile_routers
+from utils.cache import cache, voucher_key, ROUTERS_KEY
 from database import db
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.exc import StaleDataError
 import json
 from datetime import datetime, timedelta
 
@@ -15,8 +27,8 @@ network_control_bp = Blueprint('network_control', __name__)
 def get_routers(current_user):
     """Get all configured routers"""
     try:
-        routers = Router.query.all()
-        return jsonify([router.to_dict() for router in routers])
+        routers = cache.get(ROUTERS_KEY, lambda: [router.to_dict() for router in Router.query.all()])
+        return jsonify(routers)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -35,6 +47,8 @@ def add_router(current_user):
         router.username = data.get('username')
         router.password = data.get('password')
         router.api_port = data.get('api_port')
+        router.radius_server = data.get('radius_server')
+        router.radius_secret = data.get('radius_secret')
         router.is_active = True
         
         # Test connection
@@ -51,6 +65,8 @@ def add_router(current_user):
         db.session.add(router)
         db.session.commit()
         
+        publish_event('router.added', {**router.to_dict(), 'status': router.status})
+        
         return jsonify({
             'message': 'تم إضافة الراوتر بنجاح',
             'router': router.to_dict()
@@ -79,6 +95,8 @@ def test_router_connection(current_user, router_id):
         
         db.session.commit()
         
+        publish_event('router.status', {'id': router.id, 'status': router.status})
+        
         return jsonify({
             'connected': connected,
             'message': message,
@@ -88,6 +106,23 @@ def test_router_connection(current_user, router_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@network_control_bp.route('/routers/reconcile', methods=['POST'])
+@admin_required
+def reconcile(current_user):
+    """Bring router user lists in line with the database"""
+    try:
+        data = request.get_json(silent=True) or {}
+        router_ids = data.get('router_ids') or None
+        if router_ids is not None and not isinstance(router_ids, list):
+            return jsonify({'error': 'router_ids يجب أن تكون قائمة'}), 400
+        
+        result = reconcile_routers(router_ids, dry_run=bool(data.get('dry_run', True)))
+        
+        return jsonify(result)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @network_control_bp.route('/vouchers/create_batch', methods=['POST'])
 @admin_required
 def create_voucher_batch(current_user):
@@ -105,30 +140,29 @@ def create_voucher_batch(current_user):
         voucher_type = data.get('voucher_type', 'standard')
         price = float(data.get('price', 0))
         
+        # Settings shared by the whole batch live in one plan row
+        allowed_networks = data.get('allowed_networks')
+        plan = VoucherPlan.get_or_create(
+            duration_hours=duration_hours,
+            data_limit_mb=int(data_limit_mb) if data_limit_mb else None,
+            speed_limit_kbps=int(speed_limit_kbps) if speed_limit_kbps else None,
+            voucher_type=voucher_type,
+            price=price,
+            allowed_networks=json.dumps(allowed_networks) if allowed_networks else None,
+            qr_base_url=data.get('base_url')  # QR codes are derived from the code and this URL
+        )
+        
         vouchers = []
         
         for i in range(quantity):
-            voucher = Voucher()
+            voucher = Voucher(plan=plan)
             voucher.batch_id = batch_id
-            voucher.duration_hours = duration_hours
-            voucher.data_limit_mb = int(data_limit_mb) if data_limit_mb else None
-            voucher.speed_limit_kbps = int(speed_limit_kbps) if speed_limit_kbps else None
-            voucher.voucher_type = voucher_type
-            voucher.price = price
             voucher.created_by = current_user.id
             
             # Set expiration date for voucher usage
             if data.get('voucher_expires_days'):
                 voucher.expires_at = datetime.utcnow() + timedelta(days=int(data.get('voucher_expires_days')))
             
-            # Network restrictions
-            if data.get('allowed_networks'):
-                voucher.allowed_networks = json.dumps(data.get('allowed_networks'))
-            
-            # Generate QR code
-            base_url = data.get('base_url', 'http://localhost:5000')
-            voucher.generate_qr_data(base_url)
-            
             db.session.add(voucher)
             vouchers.append(voucher)
         
@@ -159,49 +193,41 @@ def activate_voucher(voucher_code):
         if not voucher.is_valid():
             return jsonify({'error': 'كارت الاتصال منتهي الصلاحية أو مستخدم'}), 400
         
-        # Mark voucher as used
-        voucher.mark_as_used()
-        voucher.session_start = datetime.utcnow()
-        voucher.client_mac = client_mac
-        voucher.client_ip = client_ip
-        
-        # Calculate session end time
-        if voucher.duration_hours:
-            voucher.session_end = datetime.utcnow() + timedelta(hours=voucher.duration_hours)
-        
-        # Apply voucher to router(s)
-        routers = Router.query.filter_by(is_active=True).all()
-        
-        for router in routers:
-            try:
-                manager = get_router_manager(router)
-                if manager.connect():
-                    # Add user to router's hotspot/guest system
-                    if router.brand == 'MikroTik':
-                        success = manager.add_hotspot_user(
-                            username=voucher_code,
-                            password=voucher.session_token,
-                            profile='voucher_profile'
-                        )
-                    elif router.brand == 'Ubiquiti':
-                        success = manager.add_guest_user(
-                            username=voucher_code,
-                            password=voucher.session_token,
-                            duration_minutes=voucher.duration_hours * 60 if voucher.duration_hours else 1440
-                        )
-                    else:
-                        success = False
-                    
-                    if success:
-                        router.last_seen = datetime.utcnow()
-                        router.status = 'connected'
-                
-                manager.disconnect()
-                
-            except Exception as e:
-                print(f"Error applying voucher to router {router.name}: {e}")
+        # Routers to apply the voucher to; networks are loaded up front for rate-limit caps.
+        # RADIUS routers authenticate the guest on demand and need no local user.
+        routers = Router.query.options(selectinload(Router.networks)).filter_by(is_active=True).all()
+        routers = [router for router in routers if not router.uses_radius]
+        use_oplog = current_app.config.get('ROUTER_OPLOG_ENABLED')
         
-        db.session.commit()
+        # Mark voucher as used and start the session
+        voucher.start_session(client_mac, client_ip)
+        
+        # Log the router work before claiming, so a crash after the claim can
+        # never leave a used voucher that no router knows about
+        oplog_seq = log_router_operation('provision', [voucher_code], routers) if use_oplog else None
+        
+        # Claim the voucher before touching routers, so a concurrent activation
+        # of the same code fails here instead of provisioning a second session
+        try:
+            db.session.commit()
+        except StaleDataError:
+            db.session.rollback()
+            if oplog_seq is not None:
+                cancel_router_operation(oplog_seq)
+            return jsonify({'error': 'كارت الاتصال منتهي الصلاحية أو مستخدم'}), 409
+        
+        if use_oplog:
+            # Acknowledged once durably logged; the replayer applies and retries
+            replay_router_operations()
+        else:
+            results = apply_router_operation(current_app, 'provision', routers, [voucher])
+            for router in routers:
+                if results.get(router.id):
+                    router.last_seen = datetime.utcnow()
+                    router.status = 'connected'
+            db.session.commit()
+        
+        publish_event('voucher.activated', voucher.to_client_dict())
         
         return jsonify({
             'message': 'تم تفعيل كارت الاتصال بنجاح',
@@ -219,41 +245,58 @@ def activate_voucher(voucher_code):
 def get_voucher_usage(voucher_code):
     """Get voucher usage statistics"""
     try:
-        voucher = Voucher.query.filter_by(code=voucher_code).first()
+        # Captive portals poll this; the cached row is invalidated on every voucher change
+        voucher = cache.get(voucher_key(voucher_code), lambda: _voucher_usage_row(voucher_code))
         
         if not voucher:
             return jsonify({'error': 'كود الكارت غير صحيح'}), 404
         
         usage_info = {
-            'code': voucher.code,
-            'status': voucher.status,
-            'data_used_mb': voucher.data_used_mb,
-            'data_limit_mb': voucher.data_limit_mb,
-            'session_start': voucher.session_start.isoformat() if voucher.session_start else None,
-            'session_end': voucher.session_end.isoformat() if voucher.session_end else None,
+            'code': voucher['code'],
+            'status': voucher['status'],
+            'data_used_mb': voucher['data_used_mb'],
+            'data_limit_mb': voucher['data_limit_mb'],
+            'session_start': voucher['session_start'].isoformat() if voucher['session_start'] else None,
+            'session_end': voucher['session_end'].isoformat() if voucher['session_end'] else None,
             'remaining_time': None,
             'remaining_data': None
         }
         
         # Calculate remaining time
-        if voucher.session_end and voucher.status == 'used':
-            remaining_seconds = (voucher.session_end - datetime.utcnow()).total_seconds()
+        if voucher['session_end'] and voucher['status'] == 'used':
+            remaining_seconds = (voucher['session_end'] - datetime.utcnow()).total_seconds()
             if remaining_seconds > 0:
                 usage_info['remaining_time'] = int(remaining_seconds / 60)  # in minutes
             else:
                 usage_info['remaining_time'] = 0
         
         # Calculate remaining data
-        if voucher.data_limit_mb:
-            usage_info['remaining_data'] = max(0, voucher.data_limit_mb - voucher.data_used_mb)
+        if voucher['data_limit_mb']:
+            usage_info['remaining_data'] = max(0, voucher['data_limit_mb'] - voucher['data_used_mb'])
         
         return jsonify(usage_info)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _voucher_usage_row(voucher_code):
+    # Old codes fall back to the archive
+    for model in (Voucher, ArchivedVoucher):
+        row = db.session.query(
+            model.code, model.status, model.data_used_mb, VoucherPlan.data_limit_mb,
+            model.session_start, model.session_end
+        ).outerjoin(VoucherPlan, model.plan_id == VoucherPlan.id).filter(model.code == voucher_code).first()
+        if row:
+            return dict(row._mapping)
+    return None
+
+def _local_user_routers():
+    # RADIUS routers hold no local user; the voucher no longer authenticates
+    return [router for router in Router.query.filter_by(is_active=True).all() if not router.uses_radius]
+
 @network_control_bp.route('/vouchers/<voucher_code>/disconnect', methods=['POST'])
 @admin_required
+@query_budget_limit(6)
 def disconnect_voucher(current_user, voucher_code):
     """Disconnect voucher session"""
     try:
@@ -265,27 +308,32 @@ def disconnect_voucher(current_user, voucher_code):
         if voucher.status != 'used':
             return jsonify({'error': 'الكارت غير نشط'}), 400
         
-        # Remove from routers
-        routers = Router.query.filter_by(is_active=True).all()
-        
-        for router in routers:
-            try:
-                manager = get_router_manager(router)
-                if manager.connect():
-                    if router.brand == 'MikroTik':
-                        manager.remove_hotspot_user(voucher_code)
-                    # Add disconnect logic for other router types
-                
-                manager.disconnect()
-                
-            except Exception as e:
-                print(f"Error disconnecting voucher from router {router.name}: {e}")
+        use_oplog = current_app.config.get('ROUTER_OPLOG_ENABLED')
         
         # Mark voucher as expired
         voucher.status = 'expired'
         voucher.session_end = datetime.utcnow()
         
-        db.session.commit()
+        oplog_seq = log_router_operation('revoke', [voucher_code], _local_user_routers()) if use_oplog else None
+        
+        # Claim the session end before touching routers, so a concurrent
+        # disconnect or expiry of the same voucher fails here
+        try:
+            db.session.commit()
+        except StaleDataError:
+            db.session.rollback()
+            if oplog_seq is not None:
+                cancel_router_operation(oplog_seq)
+            return jsonify({'error': 'الكارت غير نشط'}), 409
+        
+        if use_oplog:
+            # The replayer retries routers that are unreachable now
+            replay_router_operations()
+        else:
+            # Loaded after the commit, which would expire them into one refresh each
+            apply_router_operation(current_app, 'revoke', _local_user_routers(), [voucher])
+        
+        publish_event('voucher.ended', {'codes': [voucher_code]})
         
         return jsonify({'message': 'تم قطع الاتصال بنجاح'})
         
@@ -295,32 +343,77 @@ def disconnect_voucher(current_user, voucher_code):
 @network_control_bp.route('/network/clients', methods=['GET'])
 @token_required
 def get_connected_clients(current_user):
-    """Get list of connected clients"""
+    """Get list of connected clients
+
+    With `?since=<revision>` only the sessions added, changed or ended after
+    that revision are returned, so polling cost follows churn, not population.
+    The revision handed out is the settled one, so a change that commits
+    after a later one is still delivered on the next poll.
+    """
     try:
+        since = request.args.get('since', type=int)
+        revision = settled_revision()
+        
+        if since is not None and _can_serve_delta(since, revision):
+            return jsonify(_get_client_changes(since, revision))
+        
         # Get active vouchers (connected clients)
         active_vouchers = Voucher.query.filter_by(status='used').filter(
             Voucher.session_end > datetime.utcnow()
         ).all()
         
-        clients = []
-        for voucher in active_vouchers:
-            if voucher.session_start and voucher.session_end:
-                remaining_time = (voucher.session_end - datetime.utcnow()).total_seconds() / 60
-                if remaining_time > 0:
-                    clients.append({
-                        'voucher_code': voucher.code,
-                        'client_mac': voucher.client_mac,
-                        'client_ip': voucher.client_ip,
-                        'session_start': voucher.session_start.isoformat(),
-                        'remaining_minutes': int(remaining_time),
-                        'data_used_mb': voucher.data_used_mb,
-                        'data_limit_mb': voucher.data_limit_mb
-                    })
+        now = datetime.utcnow()
+        clients = [
+            voucher.to_client_dict(now) for voucher in active_vouchers
+            if voucher.session_start and voucher.session_end and voucher.session_end > now
+        ]
         
         return jsonify({
             'connected_clients': len(clients),
-            'clients': clients
+            'clients': clients,
+            'revision': revision,
+            'full': True
         })
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+def _can_serve_delta(since, revision):
+    """Check that every change after `since` is still in the change log"""
+    if since > revision:
+        return False  # Client is ahead of the log (e.g. database was reset)
+    
+    oldest = db.session.query(db.func.min(VoucherChange.id)).scalar()
+    return oldest is None or since >= oldest - 1
+
+def _get_client_changes(since, revision):
+    """Collapse the change log between two revisions into client deltas"""
+    changes = VoucherChange.query.filter(
+        VoucherChange.id > since,
+        VoucherChange.id <= revision
+    ).order_by(VoucherChange.id).all()
+    
+    # Only the latest change per voucher matters
+    latest = {}
+    for change in changes:
+        latest[change.voucher_id] = change
+    
+    changed_ids = [vid for vid, c in latest.items() if c.change_type != 'ended']
+    removed = [c.code for c in latest.values() if c.change_type == 'ended']
+    
+    now = datetime.utcnow()
+    changed = []
+    for start in range(0, len(changed_ids), 500):
+        chunk = changed_ids[start:start + 500]
+        for voucher in Voucher.query.filter(Voucher.id.in_(chunk)).all():
+            if voucher.status == 'used' and voucher.session_end and voucher.session_end > now:
+                changed.append(voucher.to_client_dict(now))
+            else:
+                removed.append(voucher.code)
+    
+    return {
+        'revision': revision,
+        'full': False,
+        'changed': changed,
+        'removed': removed
+    }
@@ -3,6 +3,7 @@ from models.network import Network
 from models.router import Router
 from database import db
 from utils.auth import token_required, admin_required
+from utils.query_audit import query_budget_limit
 
 networks_bp = Blueprint('networks', __name__)
 
@@ -256,13 +257,15 @@ def update_router(current_user, router_id):
 
 @networks_bp.route('/routers/<int:router_id>', methods=['DELETE'])
 @admin_required
+@query_budget_limit(5)
 def delete_router(current_user, router_id):
     """Delete router"""
     try:
         router = Router.query.get_or_404(router_id)
         
-        # Check if router has associated networks
-        if router.networks:
+        # Check if router has associated networks (existence check, not a full load)
+        has_networks = db.session.query(Network.id).filter_by(router_id=router_id).first() is not None
+        if has_networks:
             return jsonify({'error': 'لا يمكن حذف راوتر مرتبط بشبكات'}), 400
         
         db.session.delete(router)
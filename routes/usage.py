@@ -0,0 +1,73 @@
+from flask import Blueprint, request, jsonify
+from datetime import datetime
+from models.network import Network
+from models.router import Router
+from utils.auth import token_required
+from utils.usage_store import query_usage
+from utils.archive import find_voucher
+from utils.replica import replica_reads
+
+usage_bp = Blueprint('usage', __name__)
+
+def _get_usage_range():
+    """Parse resolution and optional ISO start/end from the query string"""
+    resolution = request.args.get('resolution', 'hour')
+    start = request.args.get('start')
+    end = request.args.get('end')
+    return (
+        resolution,
+        datetime.fromisoformat(start) if start else None,
+        datetime.fromisoformat(end) if end else None
+    )
+
+@usage_bp.route('/vouchers/<voucher_code>', methods=['GET'])
+@token_required
+@replica_reads
+def get_voucher_usage_history(current_user, voucher_code):
+    """Get bandwidth history for a voucher session"""
+    try:
+        voucher = find_voucher(voucher_code)
+        if not voucher:
+            return jsonify({'error': 'كود الكارت غير صحيح'}), 404
+        
+        resolution, start, end = _get_usage_range()
+        return jsonify(query_usage('voucher', voucher.id, resolution, start, end))
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@usage_bp.route('/networks/<int:network_id>', methods=['GET'])
+@token_required
+@replica_reads
+def get_network_usage_history(current_user, network_id):
+    """Get bandwidth history for a network"""
+    # Outside the try, so an unknown id stays a 404
+    Network.query.get_or_404(network_id)
+    
+    try:
+        resolution, start, end = _get_usage_range()
+        return jsonify(query_usage('network', network_id, resolution, start, end))
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@usage_bp.route('/routers/<int:router_id>', methods=['GET'])
+@token_required
+@replica_reads
+def get_router_usage_history(current_user, router_id):
+    """Get bandwidth history for a router"""
+    # Outside the try, so an unknown id stays a 404
+    Router.query.get_or_404(router_id)
+    
+    try:
+        resolution, start, end = _get_usage_range()
+        return jsonify(query_usage('router', router_id, resolution, start, end))
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -1,15 +1,19 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime, timedelta
 from models.voucher import Voucher
+from models.voucher_plan import VoucherPlan
 from database import db
 from utils.auth import token_required
 from utils.qr_generator import generate_qr_code
+from utils.analytics import get_batch_summaries
+from utils.replica import replica_reads
 import uuid
 
 vouchers_bp = Blueprint('vouchers', __name__)
 
 @vouchers_bp.route('/', methods=['GET'])
 @token_required
+@replica_reads
 def get_vouchers(current_user):
     """Get vouchers with pagination and filtering"""
     try:
@@ -61,15 +65,16 @@ def create_voucher_batch(current_user):
         # Generate batch ID
         batch_id = str(uuid.uuid4())[:8].upper()
         
+        # Every card of the batch references the same plan row
+        plan = VoucherPlan.get_or_create(duration_hours=duration_hours, data_limit_mb=data_limit_mb)
+        
         vouchers = []
         for _ in range(count):
             voucher = Voucher(
                 batch_id=batch_id,
-                duration_hours=duration_hours,
-                data_limit_mb=data_limit_mb,
+                plan=plan,
                 created_by=current_user.id
             )
-            voucher.generate_qr_data()
             vouchers.append(voucher)
             db.session.add(voucher)
         
@@ -110,11 +115,13 @@ def update_voucher(current_user, voucher_id):
                 return jsonify({'error': 'حالة الكرت غير صحيحة'}), 400
             voucher.status = data['status']
         
-        if 'duration_hours' in data and voucher.status == 'active':
-            voucher.duration_hours = data['duration_hours']
-        
-        if 'data_limit_mb' in data and voucher.status == 'active':
-            voucher.data_limit_mb = data['data_limit_mb']
+        # Plans are shared, so changed settings move the voucher to another plan
+        changes = {field: data[field] for field in ('duration_hours', 'data_limit_mb') if field in data}
+        if changes and voucher.status == 'active':
+            if voucher.plan is not None:
+                voucher.plan = voucher.plan.replace(**changes)
+            else:
+                voucher.plan = VoucherPlan.get_or_create(**changes)
         
         db.session.commit()
         
@@ -148,32 +155,12 @@ def delete_voucher(current_user, voucher_id):
 
 @vouchers_bp.route('/batches', methods=['GET'])
 @token_required
+@replica_reads
 def get_batches(current_user):
     """Get voucher batches"""
     try:
-        batches = db.session.query(
-            Voucher.batch_id,
-            db.func.count(Voucher.id).label('total_count'),
-            db.func.sum(db.case([(Voucher.status == 'active', 1)], else_=0)).label('active_count'),
-            db.func.sum(db.case([(Voucher.status == 'used', 1)], else_=0)).label('used_count'),
-            db.func.min(Voucher.created_at).label('created_at')
-        ).filter(
-            Voucher.batch_id.isnot(None)
-        ).group_by(
-            Voucher.batch_id
-        ).order_by(
-            db.func.min(Voucher.created_at).desc()
-        ).all()
-        
-        result = []
-        for batch in batches:
-            result.append({
-                'batch_id': batch.batch_id,
-                'total_count': batch.total_count,
-                'active_count': batch.active_count or 0,
-                'used_count': batch.used_count or 0,
-                'created_at': batch.created_at.isoformat() if batch.created_at else None
-            })
+        # Served from the incrementally maintained sales summaries
+        result = get_batch_summaries()
         
         return jsonify({'batches': result})
         
@@ -182,6 +169,7 @@ def get_batches(current_user):
 
 @vouchers_bp.route('/batch/<batch_id>/print', methods=['GET'])
 @token_required
+@replica_reads
 def print_batch(current_user, batch_id):
     """Get batch vouchers for printing"""
     try:
@@ -251,6 +251,124 @@ class WiFiManager {
     }
 }
 
+// Live updates pushed by the server over Server-Sent Events
+class LiveEvents {
+    constructor(topics = null) {
+        this.topics = topics;
+        this.handlers = {};
+        this.source = null;
+        this.connected = false;
+        // False when events from the monitor and RADIUS server do not reach
+        // this stream (no Redis between processes); keep polling then
+        this.shared = false;
+        this.onStateChange = null;
+        this.closed = false;
+        this.retryTimer = null;
+    }
+
+    static isSupported() {
+        return typeof EventSource !== 'undefined';
+    }
+
+    on(type, handler) {
+        (this.handlers[type] = this.handlers[type] || []).push(handler);
+        if (this.source) {
+            this.source.addEventListener(type, (e) => handler(JSON.parse(e.data)));
+        }
+        return this;
+    }
+
+    connect() {
+        if (!LiveEvents.isSupported() || !localStorage.getItem('auth_token')) {
+            return false;
+        }
+
+        this.closed = false;
+        this.open();
+        return true;
+    }
+
+    async open() {
+        const token = localStorage.getItem('auth_token');
+        if (this.closed || !token) {
+            return;
+        }
+
+        // The stream is opened with a single-use ticket so the JWT stays out
+        // of URLs and access logs
+        let ticket;
+        try {
+            const response = await fetch('/api/events/ticket', {
+                method: 'POST',
+                headers: { 'Authorization': `Bearer ${token}` }
+            });
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            ticket = (await response.json()).ticket;
+        } catch (error) {
+            console.error('Live events ticket failed:', error);
+            this.reconnectLater();
+            return;
+        }
+        if (this.closed) {
+            return;
+        }
+
+        const params = new URLSearchParams({ ticket });
+        if (this.topics) {
+            params.set('topics', this.topics.join(','));
+        }
+
+        this.source = new EventSource(`/api/events/stream?${params}`);
+        // The server opens every stream (and reports changes) with a hello event
+        this.source.addEventListener('hello', (e) => {
+            this.shared = JSON.parse(e.data).shared;
+            this.setConnected(true, true);
+        });
+        // The browser's own retry would reuse the spent ticket; reconnect
+        // with a new one instead (also when the server is at its stream cap)
+        this.source.onerror = () => {
+            this.source.close();
+            this.source = null;
+            this.setConnected(false);
+            this.reconnectLater();
+        };
+
+        Object.entries(this.handlers).forEach(([type, handlers]) => {
+            handlers.forEach(handler => {
+                this.source.addEventListener(type, (e) => handler(JSON.parse(e.data)));
+            });
+        });
+    }
+
+    reconnectLater() {
+        if (!this.closed) {
+            clearTimeout(this.retryTimer);
+            this.retryTimer = setTimeout(() => this.open(), 5000);
+        }
+    }
+
+    setConnected(connected, force = false) {
+        if (this.connected !== connected || force) {
+            this.connected = connected;
+            if (this.onStateChange) {
+                this.onStateChange(connected);
+            }
+        }
+    }
+
+    close() {
+        this.closed = true;
+        clearTimeout(this.retryTimer);
+        if (this.source) {
+            this.source.close();
+            this.source = null;
+        }
+        this.setConnected(false);
+    }
+}
+
 // Initialize app
 const app = new WiFiManager();
 
@@ -273,4 +391,5 @@ function hideLoading(element, originalContent) {
 
 // Export for global use
 window.WiFiManager = WiFiManager;
+window.LiveEvents = LiveEvents;
 window.app = app;
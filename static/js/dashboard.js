@@ -2,15 +2,39 @@
 class Dashboard {
     constructor() {
         this.statsRefreshInterval = null;
+        this.live = null;
         this.init();
     }
 
     init() {
         this.loadStats();
-        this.startStatsRefresh();
+        this.startLiveUpdates();
         this.setupEventListeners();
     }
 
+    startLiveUpdates() {
+        // Statistics are computed once on the server and pushed to every tab;
+        // polling is only a fallback while the stream is unavailable
+        this.live = new LiveEvents(['stats', 'voucher']);
+        this.live.on('stats.dashboard', (stats) => {
+            this.updateStatsDisplay(stats);
+            this.updateRecentActivity(stats.recent_vouchers || []);
+        });
+        this.live.on('resync', () => this.loadStats());
+        this.live.onStateChange = (connected) => {
+            // Statistics are published by the monitor, possibly in another process
+            if (connected && this.live.shared) {
+                this.stopStatsRefresh();
+            } else {
+                this.startStatsRefresh();
+            }
+        };
+
+        if (!this.live.connect()) {
+            this.startStatsRefresh();
+        }
+    }
+
     setupEventListeners() {
         // Refresh button
         const refreshBtn = document.getElementById('refresh-stats');
@@ -114,6 +138,8 @@ class Dashboard {
     }
 
     startStatsRefresh() {
+        if (this.statsRefreshInterval) return;
+
         // Refresh stats every 30 seconds
         this.statsRefreshInterval = setInterval(() => {
             this.loadStats();
@@ -129,6 +155,9 @@ class Dashboard {
 
     destroy() {
         this.stopStatsRefresh();
+        if (this.live) {
+            this.live.close();
+        }
     }
 }
 
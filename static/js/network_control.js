@@ -71,10 +71,13 @@ function displayRouters() {
     feather.replace();
 }
 
-// Load connected clients
+// Load connected clients (full list first, then only changes since the last revision)
+let clientsRevision = null;
+
 async function loadClients() {
     try {
-        const response = await fetch('/api/control/network/clients', {
+        const query = clientsRevision !== null ? `?since=${clientsRevision}` : '';
+        const response = await fetch(`/api/control/network/clients${query}`, {
             headers: {
                 'Authorization': 'Bearer ' + getToken()
             }
@@ -82,9 +85,15 @@ async function loadClients() {
         
         if (response.ok) {
             const data = await response.json();
-            clients = data.clients;
+            if (data.full) {
+                clients = data.clients;
+            } else {
+                clients = clients.filter(c => !data.removed.includes(c.voucher_code));
+                data.changed.forEach(applyClientUpsert);
+            }
+            clientsRevision = data.revision;
             displayClients();
-            updateClientStats(data.connected_clients);
+            updateClientStats(clients.length);
         } else {
             showError('فشل في تحميل بيانات المستخدمين');
         }
@@ -397,6 +406,7 @@ function refreshAll() {
 }
 
 function refreshClients() {
+    clientsRevision = null;
     loadClients();
 }
 
@@ -409,13 +419,83 @@ function hideAddRouterModal() {
     document.getElementById('add-router-modal').style.display = 'none';
 }
 
-// Auto-refresh every 30 seconds
-setInterval(() => {
-    loadClients();
-    loadNetworkStats();
-}, 30000);
+// Apply pushed deltas instead of re-fetching full lists
+function applyClientUpsert(client) {
+    const index = clients.findIndex(c => c.voucher_code === client.voucher_code);
+    if (index >= 0) {
+        clients[index] = { ...clients[index], ...client };
+    } else {
+        clients.push(client);
+    }
+}
 
-// Auto-refresh router status every 2 minutes
-setInterval(() => {
-    loadRouters();
-}, 120000);
\ No newline at end of file
+function applyLiveDelta(apply) {
+    apply();
+    displayClients();
+    updateClientStats(clients.length);
+    updateNetworkStats();
+}
+
+let clientsRefreshInterval = null;
+let routersRefreshInterval = null;
+
+function startPolling() {
+    if (clientsRefreshInterval) return;
+
+    // Auto-refresh every 30 seconds
+    clientsRefreshInterval = setInterval(() => {
+        loadClients();
+        loadNetworkStats();
+    }, 30000);
+
+    // Auto-refresh router status every 2 minutes
+    routersRefreshInterval = setInterval(() => {
+        loadRouters();
+    }, 120000);
+}
+
+function stopPolling() {
+    clearInterval(clientsRefreshInterval);
+    clearInterval(routersRefreshInterval);
+    clientsRefreshInterval = null;
+    routersRefreshInterval = null;
+}
+
+const liveEvents = new LiveEvents(['voucher', 'usage', 'router', 'stats']);
+
+liveEvents
+    .on('voucher.activated', (client) => applyLiveDelta(() => applyClientUpsert(client)))
+    .on('voucher.ended', (data) => applyLiveDelta(() => {
+        clients = clients.filter(c => !data.codes.includes(c.voucher_code));
+    }))
+    .on('usage.updated', (data) => applyLiveDelta(() => data.clients.forEach(applyClientUpsert)))
+    .on('router.status', (data) => {
+        const router = routers.find(r => r.id === data.id);
+        if (router) {
+            router.status = data.status;
+            displayRouters();
+            updateRouterStats();
+        }
+    })
+    .on('router.added', () => loadRouters())
+    .on('stats.dashboard', (stats) => {
+        networkStats = stats;
+        updateNetworkStats();
+    })
+    .on('resync', () => refreshAll());
+
+liveEvents.onStateChange = (connected) => {
+    if (connected) {
+        refreshAll();
+    }
+    // Usage and session endings come from the monitor and RADIUS processes
+    if (connected && liveEvents.shared) {
+        stopPolling();
+    } else {
+        startPolling();
+    }
+};
+
+if (!liveEvents.connect()) {
+    startPolling();
+}
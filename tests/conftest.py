@@ -0,0 +1,52 @@
+"""
+Test Fixtures
+Each test gets the app on its own SQLite file, with the query auditor in
+strict mode so any request over its statement budget fails the test
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from database import db
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+        'QUERY_AUDIT_ENABLED': True,
+        'NETWORK_MONITOR_ENABLED': False,
+        'RADIUS_ENABLED': False,
+        'ROUTER_OPLOG_ENABLED': False,
+        'ROUTER_OPLOG_DIR': str(tmp_path / 'router-oplog'),
+        'CACHE_REDIS_URL': '',
+        'EVENT_BUS_REDIS_URL': ''
+    })
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def admin_headers(app, client):
+    response = client.post('/api/auth/login', json={
+        'username': app.config.get('ADMIN_USERNAME', 'admin'),
+        'password': app.config.get('ADMIN_PASSWORD', 'admin123')
+    })
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+@pytest.fixture
+def mikrotik():
+    from benchmarks.fake_routers import FakeMikroTikServer
+    server = FakeMikroTikServer().start()
+    yield server
+    server.stop()
@@ -0,0 +1,13 @@
+"""
+Import Time
+`import wsgi` in a fresh interpreter stays within IMPORT_BUDGET_MS and leaves
+the heavy optional dependencies for first use (see benchmarks/importtime.py)
+"""
+
+from benchmarks.importtime import APP_ENV, default_budget_ms, eager_imports, measure_import
+
+def test_wsgi_import_is_lazy_and_within_budget():
+    timings = measure_import('wsgi', APP_ENV)
+
+    assert eager_imports(timings) == []
+    assert timings['wsgi'][1] / 1000.0 <= default_budget_ms()
@@ -0,0 +1,73 @@
+"""
+Query Budgets
+The blueprints that used to issue a query per item (router networks, routers
+per revoked voucher, users per request) stay within fixed statement budgets.
+The app runs the auditor in strict mode, so each endpoint's own
+@query_budget_limit is enforced on every request as well.
+"""
+
+from datetime import datetime
+
+from database import db
+from models.network import Network
+from models.router import Router
+from models.voucher import Voucher
+from utils.query_audit import query_budget
+
+def add_router(app, port):
+    with app.app_context():
+        router = Router(name=f'Router {port}', brand='MikroTik', ip_address='127.0.0.1',
+                        api_port=port, username='admin', password='admin', is_active=True)
+        db.session.add(router)
+        db.session.commit()
+        return router.id
+
+def add_active_voucher(app):
+    with app.app_context():
+        voucher = Voucher(batch_id='TEST', price=1.0)
+        db.session.add(voucher)
+        db.session.commit()
+        voucher.start_session(client_ip='10.0.0.2', now=datetime.utcnow())
+        db.session.commit()
+        return voucher.code
+
+def test_login(client):
+    with query_budget(3, name='login'):
+        response = client.post('/api/auth/login', json={'username': 'admin', 'password': 'admin123'})
+    assert response.status_code == 200
+
+def test_token_auth_reuses_the_cached_user(client, admin_headers):
+    client.get('/api/auth/profile', headers=admin_headers)
+    with query_budget(0, name='profile'):
+        response = client.get('/api/auth/profile', headers=admin_headers)
+    assert response.status_code == 200
+
+def test_delete_router_checks_networks_without_loading_them(app, client, admin_headers):
+    router_id = add_router(app, 8728)
+    with app.app_context():
+        db.session.add_all([Network(ssid=f'ssid-{i}', router_id=router_id) for i in range(10)])
+        db.session.commit()
+    client.get('/api/auth/profile', headers=admin_headers)
+
+    with query_budget(2, name='delete_router', repeat_threshold=2):
+        response = client.delete(f'/api/networks/routers/{router_id}', headers=admin_headers)
+    assert response.status_code == 400
+
+    router_id = add_router(app, 8729)
+    with query_budget(4, name='delete_router', repeat_threshold=2):
+        response = client.delete(f'/api/networks/routers/{router_id}', headers=admin_headers)
+    assert response.status_code == 200
+
+def test_disconnect_queries_do_not_grow_with_routers(app, client, admin_headers, mikrotik):
+    client.get('/api/auth/profile', headers=admin_headers)
+    counts = []
+    for new_routers in (1, 4):
+        for _ in range(new_routers):
+            add_router(app, mikrotik.port)
+        code = add_active_voucher(app)
+        with query_budget(5, name='disconnect', repeat_threshold=2) as scope:
+            response = client.post(f'/api/control/vouchers/{code}/disconnect', headers=admin_headers)
+        assert response.status_code == 200
+        counts.append(len(scope.statements))
+    assert counts[0] == counts[1]
+    assert not mikrotik.state.active
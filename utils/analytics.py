@@ -0,0 +1,180 @@
+"""
+Sales Analytics
+Revenue, redemption and batch reports served from the precomputed daily
+summaries instead of scanning the vouchers table
+"""
+
+import csv
+import io
+import itertools
+import json
+from collections import defaultdict
+from database import db
+from models.voucher import Voucher
+from models.voucher_archive import ArchivedVoucher
+from models.voucher_plan import VoucherPlan
+from models.analytics import (
+    DailySalesSummary, COUNTER_FIELDS, voucher_transition_deltas, add_deltas, apply_summary_deltas
+)
+
+GROUP_COLUMNS = {
+    'day': DailySalesSummary.day,
+    'type': DailySalesSummary.voucher_type,
+    'operator': DailySalesSummary.created_by,
+    'batch': DailySalesSummary.batch_id
+}
+
+def _summed_counters():
+    return [db.func.coalesce(db.func.sum(getattr(DailySalesSummary, f)), 0).label(f) for f in COUNTER_FIELDS]
+
+def _row_to_report(group_value, row):
+    created = row.created_count or 0
+    redeemed = row.redeemed_count or 0
+    return {
+        'group': group_value.isoformat() if hasattr(group_value, 'isoformat') else group_value,
+        'created_count': int(created),
+        'issued_value': float(row.issued_value or 0.0),
+        'redeemed_count': int(redeemed),
+        'revenue': float(row.revenue or 0.0),
+        'expired_count': int(row.expired_count or 0),
+        'redemption_rate': round(redeemed / created, 4) if created > 0 else None,
+        'avg_time_to_redeem_hours': round(row.redeem_seconds / redeemed / 3600, 2) if redeemed > 0 else None
+    }
+
+def get_sales_report(group_by='day', start=None, end=None):
+    """Revenue and redemption figures grouped by day, type, operator or batch"""
+    column = GROUP_COLUMNS.get(group_by)
+    if column is None:
+        raise ValueError(f"Unsupported grouping: {group_by}")
+
+    query = db.session.query(column.label('group_value'), *_summed_counters())
+    if start:
+        query = query.filter(DailySalesSummary.day >= start)
+    if end:
+        query = query.filter(DailySalesSummary.day <= end)
+
+    rows = query.group_by(column).order_by(column).all()
+    return [_row_to_report(row.group_value, row) for row in rows]
+
+def get_sales_totals(start=None, end=None):
+    """Overall totals for a period"""
+    query = db.session.query(*_summed_counters())
+    if start:
+        query = query.filter(DailySalesSummary.day >= start)
+    if end:
+        query = query.filter(DailySalesSummary.day <= end)
+    return _row_to_report(None, query.one())
+
+def get_batch_summaries():
+    """Per-batch voucher counts for the batches listing
+
+    active_count and used_count are the vouchers currently unused and in
+    session; created_at is the creation time of the batch's first voucher.
+    """
+    first_created_at = db.func.min(DailySalesSummary.first_created_at)
+    rows = db.session.query(
+        DailySalesSummary.batch_id,
+        db.func.sum(DailySalesSummary.created_count).label('total_count'),
+        db.func.sum(DailySalesSummary.active_delta).label('active_count'),
+        db.func.sum(DailySalesSummary.used_delta).label('used_count'),
+        first_created_at.label('created_at')
+    ).filter(
+        DailySalesSummary.batch_id.isnot(None)
+    ).group_by(
+        DailySalesSummary.batch_id
+    ).having(
+        db.func.sum(DailySalesSummary.created_count) > 0
+    ).order_by(
+        first_created_at.desc()
+    ).all()
+
+    return [{
+        'batch_id': row.batch_id,
+        'total_count': int(row.total_count or 0),
+        'active_count': int(row.active_count or 0),
+        'used_count': int(row.used_count or 0),
+        'created_at': row.created_at.isoformat() if row.created_at else None
+    } for row in rows]
+
+def export_sales_report(report, format='csv'):
+    """Export a sales report as CSV or JSON"""
+    if format == 'json':
+        return json.dumps(report, ensure_ascii=False, indent=2)
+    if format != 'csv':
+        raise ValueError("Unsupported export format")
+
+    output = io.StringIO()
+    writer = csv.writer(output)
+    fields = ['group', 'created_count', 'issued_value', 'redeemed_count', 'revenue',
+              'expired_count', 'redemption_rate', 'avg_time_to_redeem_hours']
+    writer.writerow(fields)
+    for row in report:
+        writer.writerow(['' if row[f] is None else row[f] for f in fields])
+    return output.getvalue()
+
+def rebuild_sales_summaries(chunk_size=5000):
+    """Recompute all summaries from the vouchers and archive tables (one-time backfill or repair)"""
+    DailySalesSummary.query.delete(synchronize_session=False)
+
+    pending = defaultdict(lambda: defaultdict(float))
+    columns = itertools.chain.from_iterable(db.session.query(
+        model.status, VoucherPlan.price, VoucherPlan.voucher_type, model.created_by,
+        model.batch_id, model.created_at, model.used_at, model.session_end, model.expires_at
+    ).outerjoin(VoucherPlan, model.plan_id == VoucherPlan.id).yield_per(chunk_size)
+        for model in (Voucher, ArchivedVoucher))
+
+    for voucher in columns:
+        key = (voucher.voucher_type, voucher.created_by, voucher.batch_id)
+        transitions = [(None, 'active')]
+        if voucher.used_at:
+            transitions.append(('active', 'used'))
+        if voucher.status != transitions[-1][1]:
+            transitions.append((transitions[-1][1], voucher.status))
+
+        for previous_status, status in transitions:
+            # Historic transitions are dated by the timestamps we still have
+            if status == 'expired':
+                when = voucher.session_end or voucher.expires_at
+            else:
+                when = voucher.created_at
+            for day, counters in voucher_transition_deltas(voucher, previous_status, status, now=when):
+                add_deltas(pending[(day,) + key], counters)
+
+    apply_summary_deltas(db.session.connection(), pending)
+    db.session.commit()
+    return len(pending)
+
+# Summary columns added after the table was first released, with their DDL types
+ADDED_COLUMNS = {'used_delta': 'INTEGER DEFAULT 0', 'first_created_at': 'TIMESTAMP'}
+
+def ensure_sales_summaries():
+    """Bring the summaries table up to date and backfill it when needed
+
+    Adds columns missing from older installs and rebuilds the summaries when
+    columns were added or the table is empty while vouchers exist, so the
+    reports and batch listing are complete right after an upgrade. Returns
+    the number of summary rows rebuilt, or None when nothing was needed.
+    """
+    inspector = db.inspect(db.engine)
+    if 'plan_id' not in {column['name'] for column in inspector.get_columns(Voucher.__tablename__)}:
+        print("Sales summaries not rebuilt: run `flask migrate-voucher-plans` first")
+        return None
+
+    table_name = DailySalesSummary.__tablename__
+    columns = {column['name'] for column in inspector.get_columns(table_name)}
+    missing = [name for name in ADDED_COLUMNS if name not in columns]
+    if missing:
+        with db.engine.begin() as connection:
+            for name in missing:
+                connection.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {name} {ADDED_COLUMNS[name]}")
+
+    has_summaries = db.session.query(DailySalesSummary.id).first() is not None
+    has_vouchers = (db.session.query(Voucher.id).first() is not None
+                    or db.session.query(ArchivedVoucher.id).first() is not None)
+    if not has_vouchers or (has_summaries and not missing):
+        db.session.rollback()
+        return None
+
+    rows = rebuild_sales_summaries()
+    print(f"Sales summaries rebuilt: {rows} rows")
+    return rows
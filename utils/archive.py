@@ -0,0 +1,150 @@
+"""
+Voucher Archival
+Moves vouchers in terminal states past a configurable age out of the hot
+vouchers table in chunked batches. Archived rows keep their ids, their codes
+stay resolvable through find_voucher, and their totals are kept in summary
+rows; the daily sales summaries are left untouched
+"""
+
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from flask import current_app
+from database import db
+from models.voucher import Voucher
+from models.voucher_archive import ArchivedVoucher, VoucherArchiveSummary
+from models.voucher_plan import VoucherPlan
+from utils.cache import invalidate_after_commit, voucher_key
+
+# Columns copied into the archive; session tokens are not kept
+ARCHIVE_COLUMNS = [column.key for column in ArchivedVoucher.__table__.columns if column.key != 'archived_at']
+
+def _month_start(value):
+    return datetime(value.year, value.month, 1)
+
+def _next_month(value):
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+def ensure_partitions(connection, created_at_values, known=None):
+    """Create the monthly archive partitions these rows need (PostgreSQL only)"""
+    if connection.dialect.name != 'postgresql':
+        return
+    known = known if known is not None else set()
+    for month in sorted({_month_start(value) for value in created_at_values} - known):
+        name = f"{ArchivedVoucher.__tablename__}_{month:%Y%m}"
+        connection.exec_driver_sql(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {ArchivedVoucher.__tablename__} "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_next_month(month):%Y-%m-%d}')"
+        )
+        known.add(month)
+
+def _candidates(statuses, cutoff):
+    return db.session.query(Voucher.id).filter(
+        Voucher.status.in_(statuses),
+        Voucher.created_at < cutoff,
+        db.or_(Voucher.session_end.is_(None), Voucher.session_end < cutoff)
+    )
+
+def archive_vouchers(older_than_days=None, chunk_size=None, max_chunks=None, dry_run=False):
+    """Move old vouchers in terminal states to the archive table
+
+    Each chunk is one transaction: rows are locked, copied, summarized and
+    deleted with core statements, so the ORM delete hooks that would shrink
+    the sales summaries never run. Returns counts for the run.
+    """
+    config = current_app.config
+    days = config.get('VOUCHER_ARCHIVE_AFTER_DAYS', 90) if older_than_days is None else older_than_days
+    chunk_size = chunk_size or config.get('VOUCHER_ARCHIVE_CHUNK_SIZE', 5000)
+    statuses = config.get('VOUCHER_ARCHIVE_STATUSES', ['expired'])
+    cutoff = datetime.utcnow() - timedelta(days=days)
+
+    if dry_run:
+        return {'dry_run': True, 'eligible': _candidates(statuses, cutoff).count(), 'cutoff': cutoff.isoformat()}
+
+    table = Voucher.__table__
+    started = time.perf_counter()
+    archived = 0
+    chunks = 0
+    partitions = set()
+    while max_chunks is None or chunks < max_chunks:
+        try:
+            query = _candidates(statuses, cutoff).order_by(Voucher.id).limit(chunk_size)
+            if db.engine.dialect.name == 'postgresql':
+                # Skip rows a redemption or the monitor is updating right now
+                query = query.with_for_update(skip_locked=True)
+            ids = [voucher_id for voucher_id, in query.all()]
+            if not ids:
+                db.session.rollback()
+                break
+
+            rows = [dict(row._mapping) for row in db.session.execute(
+                db.select(*(table.c[key] for key in ARCHIVE_COLUMNS)).where(table.c.id.in_(ids))
+            )]
+            now = datetime.utcnow()
+            for row in rows:
+                row['created_at'] = row['created_at'] or now
+                row['archived_at'] = now
+
+            connection = db.session.connection()
+            ensure_partitions(connection, [row['created_at'] for row in rows], partitions)
+            db.session.execute(ArchivedVoucher.__table__.insert(), rows)
+            _add_summaries(connection, rows)
+            db.session.execute(table.delete().where(table.c.id.in_(ids)))
+            invalidate_after_commit(db.session(), [voucher_key(row['code']) for row in rows])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        archived += len(ids)
+        chunks += 1
+
+    if archived:
+        print(f"Archived {archived} vouchers older than {days} days")
+    return {
+        'dry_run': False,
+        'archived': archived,
+        'chunks': chunks,
+        'cutoff': cutoff.isoformat(),
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+
+def _add_summaries(connection, rows):
+    plans = VoucherPlan.__table__
+    plan_ids = {row['plan_id'] for row in rows if row['plan_id'] is not None}
+    voucher_types = dict(connection.execute(
+        db.select(plans.c.id, plans.c.voucher_type).where(plans.c.id.in_(plan_ids))
+    ).all()) if plan_ids else {}
+
+    pending = defaultdict(lambda: [0, 0.0])
+    for row in rows:
+        bucket = pending[(row['status'], voucher_types.get(row['plan_id']), row['batch_id'])]
+        bucket[0] += 1
+        bucket[1] += row['data_used_mb'] or 0.0
+
+    summary = VoucherArchiveSummary.__table__
+    connection.execute(summary.insert(), [{
+        'status': status,
+        'voucher_type': voucher_type,
+        'batch_id': batch_id,
+        'voucher_count': count,
+        'data_used_mb': data_used_mb
+    } for (status, voucher_type, batch_id), (count, data_used_mb) in pending.items()])
+
+def archived_count(status=None):
+    """Number of archived vouchers, from the summary rows"""
+    query = db.session.query(db.func.coalesce(db.func.sum(VoucherArchiveSummary.voucher_count), 0))
+    if status:
+        query = query.filter(VoucherArchiveSummary.status == status)
+    return int(query.scalar())
+
+def find_voucher(code):
+    """Voucher by code from the hot table, falling back to the archive
+
+    Archived vouchers come back as ArchivedVoucher, which has the same
+    read-only attributes and to_dict.
+    """
+    voucher = Voucher.query.filter_by(code=code).first()
+    if voucher is not None:
+        return voucher
+    return ArchivedVoucher.query.filter_by(code=code).order_by(ArchivedVoucher.archived_at.desc()).first()
@@ -1,8 +1,14 @@
+import uuid
+from datetime import datetime, timedelta
 from functools import wraps
-from flask import request, jsonify
+from flask import request, jsonify, current_app
 import jwt
-from models.user import User
 from config import Config
+from utils.cache import cache, load_user
+
+# Audience of stream tickets; tokens without it are rejected by
+# token_required and friends, so a ticket is no use as an API token
+STREAM_TICKET_AUDIENCE = 'event-stream'
 
 def token_required(f):
     """Decorator to require valid JWT token"""
@@ -18,7 +24,7 @@ def token_required(f):
                 token = token[7:]
             
             payload = jwt.decode(token, Config.JWT_SECRET_KEY, algorithms=['HS256'])
-            current_user = User.query.get(payload['user_id'])
+            current_user = load_user(payload['user_id'])
             
             if not current_user or not current_user.is_active:
                 return jsonify({'error': 'Invalid token'}), 401
@@ -46,7 +52,7 @@ def admin_required(f):
                 token = token[7:]
             
             payload = jwt.decode(token, Config.JWT_SECRET_KEY, algorithms=['HS256'])
-            current_user = User.query.get(payload['user_id'])
+            current_user = load_user(payload['user_id'])
             
             if not current_user or not current_user.is_active:
                 return jsonify({'error': 'Invalid token'}), 401
@@ -77,7 +83,7 @@ def operator_required(f):
                 token = token[7:]
             
             payload = jwt.decode(token, Config.JWT_SECRET_KEY, algorithms=['HS256'])
-            current_user = User.query.get(payload['user_id'])
+            current_user = load_user(payload['user_id'])
             
             if not current_user or not current_user.is_active:
                 return jsonify({'error': 'Invalid token'}), 401
@@ -93,3 +99,53 @@ def operator_required(f):
         return f(current_user, *args, **kwargs)
     
     return decorated
+
+def issue_stream_ticket(user):
+    """Short-lived single-use ticket for opening an event stream
+
+    EventSource cannot send an Authorization header, so the ticket travels in
+    the URL (and the access log) instead of the JWT.
+    """
+    ttl = current_app.config.get('EVENT_STREAM_TICKET_SECONDS', 30)
+    payload = {
+        'user_id': user.id,
+        'aud': STREAM_TICKET_AUDIENCE,
+        'jti': uuid.uuid4().hex,
+        'exp': datetime.utcnow() + timedelta(seconds=ttl)
+    }
+    return jwt.encode(payload, Config.JWT_SECRET_KEY, algorithm='HS256')
+
+def stream_token_required(f):
+    """Decorator for EventSource endpoints: a stream ticket in ?ticket= or a JWT header"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = request.headers.get('Authorization')
+        ticket = request.args.get('ticket')
+        
+        if not token and not ticket:
+            return jsonify({'error': 'Token is missing'}), 401
+        
+        try:
+            if ticket:
+                payload = jwt.decode(ticket, Config.JWT_SECRET_KEY, algorithms=['HS256'],
+                                     audience=STREAM_TICKET_AUDIENCE)
+                ttl = current_app.config.get('EVENT_STREAM_TICKET_SECONDS', 30)
+                if not cache.claim(f"stream-ticket:{payload['jti']}", ttl):
+                    return jsonify({'error': 'Ticket already used'}), 401
+            else:
+                if token.startswith('Bearer '):
+                    token = token[7:]
+                payload = jwt.decode(token, Config.JWT_SECRET_KEY, algorithms=['HS256'])
+            current_user = load_user(payload['user_id'])
+            
+            if not current_user or not current_user.is_active:
+                return jsonify({'error': 'Invalid token'}), 401
+                
+        except jwt.ExpiredSignatureError:
+            return jsonify({'error': 'Token has expired'}), 401
+        except jwt.InvalidTokenError:
+            return jsonify({'error': 'Invalid token'}), 401
+        
+        return f(current_user, *args, **kwargs)
+    
+    return decorated
@@ -0,0 +1,454 @@
+"""
+Shared Cache
+Two-level cache for hot lookups: a small per-process L1 in front of a shared
+L2 (Redis at REDIS_URL, or an in-memory store without Redis), kept coherent
+across workers and nodes by pub/sub invalidation sent after each commit.
+Without Redis, entries live no longer than the L1 TTL and Redis is retried
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session, make_transient_to_detached
+from utils.metrics import CACHE_LOOKUPS, CACHE_INVALIDATIONS
+
+CHANNEL = 'wifi-manager:cache-invalidate'
+
+# Cache keys
+ROUTERS_KEY = 'routers'
+
+def user_key(user_id):
+    return f"user:{user_id}"
+
+def voucher_key(code):
+    return f"voucher:{code}"
+
+def _encode_default(value):
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    raise TypeError(f"Cannot cache {type(value).__name__}")
+
+def _decode_hook(value):
+    if len(value) == 1 and '$dt' in value:
+        return datetime.fromisoformat(value['$dt'])
+    return value
+
+def encode(value):
+    return json.dumps(value, default=_encode_default, separators=(',', ':'))
+
+def decode(data):
+    return json.loads(data, object_hook=_decode_hook)
+
+class MemoryStore:
+    """In-process L2 for tests and deployments without Redis
+
+    Nothing is shared between processes, so the L1 is bypassed: there would be
+    no way to tell other workers' L1 copies about an invalidation. For the same
+    reason entries are kept only for the L1 TTL, which bounds how long another
+    worker's change can go unseen here.
+    """
+
+    shared = False
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        with self._lock:
+            values = []
+            for key in keys:
+                entry = self._data.get(key)
+                if entry and entry[1] < now:
+                    del self._data[key]
+                    entry = None
+                values.append(entry[0] if entry else None)
+            return values
+
+    def set(self, key, data, ttl):
+        with self._lock:
+            self._data[key] = (data, time.monotonic() + ttl)
+
+    def add(self, key, data, ttl):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry and entry[1] >= now:
+                return False
+            self._data[key] = (data, now + ttl)
+            return True
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def publish(self, message):
+        pass
+
+    def listen(self, callback):
+        pass
+
+    def close(self):
+        with self._lock:
+            self._data.clear()
+
+class RedisStore:
+    """Redis L2 plus the pub/sub invalidation channel"""
+
+    shared = True
+
+    def __init__(self, url, timeout=0.5):
+        import redis
+        self._redis = redis
+        self._client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self._client.ping()
+        self._listener = None
+        self._stopped = threading.Event()
+
+    def get_many(self, keys):
+        return self._client.mget(keys)
+
+    def set(self, key, data, ttl):
+        self._client.set(key, data, ex=max(1, int(ttl)))
+
+    def add(self, key, data, ttl):
+        return bool(self._client.set(key, data, ex=max(1, int(ttl)), nx=True))
+
+    def delete(self, keys):
+        self._client.delete(*keys)
+
+    def publish(self, message):
+        self._client.publish(CHANNEL, message)
+
+    def listen(self, callback):
+        """Deliver invalidation messages to callback on a background thread
+
+        After a dropped subscription messages may have been missed, so the
+        callback gets None, meaning "forget everything".
+        """
+        def run():
+            while not self._stopped.is_set():
+                pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+                try:
+                    pubsub.subscribe(CHANNEL)
+                    callback(None)
+                    while not self._stopped.is_set():
+                        message = pubsub.get_message(timeout=1.0)
+                        if message and message['type'] == 'message':
+                            callback(message['data'])
+                except self._redis.RedisError as e:
+                    print(f"Cache invalidation channel error: {e}")
+                    callback(None)
+                    self._stopped.wait(1.0)
+                finally:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+        self._listener = threading.Thread(target=run, name='cache-invalidation', daemon=True)
+        self._listener.start()
+
+    def close(self):
+        self._stopped.set()
+        self._client.close()
+
+class SharedCache:
+    """L1 (per process, short TTL) over L2 (shared), invalidated over pub/sub"""
+
+    def __init__(self):
+        self.enabled = False
+        self.ttl = 300
+        self.l1_ttl = 5
+        self.l1_size = 10000
+        self.retry_seconds = 10
+        self.url = None
+        self.store = None
+        self.origin = uuid.uuid4().hex
+        self._l1 = OrderedDict()
+        self._epochs = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._retry_at = None
+        self._unsent = set()
+
+    def configure(self, config):
+        self.enabled = config.get('CACHE_ENABLED', True)
+        self.ttl = config.get('CACHE_TTL_SECONDS', 300)
+        self.l1_ttl = config.get('CACHE_L1_TTL_SECONDS', 5)
+        self.l1_size = config.get('CACHE_L1_MAX_ENTRIES', 10000)
+        self.retry_seconds = config.get('CACHE_RETRY_SECONDS', 10)
+        self.url = config.get('CACHE_REDIS_URL') or None
+        if self.store is not None:
+            self.store.close()
+        self.store = None
+        self._pid = None
+        self._unsent = set()
+        self.clear_local()
+
+    def _store(self):
+        # Connections and the listener thread do not survive a fork
+        if (self.store is not None and self._pid == os.getpid()
+                and (self._retry_at is None or time.monotonic() < self._retry_at)):
+            return self.store
+        with self._lock:
+            if self.store is None or self._pid != os.getpid():
+                self._l1.clear()
+                self._unsent.clear()
+                self.store = MemoryStore()
+                self._pid = os.getpid()
+                self._retry_at = 0.0 if self.url else None
+            if self._retry_at is not None and time.monotonic() >= self._retry_at:
+                self._connect()
+        return self.store
+
+    def _connect(self):
+        """Switch to Redis; while it is unreachable the in-memory store is used
+        and the connection retried every retry_seconds (called with the lock held)"""
+        try:
+            store = RedisStore(self.url)
+        except ImportError:
+            print("redis package not installed; using the in-memory cache")
+            self._retry_at = None
+            return
+        except Exception as e:
+            print(f"Redis unavailable at {self.url} ({e}); using the in-memory cache")
+            self._retry_at = time.monotonic() + self.retry_seconds
+            return
+
+        # Invalidations made meanwhile never reached Redis or the other workers
+        if self._unsent:
+            keys = list(self._unsent)
+            try:
+                store.delete(keys)
+                store.publish(json.dumps({'origin': self.origin, 'keys': keys}))
+            except Exception as e:
+                print(f"Cache invalidation failed for {len(keys)} keys: {e}")
+            self._unsent.clear()
+        store.listen(self._on_message)
+        self.store = store
+        self._retry_at = None
+
+    def clear_local(self):
+        with self._lock:
+            self._l1.clear()
+
+    def _l1_get(self, key):
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self._l1[key]
+                return None
+            self._l1.move_to_end(key)
+            return entry
+
+    def _l1_put(self, key, value, epoch, local=True):
+        with self._lock:
+            # An invalidation landed while this value was being loaded
+            if self._epochs.get(key, 0) != epoch:
+                return False
+            if not local:
+                return True
+            self._l1[key] = (value, time.monotonic() + self.l1_ttl)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_size:
+                self._l1.popitem(last=False)
+            return True
+
+    def _forget(self, keys):
+        with self._lock:
+            for key in keys:
+                self._l1.pop(key, None)
+                self._epochs[key] = self._epochs.get(key, 0) + 1
+            if len(self._epochs) > self.l1_size * 4:
+                self._epochs.clear()
+
+    def get(self, key, loader=None, ttl=None):
+        """Cached value for key; on a miss loader() is called and its result cached
+
+        Values must be JSON-serializable (datetimes are allowed). A loader
+        returning None is not cached. Callers must not mutate the result.
+        """
+        if not self.enabled:
+            return loader() if loader else None
+
+        store = self._store()
+        if store.shared:
+            entry = self._l1_get(key)
+            if entry is not None:
+                CACHE_LOOKUPS.inc(level='l1', result='hit')
+                return entry[0]
+
+        with self._lock:
+            epoch = self._epochs.get(key, 0)
+        try:
+            data = store.get_many([key])[0]
+        except Exception as e:
+            print(f"Cache read failed for {key}: {e}")
+            data = None
+        if data is not None:
+            value = decode(data)
+            CACHE_LOOKUPS.inc(level='l2', result='hit')
+            if store.shared:
+                self._l1_put(key, value, epoch)
+            return value
+
+        CACHE_LOOKUPS.inc(level='l2', result='miss')
+        if loader is None:
+            return None
+        value = loader()
+        if value is not None:
+            self._set(store, key, value, ttl, epoch)
+        return value
+
+    def set(self, key, value, ttl=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            epoch = self._epochs.get(key, 0)
+        self._set(self._store(), key, value, ttl, epoch)
+
+    def _set(self, store, key, value, ttl, epoch):
+        if not self._l1_put(key, value, epoch, local=store.shared):
+            return
+        ttl = ttl or self.ttl
+        if not store.shared:
+            # Other workers cannot invalidate this copy
+            ttl = min(ttl, self.l1_ttl)
+        try:
+            store.set(key, encode(value), ttl)
+        except Exception as e:
+            print(f"Cache write failed for {key}: {e}")
+
+    def claim(self, key, ttl):
+        """True for the first caller to claim key within ttl seconds
+
+        Shared between workers through Redis; with the in-memory store (or
+        while Redis is unreachable) only within this process.
+        """
+        try:
+            return self._store().add(key, '1', ttl)
+        except Exception as e:
+            print(f"Cache claim failed for {key}: {e}")
+            return True
+
+    def invalidate(self, *keys):
+        """Drop keys everywhere: this process, the shared store and every other L1"""
+        keys = [key for key in keys if key is not None]
+        if not keys or not self.enabled:
+            return
+        self._forget(keys)
+        store = self._store()
+        if not store.shared and self._retry_at is not None:
+            # Sent to Redis once it is reachable again
+            with self._lock:
+                if len(self._unsent) < self.l1_size:
+                    self._unsent.update(keys)
+        try:
+            store.delete(keys)
+            store.publish(json.dumps({'origin': self.origin, 'keys': keys}))
+        except Exception as e:
+            print(f"Cache invalidation failed for {len(keys)} keys: {e}")
+        CACHE_INVALIDATIONS.inc(len(keys), source='local')
+
+    def _on_message(self, data):
+        if data is None:
+            self.clear_local()
+            return
+        try:
+            message = json.loads(data)
+        except ValueError:
+            return
+        if message.get('origin') == self.origin:
+            return
+        keys = message.get('keys') or []
+        self._forget(keys)
+        CACHE_INVALIDATIONS.inc(len(keys), source='remote')
+
+# Global cache instance
+cache = SharedCache()
+
+_hooks_installed = False
+
+def init_cache(app):
+    """Configure the shared cache from the app config"""
+    global _hooks_installed
+    cache.configure(app.config)
+    if not _hooks_installed:
+        install_model_hooks()
+        _hooks_installed = True
+
+def invalidate_after_commit(session, keys):
+    """Queue cache keys to invalidate once the session's transaction commits"""
+    if session is None:
+        cache.invalidate(*keys)
+        return
+    session.info.setdefault('cache_invalidations', set()).update(keys)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    keys = session.info.pop('cache_invalidations', None)
+    if keys:
+        cache.invalidate(*keys)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop('cache_invalidations', None)
+
+def _watch(model, keys_for):
+    def changed(mapper, connection, target):
+        invalidate_after_commit(object_session(target), keys_for(target))
+
+    for name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(model, name, changed)
+
+def install_model_hooks():
+    """Invalidate cached users, vouchers and routers when the ORM changes them
+
+    Bulk UPDATE paths report voucher changes through record_voucher_changes,
+    which queues the same invalidations.
+    """
+    from models.user import User
+    from models.voucher import Voucher
+    from models.router import Router
+
+    _watch(User, lambda user: [user_key(user.id)])
+    _watch(Voucher, lambda voucher: [voucher_key(voucher.code)])
+    _watch(Router, lambda router: [ROUTERS_KEY])
+
+def _snapshot(instance, exclude=()):
+    return {column.key: getattr(instance, column.key)
+            for column in instance.__mapper__.column_attrs if column.key not in exclude}
+
+def load_user(user_id):
+    """User for an authenticated request, without a query on cache hits
+
+    The cached row omits the password hash; it is loaded on first access.
+    """
+    from database import db
+    from models.user import User
+
+    def load():
+        user = User.query.get(user_id)
+        return _snapshot(user, exclude=('password_hash',)) if user else None
+
+    if not cache.enabled:
+        return User.query.get(user_id)
+
+    data = cache.get(user_key(user_id), load)
+    if data is None:
+        return None
+    # merge(load=False) attaches the snapshot without a SELECT and returns
+    # the session's own instance if the user is already loaded
+    user = User(**data)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
@@ -0,0 +1,17 @@
+"""
+Router Drivers
+Uniform async interface (provision, revoke, list_active, fetch_counters,
+health) over all router brands, run on a shared event loop
+"""
+
+from utils.drivers.base import RouterDriver, RouterEndpoint, HotspotUser, ActiveSession, DriverError
+from utils.drivers.runtime import (
+    driver_registry, get_driver_class, driver_runtime,
+    provision_on_routers, revoke_on_routers, fetch_router_counters, check_router_health
+)
+
+__all__ = [
+    'RouterDriver', 'RouterEndpoint', 'HotspotUser', 'ActiveSession', 'DriverError',
+    'driver_registry', 'get_driver_class', 'driver_runtime',
+    'provision_on_routers', 'revoke_on_routers', 'fetch_router_counters', 'check_router_health'
+]
@@ -0,0 +1,109 @@
+"""
+Router Driver Interface
+Brand-independent async API for pushing users to routers and reading back
+their sessions; every driver implements the same batch operations
+"""
+
+import time
+from collections import namedtuple
+
+class DriverError(Exception):
+    """A router rejected a command or could not be reached"""
+
+class RouterEndpoint(namedtuple('RouterEndpoint', ['id', 'brand', 'host', 'port', 'username', 'password'])):
+    """Connection details of a router, detached from the database session"""
+
+    __slots__ = ()
+
+    @classmethod
+    def from_router(cls, router):
+        return cls(router.id, router.brand, router.ip_address, router.get_api_port(),
+                   router.username, router.password)
+
+class HotspotUser(namedtuple('HotspotUser', ['username', 'password', 'rate_limit', 'duration_minutes', 'quota_mb'])):
+    """A user to provision; `rate_limit` is a utils.rate_limits.RateLimit or None"""
+
+    __slots__ = ()
+
+    @classmethod
+    def from_voucher(cls, voucher, rate_limit=None, now=None):
+        """User for a voucher, limited to the time and quota left in its session"""
+        duration_minutes, quota_mb = voucher.session_allowance(now)
+        return cls(voucher.code, voucher.session_token, rate_limit, duration_minutes, quota_mb)
+
+# One authenticated client on a router; counters are in bytes from the router's view
+ActiveSession = namedtuple('ActiveSession', ['username', 'mac', 'ip', 'bytes_in', 'bytes_out', 'uptime_seconds'])
+
+class RouterDriver:
+    """Base class for async router drivers
+
+    Drivers keep their connection open between calls; the runtime caches one
+    driver per router and reconnects when a call fails.
+    """
+
+    brand = None
+
+    def __init__(self, endpoint, timeout=10):
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    async def connect(self):
+        """Open and authenticate the connection (no-op when already connected)"""
+        raise NotImplementedError
+
+    async def close(self):
+        """Release the connection"""
+
+    @property
+    def connected(self):
+        return False
+
+    async def provision(self, users):
+        """Add HotspotUsers; returns {username: success}
+
+        A user that already exists counts as provisioned, so a logged
+        operation can be replayed after its acknowledgement was lost.
+        """
+        raise NotImplementedError
+
+    async def revoke(self, usernames):
+        """Remove users and end their sessions; returns {username: success}
+
+        A user that is not on the router counts as removed.
+        """
+        raise NotImplementedError
+
+    async def list_active(self):
+        """Currently authenticated clients as ActiveSessions"""
+        raise NotImplementedError
+
+    async def list_users(self):
+        """Usernames currently provisioned on the router, in one bulk read"""
+        raise NotImplementedError
+
+    async def fetch_counters(self):
+        """Traffic counters by username: {username: (bytes_in, bytes_out)}"""
+        return {session.username: (session.bytes_in, session.bytes_out)
+                for session in await self.list_active() if session.username}
+
+    async def health(self):
+        """Reachability and round-trip time of the router"""
+        start = time.perf_counter()
+        try:
+            await self.connect()
+            return {'ok': True, 'latency_ms': round((time.perf_counter() - start) * 1000, 1)}
+        except Exception as e:
+            return {'ok': False, 'error': str(e)}
+
+    async def provision_one(self, user):
+        return (await self.provision([user])).get(user.username, False)
+
+    async def revoke_one(self, username):
+        return (await self.revoke([username])).get(username, False)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
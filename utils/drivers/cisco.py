@@ -0,0 +1,220 @@
+"""
+Cisco Driver
+Keeps one authenticated SSH transport and interactive shell per router and
+batches configuration lines into a single `configure terminal` session, so
+bulk user changes cost one handshake instead of one per command
+"""
+
+import asyncio
+import re
+import socket
+import threading
+import time
+from utils.drivers.base import RouterDriver, DriverError
+from utils.metrics import timed_driver_call
+
+CONFIRM = re.compile(r'(\[confirm\]|\[yes/no\]:?)\s*$')
+ERROR = re.compile(r'^\s*%\s*(Invalid|Incomplete|Ambiguous|Unknown|Error|Bad)\b', re.IGNORECASE | re.MULTILINE)
+_UNSAFE = re.compile(r'[\s?]')
+
+class CiscoShell:
+    """A persistent interactive IOS shell with prompt detection (blocking)"""
+
+    def __init__(self, endpoint, timeout=10):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.hostname = None
+        self._client = None
+        self._channel = None
+        self._prompt = None
+        self._lock = threading.RLock()
+
+    @property
+    def alive(self):
+        return (self._channel is not None and not self._channel.closed
+                and self._client.get_transport() is not None and self._client.get_transport().is_active())
+
+    def open(self):
+        import paramiko
+
+        with self._lock:
+            if self.alive:
+                return True
+            self.close()
+            client = paramiko.SSHClient()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            try:
+                client.connect(
+                    hostname=self.endpoint.host,
+                    port=self.endpoint.port,
+                    username=self.endpoint.username,
+                    password=self.endpoint.password,
+                    timeout=self.timeout,
+                    look_for_keys=False,
+                    allow_agent=False
+                )
+            except Exception as e:
+                client.close()
+                raise DriverError(f"SSH connection failed: {e}")
+            client.get_transport().set_keepalive(30)  # Keep idle sessions from being dropped
+
+            self._client = client
+            self._channel = client.invoke_shell(width=511, height=0)
+            self._channel.settimeout(self.timeout)
+
+            # Learn the hostname from the first prompt, e.g. "Router#" or "Router>"
+            banner = self._read_until(re.compile(r'([\w.\-@]+)(\([\w\-]+\))?[>#]\s*$'))
+            self.hostname = re.search(r'([\w.\-@]+)(\([\w\-]+\))?[>#]\s*$', banner).group(1)
+            self._prompt = re.compile(re.escape(self.hostname) + r'(\((?P<mode>[\w\-]+)\))?[>#]\s*$')
+            self.command('terminal length 0')
+            self.command('terminal width 0')
+            return True
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                try:
+                    self._client.close()
+                except Exception:
+                    pass
+            self._client = None
+            self._channel = None
+
+    def _read_until(self, pattern, deadline=None):
+        deadline = deadline or time.monotonic() + self.timeout
+        buffer = ''
+        while True:
+            if pattern.search(buffer[-256:]):
+                return buffer
+            if time.monotonic() > deadline:
+                raise DriverError(f"Timed out waiting for prompt from {self.endpoint.host}")
+            try:
+                data = self._channel.recv(65535)
+            except socket.timeout:
+                continue
+            if not data:
+                raise DriverError(f"Shell closed by {self.endpoint.host}")
+            buffer += data.decode('utf-8', 'replace').replace('\r', '')
+
+    def _read_response(self):
+        """Read to the next prompt, answering [confirm] questions with Enter"""
+        either = re.compile(f'(?:{self._prompt.pattern})|(?:{CONFIRM.pattern})')
+        output = self._read_until(either)
+        while CONFIRM.search(output[-64:]):
+            self._channel.sendall('\n')
+            output += self._read_until(either)
+        return output
+
+    def _read_responses(self, count, deadline):
+        """Read `count` pipelined responses, splitting the stream at each prompt"""
+        prompt = re.compile(re.escape(self.hostname) + r'(\([\w\-]+\))?[>#]')
+        buffer = ''
+        while True:
+            ends = [match.start() for match in prompt.finditer(buffer)]
+            if len(ends) >= count:
+                starts = [0] + [match.end() for match in prompt.finditer(buffer)][:count - 1]
+                return [buffer[start:end] for start, end in zip(starts, ends[:count])]
+            if time.monotonic() > deadline:
+                raise DriverError(f"Timed out waiting for prompt from {self.endpoint.host}")
+            try:
+                data = self._channel.recv(65535)
+            except socket.timeout:
+                continue
+            if not data:
+                raise DriverError(f"Shell closed by {self.endpoint.host}")
+            buffer += data.decode('utf-8', 'replace').replace('\r', '')
+
+    def command(self, line):
+        """Run one line and return its output (without the trailing prompt)"""
+        with self._lock:
+            self._channel.sendall(line + '\n')
+            output = self._read_response()
+            return self._prompt.sub('', output).strip()
+
+    def configure(self, lines, pipeline=True):
+        """Apply config lines in one configure session; returns {line: success}
+
+        With `pipeline` all lines are written at once and the device works
+        through them at its own pace; without it each line waits for its
+        prompt (needed when commands may ask for confirmation).
+        """
+        if not lines:
+            return {}
+        with self._lock:
+            self.command('configure terminal')
+            try:
+                if pipeline:
+                    self._channel.sendall('\n'.join(lines) + '\n')
+                    responses = self._read_responses(len(lines), time.monotonic() + self.timeout + len(lines) * 0.05)
+                else:
+                    responses = []
+                    for line in lines:
+                        self._channel.sendall(line + '\n')
+                        responses.append(self._read_response())
+            finally:
+                self.command('end')
+
+        # Responses arrive in order; each one ends at the prompt following its line
+        return {line: not ERROR.search(response) for line, response in zip(lines, responses)}
+
+    def usernames(self):
+        """Local usernames configured on the device"""
+        output = self.command('show running-config | include ^username')
+        return {line.split()[1] for line in output.splitlines() if line.startswith('username ') and len(line.split()) > 1}
+
+def _safe(value):
+    """Reject values that would break out of a single CLI line"""
+    return bool(value) and not _UNSAFE.search(str(value))
+
+class CiscoDriver(RouterDriver):
+    """Cisco IOS local users over a persistent SSH shell"""
+
+    brand = 'Cisco'
+
+    def __init__(self, endpoint, timeout=10):
+        super().__init__(endpoint, timeout)
+        self.shell = CiscoShell(endpoint, timeout)
+
+    @property
+    def connected(self):
+        return self.shell.alive
+
+    @timed_driver_call('connect')
+    async def connect(self):
+        if self.connected:
+            return True
+        return await asyncio.to_thread(self.shell.open)
+
+    async def close(self):
+        await asyncio.to_thread(self.shell.close)
+
+    @timed_driver_call('provision')
+    async def provision(self, users):
+        await self.connect()
+        lines = {}
+        for user in users:
+            if _safe(user.username) and _safe(user.password):
+                lines[user.username] = f"username {user.username} privilege 1 secret 0 {user.password}"
+        applied = await asyncio.to_thread(self.shell.configure, list(lines.values()))
+        return {user.username: applied.get(lines.get(user.username), False) for user in users}
+
+    @timed_driver_call('revoke')
+    async def revoke(self, usernames):
+        await self.connect()
+        existing = await asyncio.to_thread(self.shell.usernames)
+        lines = {username: f"no username {username}" for username in usernames
+                 if username in existing and _safe(username)}
+        # Removal may ask for confirmation, so lines are sent one at a time (same session)
+        applied = await asyncio.to_thread(self.shell.configure, list(lines.values()), False)
+        # Users that were not there are gone all the same
+        return {username: username not in lines or applied.get(lines[username], False) for username in usernames}
+
+    @timed_driver_call('list_users')
+    async def list_users(self):
+        await self.connect()
+        return await asyncio.to_thread(self.shell.usernames)
+
+    @timed_driver_call('list_active')
+    async def list_active(self):
+        # IOS local users carry no per-client session counters
+        return []
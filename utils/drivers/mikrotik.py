@@ -0,0 +1,277 @@
+"""
+MikroTik Driver
+Native asyncio RouterOS API client. Commands are tagged and pipelined over a
+single connection, so a batch of users costs one round trip, not one each.
+"""
+
+import asyncio
+import itertools
+from utils.drivers.base import RouterDriver, ActiveSession, DriverError
+from utils.metrics import timed_driver_call
+from utils.rate_limits import DEFAULT_PROFILE
+
+def encode_length(length):
+    """Encode a RouterOS API word length"""
+    if length < 0x80:
+        return bytes([length])
+    if length < 0x4000:
+        return (length | 0x8000).to_bytes(2, 'big')
+    if length < 0x200000:
+        return (length | 0xC00000).to_bytes(3, 'big')
+    if length < 0x10000000:
+        return (length | 0xE0000000).to_bytes(4, 'big')
+    return b'\xf0' + length.to_bytes(4, 'big')
+
+def encode_sentence(words):
+    data = bytearray()
+    for word in words:
+        raw = word.encode('utf-8')
+        data += encode_length(len(raw)) + raw
+    data += b'\x00'
+    return bytes(data)
+
+async def read_length(reader):
+    first = (await reader.readexactly(1))[0]
+    if first < 0x80:
+        return first
+    if first < 0xC0:
+        return ((first & 0x3F) << 8) | (await reader.readexactly(1))[0]
+    if first < 0xE0:
+        return ((first & 0x1F) << 16) | int.from_bytes(await reader.readexactly(2), 'big')
+    if first < 0xF0:
+        return ((first & 0x0F) << 24) | int.from_bytes(await reader.readexactly(3), 'big')
+    return int.from_bytes(await reader.readexactly(4), 'big')
+
+async def read_sentence(reader):
+    words = []
+    while True:
+        length = await read_length(reader)
+        if length == 0:
+            return words
+        words.append((await reader.readexactly(length)).decode('utf-8', 'replace'))
+
+def parse_uptime(value):
+    """RouterOS durations like '1w2d3h4m5s' to seconds"""
+    units = {'w': 604800, 'd': 86400, 'h': 3600, 'm': 60, 's': 1}
+    total, number = 0, ''
+    for char in value or '':
+        if char.isdigit():
+            number += char
+        elif char in units and number:
+            total += int(number) * units[char]
+            number = ''
+    return total
+
+def user_exists(error):
+    """True for RouterOS's duplicate-name failure on /ip/hotspot/user/add"""
+    return 'already have' in str(error)
+
+class MikroTikDriver(RouterDriver):
+    """Hotspot users on RouterOS via the binary API (port 8728)"""
+
+    brand = 'MikroTik'
+
+    def __init__(self, endpoint, timeout=10):
+        super().__init__(endpoint, timeout)
+        self._reader = None
+        self._writer = None
+        self._read_task = None
+        self._pending = {}
+        self._tags = itertools.count(1)
+        self._profiles = set()  # Profile names known to exist on the router
+        self._connect_lock = asyncio.Lock()
+
+    @property
+    def connected(self):
+        return self._writer is not None and not self._writer.is_closing()
+
+    @timed_driver_call('connect')
+    async def connect(self):
+        async with self._connect_lock:
+            if self.connected:
+                return True
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.endpoint.host, self.endpoint.port), self.timeout)
+            self._read_task = asyncio.ensure_future(self._read_replies())
+            try:
+                await self._call('/login', {'name': self.endpoint.username, 'password': self.endpoint.password})
+            except Exception:
+                await self.close()
+                raise
+            return True
+
+    async def close(self):
+        writer, self._writer = self._writer, None
+        if self._read_task:
+            self._read_task.cancel()
+            self._read_task = None
+        if writer:
+            writer.close()
+        self._fail_pending(DriverError('connection closed'))
+
+    async def call(self, command, attributes=None, queries=()):
+        """Run one API command; returns the `!re` replies as dicts"""
+        if not self.connected:
+            await self.connect()
+        return await self._call(command, attributes, queries)
+
+    async def _call(self, command, attributes=None, queries=()):
+        tag = str(next(self._tags))
+        future = asyncio.get_running_loop().create_future()
+        self._pending[tag] = ([], future)
+
+        words = [command]
+        words.extend(f'={key}={value}' for key, value in (attributes or {}).items())
+        words.extend(queries)
+        words.append(f'.tag={tag}')
+        self._writer.write(encode_sentence(words))
+        try:
+            await self._writer.drain()
+            return await asyncio.wait_for(future, self.timeout)
+        finally:
+            self._pending.pop(tag, None)
+
+    async def _read_replies(self):
+        try:
+            while True:
+                words = await read_sentence(self._reader)
+                if not words:
+                    continue
+                reply, attributes, tag = words[0], {}, None
+                for word in words[1:]:
+                    if word.startswith('.tag='):
+                        tag = word[5:]
+                    elif word.startswith('='):
+                        key, _, value = word[1:].partition('=')
+                        attributes[key] = value
+
+                if reply == '!fatal':
+                    raise DriverError(attributes.get('message') or ' '.join(words[1:]))
+                entry = self._pending.get(tag)
+                if entry is None:
+                    continue
+                replies, future = entry
+                if reply == '!re':
+                    replies.append(attributes)
+                elif reply == '!trap':
+                    replies.append(DriverError(attributes.get('message', 'command failed')))
+                elif reply == '!done':
+                    errors = [r for r in replies if isinstance(r, DriverError)]
+                    if not future.done():
+                        if errors:
+                            future.set_exception(errors[0])
+                        else:
+                            future.set_result(replies or ([attributes] if attributes else []))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._writer = None
+            self._fail_pending(e if isinstance(e, DriverError) else DriverError(f'connection lost: {e}'))
+
+    def _fail_pending(self, error):
+        for _, future in list(self._pending.values()):
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+
+    async def _ensure_profiles(self, limits):
+        """Create shared rate-limit profiles missing on the router; returns the usable ones"""
+        missing = {limit for limit in limits if limit.profile_name not in self._profiles}
+        if missing:
+            existing = await self.call('/ip/hotspot/user/profile/print', {'.proplist': 'name'})
+            self._profiles.update(profile['name'] for profile in existing)
+            to_create = [limit for limit in missing if limit.profile_name not in self._profiles]
+            results = await asyncio.gather(*(
+                self.call('/ip/hotspot/user/profile/add',
+                          {'name': limit.profile_name, 'rate-limit': limit.mikrotik_rate_limit})
+                for limit in to_create
+            ), return_exceptions=True)
+            for limit, result in zip(to_create, results):
+                if isinstance(result, Exception):
+                    print(f"Error adding hotspot profile {limit.profile_name}: {result}")
+                else:
+                    self._profiles.add(limit.profile_name)
+        return {limit for limit in limits if limit.profile_name in self._profiles}
+
+    @timed_driver_call('provision')
+    async def provision(self, users):
+        await self.connect()
+        limits = {user.rate_limit for user in users if user.rate_limit is not None}
+        available = await self._ensure_profiles(limits) if limits else set()
+
+        def profile_for(user):
+            # Fall back to the default profile rather than failing activation
+            return user.rate_limit.profile_name if user.rate_limit in available else DEFAULT_PROFILE
+
+        results = await asyncio.gather(*(
+            self.call('/ip/hotspot/user/add', {
+                'name': user.username,
+                'password': user.password,
+                'profile': profile_for(user),
+                'limit-uptime': f"{user.duration_minutes}m",
+                **({'limit-bytes-total': user.quota_mb * 1024 * 1024} if user.quota_mb else {})
+            })
+            for user in users
+        ), return_exceptions=True)
+
+        outcome = {}
+        for user, result in zip(users, results):
+            if isinstance(result, Exception) and not user_exists(result):
+                print(f"Error adding hotspot user {user.username}: {result}")
+                outcome[user.username] = False
+            else:
+                outcome[user.username] = True
+        return outcome
+
+    @timed_driver_call('revoke')
+    async def revoke(self, usernames):
+        await self.connect()
+        wanted = set(usernames)
+        accounts, sessions = await asyncio.gather(
+            self.call('/ip/hotspot/user/print', {'.proplist': '.id,name'}),
+            self.call('/ip/hotspot/active/print', {'.proplist': '.id,user'})
+        )
+        user_ids = [user['.id'] for user in accounts if user.get('name') in wanted]
+        session_ids = [session['.id'] for session in sessions if session.get('user') in wanted]
+
+        # Kick live sessions first so removed users cannot keep browsing
+        if session_ids:
+            await self.call('/ip/hotspot/active/remove', {'.id': ','.join(session_ids)})
+        if user_ids:
+            await self.call('/ip/hotspot/user/remove', {'.id': ','.join(user_ids)})
+
+        # Users that were not there are gone all the same
+        return {username: True for username in usernames}
+
+    @timed_driver_call('list_users')
+    async def list_users(self):
+        await self.connect()
+        users = await self.call('/ip/hotspot/user/print', {'.proplist': 'name'})
+        return {user['name'] for user in users if user.get('name')}
+
+    @timed_driver_call('list_active')
+    async def list_active(self):
+        await self.connect()
+        sessions = await self.call('/ip/hotspot/active/print', {
+            '.proplist': 'user,mac-address,address,bytes-in,bytes-out,uptime'
+        })
+        return [ActiveSession(
+            session.get('user'),
+            session.get('mac-address'),
+            session.get('address'),
+            int(session.get('bytes-in') or 0),
+            int(session.get('bytes-out') or 0),
+            parse_uptime(session.get('uptime'))
+        ) for session in sessions]
+
+    @timed_driver_call('health')
+    async def health(self):
+        status = await super().health()
+        if status['ok']:
+            try:
+                resource = await self.call('/system/resource/print', {'.proplist': 'uptime,cpu-load,version'})
+                if resource:
+                    status.update(resource[0])
+            except DriverError as e:
+                status.update(ok=False, error=str(e))
+        return status
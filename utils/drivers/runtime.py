@@ -0,0 +1,148 @@
+"""
+Driver Runtime
+One background event loop per process that owns every driver connection,
+so a single thread can drive hundreds of routers concurrently. Request
+handlers and the monitor call the blocking helpers at the bottom.
+"""
+
+import asyncio
+import os
+import threading
+from config import Config
+from utils.drivers.base import RouterEndpoint, HotspotUser, DriverError
+from utils.plugins import PluginRegistry
+from utils.rate_limits import get_voucher_rate_limit
+
+ENTRY_POINT_GROUP = 'wifi_network_manager.router_drivers'
+
+# Built-in drivers; installed packages can add brands via ENTRY_POINT_GROUP
+driver_registry = PluginRegistry('router driver')
+driver_registry.register('MikroTik', 'utils.drivers.mikrotik:MikroTikDriver')
+driver_registry.register('Ubiquiti', 'utils.drivers.unifi:UniFiDriver')
+driver_registry.register('Cisco', 'utils.drivers.cisco:CiscoDriver')
+
+_entry_points_loaded = False
+
+def get_driver_class(brand):
+    """Driver class for a router brand"""
+    global _entry_points_loaded
+    if not _entry_points_loaded:
+        driver_registry.load_entry_points(ENTRY_POINT_GROUP)
+        _entry_points_loaded = True
+    if brand not in driver_registry:
+        raise DriverError(f"Unsupported router brand: {brand}")
+    return driver_registry.get(brand)
+
+class DriverRuntime:
+    """Event loop thread plus a cache of connected drivers keyed by endpoint"""
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._drivers = {}
+
+    def _ensure_loop(self):
+        with self._lock:
+            # A forked worker inherits the object but not the thread
+            if self._loop is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return self._loop
+            self._loop = asyncio.new_event_loop()
+            self._drivers = {}
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._loop.run_forever, name='router-drivers', daemon=True)
+            self._thread.start()
+            return self._loop
+
+    def run(self, coroutine, timeout=None):
+        """Run a coroutine on the driver loop and wait for its result"""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result(timeout)
+
+    async def driver_for(self, endpoint):
+        """Cached driver for an endpoint (runs on the driver loop)"""
+        driver = self._drivers.get(endpoint)
+        if driver is None:
+            # Credentials or address changed: drop the stale connection
+            for stale in [key for key in self._drivers if key.id == endpoint.id]:
+                await self.discard(stale)
+            driver = self._drivers[endpoint] = get_driver_class(endpoint.brand)(
+                endpoint, timeout=Config.ROUTER_DRIVER_TIMEOUT)
+        return driver
+
+    async def discard(self, endpoint):
+        driver = self._drivers.pop(endpoint, None)
+        if driver is not None:
+            try:
+                await driver.close()
+            except Exception:
+                pass
+
+    async def call(self, endpoint, operation, *args):
+        """Run a driver operation, reconnecting once if the connection went stale"""
+        for attempt in (1, 2):
+            driver = await self.driver_for(endpoint)
+            try:
+                return await getattr(driver, operation)(*args)
+            except (DriverError, OSError, asyncio.TimeoutError) as e:
+                await self.discard(endpoint)
+                if attempt == 2:
+                    raise
+                print(f"Router {endpoint.host} {operation} failed ({e}), reconnecting")
+
+    async def fan_out(self, jobs, operation):
+        """Run `operation` on many routers concurrently; jobs are (endpoint, args)"""
+        limit = asyncio.Semaphore(Config.ROUTER_DRIVER_CONCURRENCY)
+
+        async def run_job(endpoint, args):
+            async with limit:
+                try:
+                    return endpoint.id, await self.call(endpoint, operation, *args)
+                except Exception as e:
+                    print(f"Error running {operation} on router {endpoint.host}: {e}")
+                    return endpoint.id, e
+
+        return dict(await asyncio.gather(*(run_job(endpoint, args) for endpoint, args in jobs)))
+
+# Global runtime instance
+driver_runtime = DriverRuntime()
+
+def provision_on_routers(routers, vouchers):
+    """Provision vouchers on every router concurrently
+
+    Rate limits are resolved per router from its networks. Returns
+    {router_id: {code: success}}; unreachable routers map every code to False.
+    """
+    jobs = []
+    for router in routers:
+        networks = list(router.networks)
+        users = [HotspotUser.from_voucher(voucher, get_voucher_rate_limit(voucher, networks))
+                 for voucher in vouchers]
+        jobs.append((RouterEndpoint.from_router(router), (users,)))
+
+    results = driver_runtime.run(driver_runtime.fan_out(jobs, 'provision'))
+    codes = [voucher.code for voucher in vouchers]
+    return {router_id: result if isinstance(result, dict) else dict.fromkeys(codes, False)
+            for router_id, result in results.items()}
+
+def revoke_on_routers(routers, usernames):
+    """Remove users from every router concurrently; returns {router_id: {username: success}}"""
+    usernames = list(usernames)
+    jobs = [(RouterEndpoint.from_router(router), (usernames,)) for router in routers]
+    results = driver_runtime.run(driver_runtime.fan_out(jobs, 'revoke'))
+    return {router_id: result if isinstance(result, dict) else dict.fromkeys(usernames, False)
+            for router_id, result in results.items()}
+
+def fetch_router_counters(routers):
+    """Traffic counters from every router: {router_id: {username: (bytes_in, bytes_out)}}"""
+    jobs = [(RouterEndpoint.from_router(router), ()) for router in routers]
+    results = driver_runtime.run(driver_runtime.fan_out(jobs, 'fetch_counters'))
+    return {router_id: result for router_id, result in results.items() if isinstance(result, dict)}
+
+def check_router_health(routers):
+    """Health of every router: {router_id: {'ok': bool, ...}}"""
+    jobs = [(RouterEndpoint.from_router(router), ()) for router in routers]
+    results = driver_runtime.run(driver_runtime.fan_out(jobs, 'health'))
+    return {router_id: result if isinstance(result, dict) else {'ok': False, 'error': str(result)}
+            for router_id, result in results.items()}
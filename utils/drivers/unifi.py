@@ -0,0 +1,209 @@
+"""
+UniFi Driver
+Async UniFi controller client on aiohttp: one logged-in session per
+controller (re-authenticated only on 401), a TTL-cached site name, and guest
+vouchers created concurrently over a sized keep-alive connection pool
+"""
+
+import asyncio
+import time
+from config import Config
+from utils.drivers.base import RouterDriver, ActiveSession, DriverError
+from utils.metrics import timed_driver_call
+
+class UniFiDriver(RouterDriver):
+    """Guest access on a UniFi controller's hotspot API"""
+
+    brand = 'Ubiquiti'
+
+    def __init__(self, endpoint, timeout=10):
+        super().__init__(endpoint, timeout)
+        self.base_url = f"{Config.UNIFI_SCHEME}://{endpoint.host}:{endpoint.port}"
+        self.site = None
+        self._site_fetched_at = 0.0
+        self._session = None
+        self._logged_in = False
+        self._connect_lock = asyncio.Lock()
+        self._requests = asyncio.Semaphore(Config.UNIFI_MAX_CONNECTIONS)
+
+    @property
+    def connected(self):
+        return self._session is not None and not self._session.closed and self._logged_in
+
+    @timed_driver_call('connect')
+    async def connect(self):
+        async with self._connect_lock:
+            if self.connected:
+                return True
+            import aiohttp
+
+            if self._session is None or self._session.closed:
+                self._session = aiohttp.ClientSession(
+                    # Controllers are usually addressed by IP, which the default jar ignores
+                    cookie_jar=aiohttp.CookieJar(unsafe=True),
+                    connector=aiohttp.TCPConnector(
+                        ssl=False,
+                        limit=Config.UNIFI_MAX_CONNECTIONS,
+                        keepalive_timeout=60
+                    ),
+                    timeout=aiohttp.ClientTimeout(total=self.timeout)
+                )
+            await self._login()
+            return True
+
+    async def close(self):
+        session, self._session = self._session, None
+        self._logged_in = False
+        self.site = None
+        if session is not None:
+            await session.close()
+
+    async def _login(self):
+        self._logged_in = False
+        async with self._session.post(f"{self.base_url}/api/login", json={
+            'username': self.endpoint.username,
+            'password': self.endpoint.password
+        }) as response:
+            if response.status != 200:
+                raise DriverError(f"UniFi login failed with HTTP {response.status}")
+        self._logged_in = True
+
+    async def _request(self, method, path, payload=None):
+        """Call the controller API; returns the `data` list
+
+        An expired cookie (401) triggers one login and retry; every other call
+        rides on the existing session.
+        """
+        for attempt in (1, 2):
+            async with self._requests:
+                async with self._session.request(method, f"{self.base_url}{path}", json=payload) as response:
+                    status = response.status
+                    body = await response.json(content_type=None) if status == 200 else None
+            if status == 401 and attempt == 1:
+                async with self._connect_lock:
+                    await self._login()
+                continue
+            if status != 200:
+                raise DriverError(f"UniFi {path} returned HTTP {status}")
+            break
+
+        meta = body.get('meta', {})
+        if meta.get('rc') not in (None, 'ok'):
+            raise DriverError(meta.get('msg') or f"UniFi {path} failed")
+        return body.get('data') or []
+
+    async def _get_site(self):
+        """Site name (usually 'default'), cached for UNIFI_SITE_CACHE_SECONDS"""
+        if self.site is None or time.monotonic() - self._site_fetched_at >= Config.UNIFI_SITE_CACHE_SECONDS:
+            sites = await self._request('GET', '/api/self/sites')
+            self.site = sites[0]['name'] if sites else 'default'
+            self._site_fetched_at = time.monotonic()
+        return self.site
+
+    async def _site_path(self, suffix):
+        return f"/api/s/{await self._get_site()}/{suffix}"
+
+    @timed_driver_call('provision')
+    async def provision(self, users):
+        await self.connect()
+
+        async def create(user):
+            # Create guest voucher (0 means unlimited)
+            await self._request('POST', await self._site_path('cmd/hotspot'), {
+                'cmd': 'create-voucher',
+                'name': user.username,
+                'password': user.password,
+                'duration': user.duration_minutes,
+                'quota': 0,
+                'bytes': user.quota_mb,
+                'up': user.rate_limit.upload_kbps if user.rate_limit else 0,
+                'down': user.rate_limit.download_kbps if user.rate_limit else 0
+            })
+
+        results = await asyncio.gather(*(create(user) for user in users), return_exceptions=True)
+        outcome = {}
+        for user, result in zip(users, results):
+            if isinstance(result, Exception):
+                print(f"Error adding guest user {user.username}: {result}")
+            outcome[user.username] = not isinstance(result, Exception)
+        return outcome
+
+    async def stations(self, macs=None):
+        """Connected stations in one read; optionally only the given MACs"""
+        if macs:
+            return await self._request('POST', await self._site_path('stat/sta'), {'macs': list(macs)})
+        return await self._request('GET', await self._site_path('stat/sta'))
+
+    @timed_driver_call('create_vouchers')
+    async def create_vouchers(self, count, duration_minutes=1440, quota_mb=0, down_kbps=0, up_kbps=0, note=None):
+        """Create `count` controller-generated vouchers in one request; returns their records"""
+        await self.connect()
+        created = await self._request('POST', await self._site_path('cmd/hotspot'), {
+            'cmd': 'create-voucher',
+            'n': count,
+            'quota': 1,
+            'expire': duration_minutes,
+            'bytes': quota_mb,
+            'up': up_kbps,
+            'down': down_kbps,
+            'note': note
+        })
+        create_time = created[0].get('create_time') if created else None
+        vouchers = await self._request('GET', await self._site_path('stat/voucher'))
+        return [voucher for voucher in vouchers
+                if create_time is None or voucher.get('create_time') == create_time]
+
+    @timed_driver_call('revoke')
+    async def revoke(self, usernames):
+        await self.connect()
+        wanted = set(usernames)
+        stations, vouchers = await asyncio.gather(
+            self.stations(),
+            self._request('GET', await self._site_path('stat/voucher'))
+        )
+        macs = {}
+        for station in stations:
+            username = station.get('voucher_code') or station.get('name')
+            if station.get('is_guest') and username in wanted:
+                macs.setdefault(username, []).append(station['mac'])
+        voucher_ids = {}
+        for voucher in vouchers:
+            username = voucher.get('name') or voucher.get('code')
+            if username in wanted:
+                voucher_ids.setdefault(username, []).append(voucher['_id'])
+
+        async def unauthorize(mac):
+            await self._request('POST', await self._site_path('cmd/stamgr'), {'cmd': 'unauthorize-guest', 'mac': mac})
+
+        async def delete(voucher_id):
+            await self._request('POST', await self._site_path('cmd/hotspot'), {'cmd': 'delete-voucher', '_id': voucher_id})
+
+        async def remove(username):
+            # Kick live stations first so a removed guest cannot keep browsing
+            results = await asyncio.gather(*(unauthorize(mac) for mac in macs.get(username, [])),
+                                           return_exceptions=True)
+            results += await asyncio.gather(*(delete(voucher_id) for voucher_id in voucher_ids.get(username, [])),
+                                            return_exceptions=True)
+            return not any(isinstance(result, Exception) for result in results)
+
+        usernames = list(usernames)
+        return dict(zip(usernames, await asyncio.gather(*(remove(username) for username in usernames))))
+
+    @timed_driver_call('list_users')
+    async def list_users(self):
+        await self.connect()
+        vouchers = await self._request('GET', await self._site_path('stat/voucher'))
+        return {voucher.get('name') or voucher.get('code') for voucher in vouchers
+                if voucher.get('name') or voucher.get('code')}
+
+    @timed_driver_call('list_active')
+    async def list_active(self):
+        await self.connect()
+        return [ActiveSession(
+            station.get('voucher_code') or station.get('name'),
+            station.get('mac'),
+            station.get('ip'),
+            int(station.get('rx_bytes') or 0),  # Counted at the AP: rx is the client's upload
+            int(station.get('tx_bytes') or 0),
+            int(station.get('uptime') or 0)
+        ) for station in await self.stations() if station.get('is_guest')]
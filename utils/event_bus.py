@@ -0,0 +1,296 @@
+"""
+Event Bus
+Publish/subscribe channel that fans live updates (voucher sessions, usage
+counters, router health, dashboard statistics) out to every subscriber.
+Events are relayed between processes (web workers, the monitor, the RADIUS
+server) over Redis pub/sub; without Redis only same-process events arrive
+"""
+
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+
+CHANNEL = 'wifi-manager:events'
+
+# Sent to every subscriber whatever its topics: tells clients whether events
+# from other processes reach this one, i.e. whether they may stop polling
+STATE_EVENT = 'hello'
+
+
+class Subscription:
+    """A single subscriber's bounded event queue"""
+
+    def __init__(self, topics=None, max_queue=1000):
+        self.topics = set(topics) if topics else None
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.lagged = False
+        self.closed = False
+
+    def wants(self, event_type):
+        """Check if this subscription is interested in an event type"""
+        if self.topics is None or event_type == STATE_EVENT:
+            return True
+        return event_type in self.topics or event_type.split('.')[0] in self.topics
+
+    def deliver(self, event):
+        """Queue an event; a full queue marks the subscriber as lagged"""
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # Slow consumer: drop the backlog and ask the client to resync
+            self.lagged = True
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+
+    def get(self, timeout=None):
+        """Get the next event, or None on timeout"""
+        if self.lagged:
+            self.lagged = False
+            return {'id': None, 'type': 'resync', 'data': {}}
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class RedisBridge:
+    """Relays events to and from the other processes over Redis pub/sub
+
+    An unreachable Redis is retried every `retry_seconds`; meanwhile events
+    stay in the publishing process.
+    """
+
+    def __init__(self, url, retry_seconds=10, timeout=0.5):
+        self.url = url
+        self.retry_seconds = retry_seconds
+        self.timeout = timeout
+        self.origin = uuid.uuid4().hex
+        self._client = None
+        self._pid = None
+        self._failed_at = None
+        self._listener_pid = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        import redis
+        client = redis.Redis.from_url(self.url, socket_timeout=self.timeout,
+                                      socket_connect_timeout=self.timeout)
+        client.ping()
+        return client
+
+    def _connection(self):
+        # Connections do not survive a fork
+        pid = os.getpid()
+        if self._pid == pid and self._client is not None:
+            return self._client
+        if self._pid == pid and self._failed_at is not None and \
+                time.monotonic() - self._failed_at < self.retry_seconds:
+            return None
+        with self._lock:
+            try:
+                self._client = self._connect()
+                self._failed_at = None
+            except Exception as e:
+                print(f"Event bus: Redis unavailable at {self.url} ({e}); events stay in this process")
+                self._client = None
+                self._failed_at = time.monotonic()
+            self._pid = pid
+        return self._client
+
+    def publish(self, message):
+        client = self._connection()
+        if client is None:
+            return False
+        try:
+            client.publish(CHANNEL, message)
+            return True
+        except Exception as e:
+            print(f"Event bus publish to Redis failed: {e}")
+            self._client = None
+            self._failed_at = time.monotonic()
+            return False
+
+    def listen(self, callback, on_state):
+        """Deliver messages from other processes to callback (once per process)
+
+        on_state(True/False) reports whether the subscription is live.
+        """
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+
+        def run():
+            while not self._stopped.is_set():
+                pubsub = None
+                try:
+                    pubsub = self._connect().pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(CHANNEL)
+                    on_state(True)
+                    while not self._stopped.is_set():
+                        message = pubsub.get_message(timeout=1.0)
+                        if message and message['type'] == 'message':
+                            callback(message['data'])
+                except Exception as e:
+                    print(f"Event bus channel error: {e}")
+                    on_state(False)
+                    self._stopped.wait(self.retry_seconds)
+                finally:
+                    if pubsub is not None:
+                        try:
+                            pubsub.close()
+                        except Exception:
+                            pass
+
+        threading.Thread(target=run, name='event-bus-listener', daemon=True).start()
+
+    def close(self):
+        self._stopped.set()
+        if self._client is not None:
+            self._client.close()
+
+
+class EventBus:
+    """Thread-safe publish/subscribe hub"""
+
+    def __init__(self, max_queue=1000):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._retained = {}
+        self._ids = itertools.count(1)
+        self.bridge = None
+        self.bridged = False  # Subscribed to the Redis channel
+        self.monitor_in_process = False  # Monitor events are published here
+
+    def configure(self, config):
+        """Relay events over Redis at EVENT_BUS_REDIS_URL (empty: this process only)"""
+        if self.bridge is not None:
+            self.bridge.close()
+        url = config.get('EVENT_BUS_REDIS_URL') or None
+        self.bridge = RedisBridge(url, config.get('EVENT_BUS_RETRY_SECONDS', 10)) if url else None
+        self.bridged = False
+
+    @property
+    def shared(self):
+        """Whether events from the monitor and other processes reach subscribers here"""
+        return self.bridged or self.monitor_in_process
+
+    def publish(self, event_type, data, retain=False):
+        """Publish an event once to all current subscribers, in every process
+
+        Retained events (e.g. the latest dashboard statistics) are also
+        replayed to new subscribers as soon as they connect.
+        """
+        timestamp = datetime.utcnow().isoformat()
+        event = self._deliver(event_type, data, retain, timestamp)
+        if self.bridge is not None:
+            self.bridge.publish(json.dumps({
+                'origin': self.bridge.origin,
+                'type': event_type,
+                'data': data,
+                'retain': retain,
+                'timestamp': timestamp
+            }, ensure_ascii=False, default=str))
+        return event
+
+    def _deliver(self, event_type, data, retain, timestamp):
+        # Ids are per process; they only order events on one stream
+        event = {
+            'id': next(self._ids),
+            'type': event_type,
+            'data': data,
+            'timestamp': timestamp
+        }
+
+        with self._lock:
+            if retain:
+                self._retained[event_type] = event
+            subscribers = [s for s in self._subscribers if s.wants(event_type)]
+
+        for subscription in subscribers:
+            subscription.deliver(event)
+
+        return event
+
+    def _on_remote(self, message):
+        try:
+            message = json.loads(message)
+        except ValueError:
+            return
+        if message.get('origin') == self.bridge.origin:
+            return
+        self._deliver(message['type'], message.get('data'), message.get('retain', False),
+                      message.get('timestamp') or datetime.utcnow().isoformat())
+
+    def _on_state(self, bridged):
+        if bridged == self.bridged:
+            return
+        self.bridged = bridged
+        # Events may have been missed while the channel was down
+        self._deliver(STATE_EVENT, {'shared': self.shared}, False, datetime.utcnow().isoformat())
+
+    def subscribe(self, topics=None):
+        """Register a new subscriber, primed with the bus state and retained events"""
+        if self.bridge is not None:
+            self.bridge.listen(self._on_remote, self._on_state)
+
+        subscription = Subscription(topics, self.max_queue)
+
+        with self._lock:
+            self._subscribers.add(subscription)
+            retained = [e for t, e in self._retained.items() if subscription.wants(t)]
+
+        subscription.deliver({'id': None, 'type': STATE_EVENT, 'data': {'shared': self.shared}})
+        for event in retained:
+            subscription.deliver(event)
+
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Remove a subscriber"""
+        subscription.closed = True
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self):
+        """Number of connected subscribers"""
+        with self._lock:
+            return len(self._subscribers)
+
+
+def format_sse(event):
+    """Serialize an event in Server-Sent Events wire format"""
+    lines = []
+    if event.get('id') is not None:
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event['type']}")
+    lines.append(f"data: {json.dumps(event['data'], ensure_ascii=False, default=str)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+# Global event bus instance
+event_bus = EventBus()
+
+
+def init_event_bus(app):
+    """Configure the global event bus from the app config"""
+    event_bus.configure(app.config)
+
+
+def publish_event(event_type, data, retain=False):
+    """Publish an event on the global bus, never raising into the caller"""
+    try:
+        return event_bus.publish(event_type, data, retain=retain)
+    except Exception as e:
+        print(f"Event bus publish error: {e}")
+        return None
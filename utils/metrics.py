@@ -0,0 +1,369 @@
+"""
+Metrics and Instrumentation
+In-process counters and histograms exposed in Prometheus text format, with
+hooks for request latency, SQL statements, router calls and monitor cycles
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+class Counter:
+    """Monotonically increasing counter with labels"""
+
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}_total{_format_labels(self.labelnames, key)} {value}"
+
+class Histogram:
+    """Cumulative-bucket histogram with labels"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        for key, (counts, total, count) in items:
+            for bound, bucket_count in zip(self.buckets, counts):
+                labels = _format_labels(self.labelnames, key, ('le', bound))
+                yield f"{self.name}_bucket{labels} {bucket_count}"
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {count}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+class MetricsRegistry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Render all metrics in Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+# Global registry and the application's metrics
+registry = MetricsRegistry()
+
+REQUEST_LATENCY = registry.histogram(
+    'wifi_http_request_duration_seconds', 'HTTP request latency by endpoint',
+    ('endpoint', 'method', 'status'))
+REQUEST_DB_QUERIES = registry.histogram(
+    'wifi_http_request_db_queries', 'SQL statements executed per request',
+    ('endpoint',), COUNT_BUCKETS)
+REQUEST_DB_SECONDS = registry.histogram(
+    'wifi_http_request_db_seconds', 'Time spent in SQL per request', ('endpoint',))
+ROUTER_CALL_LATENCY = registry.histogram(
+    'wifi_router_call_duration_seconds', 'Router API call latency by brand and operation',
+    ('brand', 'operation', 'result'))
+QR_RENDER_LATENCY = registry.histogram(
+    'wifi_qr_render_duration_seconds', 'QR code rendering latency')
+MONITOR_STAGE_LATENCY = registry.histogram(
+    'wifi_monitor_stage_duration_seconds', 'Network monitor cycle duration by stage', ('stage',))
+MONITOR_DB_QUERIES = registry.histogram(
+    'wifi_monitor_stage_db_queries', 'SQL statements executed per monitor stage',
+    ('stage',), COUNT_BUCKETS)
+ROUTER_OPLOG_FSYNC_LATENCY = registry.histogram(
+    'wifi_router_oplog_fsync_duration_seconds', 'Router operation log group-commit fsync latency')
+ROUTER_OPLOG_FSYNC_BATCH = registry.histogram(
+    'wifi_router_oplog_fsync_batch_entries', 'Log entries made durable per fsync', (), COUNT_BUCKETS)
+ROUTER_OPLOG_APPLIED = registry.counter(
+    'wifi_router_oplog_applied', 'Router operations replayed from the log by result',
+    ('operation', 'result'))
+RADIUS_REQUESTS = registry.counter(
+    'wifi_radius_requests', 'RADIUS packets handled by kind and result', ('kind', 'result'))
+RADIUS_LATENCY = registry.histogram(
+    'wifi_radius_response_duration_seconds', 'Time to answer a RADIUS request', ('kind',))
+RADIUS_ACCT_FLUSH_LATENCY = registry.histogram(
+    'wifi_radius_accounting_flush_duration_seconds', 'Time to write one batch of accounting updates')
+RADIUS_DISCONNECTS = registry.counter(
+    'wifi_radius_disconnects', 'Disconnect-Requests sent for exhausted vouchers by result', ('result',))
+CACHE_LOOKUPS = registry.counter(
+    'wifi_cache_lookups', 'Shared cache lookups by level and result', ('level', 'result'))
+CACHE_INVALIDATIONS = registry.counter(
+    'wifi_cache_invalidations', 'Cache keys invalidated by origin of the message', ('source',))
+SQLITE_WRITE_WAIT = registry.histogram(
+    'wifi_sqlite_write_queue_wait_seconds', 'Time a write waited for the SQLite writer thread')
+SQLITE_WRITE_BATCH = registry.histogram(
+    'wifi_sqlite_write_batch_size', 'Commits and operations handled per writer batch', (), COUNT_BUCKETS)
+REPLICA_QUERIES = registry.counter(
+    'wifi_replica_queries', 'Replica-eligible reads by the database that served them', ('target',))
+REPLICA_LAG = registry.histogram(
+    'wifi_replica_lag_seconds', 'Read replica lag measured by the periodic check')
+USAGE_POLLS = registry.counter(
+    'wifi_usage_polls', 'Session usage checks by where the reading came from', ('source',))
+USAGE_POLL_INTERVAL = registry.histogram(
+    'wifi_usage_poll_interval_seconds', 'Interval planned until a session\'s next usage check', (),
+    (1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0))
+
+# SQL statement tracking, scoped to the current request or monitor stage
+_local = threading.local()
+
+class QueryScope:
+    """SQL statements observed while a scope is active on this thread"""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = []
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.seconds += duration
+        self.statements.append(statement)
+
+def current_query_scope():
+    """Innermost active query scope on this thread, if any"""
+    stack = getattr(_local, 'scopes', None)
+    return stack[-1] if stack else None
+
+@contextmanager
+def query_scope(name):
+    """Track SQL statements executed on this thread while the block runs"""
+    scope = QueryScope(name)
+    stack = getattr(_local, 'scopes', None)
+    if stack is None:
+        stack = _local.scopes = []
+    stack.append(scope)
+    try:
+        yield scope
+    finally:
+        stack.pop()
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get('query_start_time')
+    if not start_times:
+        return
+    duration = time.perf_counter() - start_times.pop()
+    stack = getattr(_local, 'scopes', None)
+    if stack:
+        for scope in stack:
+            scope.record(statement, duration)
+
+_sql_hooks_installed = False
+
+def install_sql_hooks():
+    """Listen to statement execution on every SQLAlchemy engine"""
+    global _sql_hooks_installed
+    if _sql_hooks_installed:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    _sql_hooks_installed = True
+
+def timed_router_call(operation):
+    """Decorator recording router manager call latency by brand and operation"""
+    def decorator(f):
+        @wraps(f)
+        def decorated(self, *args, **kwargs):
+            start = time.perf_counter()
+            result = 'error'
+            try:
+                value = f(self, *args, **kwargs)
+                result = 'ok' if value not in (False, None) else 'failed'
+                return value
+            finally:
+                ROUTER_CALL_LATENCY.observe(
+                    time.perf_counter() - start,
+                    brand=getattr(self.router, 'brand', 'unknown'), operation=operation, result=result)
+        return decorated
+    return decorator
+
+def timed_driver_call(operation):
+    """Decorator recording async router driver call latency by brand and operation"""
+    def decorator(f):
+        @wraps(f)
+        async def decorated(self, *args, **kwargs):
+            start = time.perf_counter()
+            result = 'error'
+            try:
+                value = await f(self, *args, **kwargs)
+                result = 'ok' if value not in (False, None) else 'failed'
+                return value
+            finally:
+                ROUTER_CALL_LATENCY.observe(
+                    time.perf_counter() - start,
+                    brand=self.endpoint.brand, operation=operation, result=result)
+        return decorated
+    return decorator
+
+@contextmanager
+def monitor_stage(stage):
+    """Time a network monitor stage and count its SQL statements"""
+    start = time.perf_counter()
+    with query_scope(f'monitor:{stage}') as scope:
+        try:
+            yield scope
+        finally:
+            MONITOR_STAGE_LATENCY.observe(time.perf_counter() - start, stage=stage)
+            MONITOR_DB_QUERIES.observe(scope.count, stage=stage)
+
+def init_metrics(app):
+    """Install request timing, SQL counting, profiling and the /metrics endpoint"""
+    from flask import g, request, Response, abort
+
+    install_sql_hooks()
+
+    @app.before_request
+    def _start_request_metrics():
+        g.metrics_start = time.perf_counter()
+        g.metrics_scope_cm = query_scope(request.endpoint or 'unknown')
+        g.metrics_scope = g.metrics_scope_cm.__enter__()
+
+        if _should_profile(app):
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def _finish_request_metrics(response):
+        start = g.pop('metrics_start', None)
+        scope_cm = g.pop('metrics_scope_cm', None)
+        scope = g.pop('metrics_scope', None)
+        if scope_cm is not None:
+            scope_cm.__exit__(None, None, None)
+
+        endpoint = request.endpoint or 'unknown'
+        if start is not None:
+            REQUEST_LATENCY.observe(
+                time.perf_counter() - start,
+                endpoint=endpoint, method=request.method, status=response.status_code)
+        if scope is not None:
+            REQUEST_DB_QUERIES.observe(scope.count, endpoint=endpoint)
+            REQUEST_DB_SECONDS.observe(scope.seconds, endpoint=endpoint)
+            response.headers['X-DB-Queries'] = str(scope.count)
+
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            return _profile_response(app, profiler, response)
+
+        return response
+
+    @app.teardown_request
+    def _discard_request_metrics(error=None):
+        # Requests that raised never reach after_request
+        scope_cm = g.pop('metrics_scope_cm', None)
+        if scope_cm is not None:
+            scope_cm.__exit__(None, None, None)
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+
+    @app.route(app.config.get('METRICS_ENDPOINT', '/metrics'))
+    def metrics():
+        """Prometheus scrape endpoint"""
+        token = app.config.get('METRICS_TOKEN')
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            abort(401)
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+def _should_profile(app):
+    from flask import request
+
+    if not app.config.get('PROFILING_ENABLED'):
+        return False
+    if request.headers.get('X-Profile') == '1' or request.args.get('_profile') == '1':
+        return True
+    rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+    return rate > 0 and random.random() < rate
+
+def _profile_response(app, profiler, response):
+    """Return profile stats for explicit requests, or save sampled ones to disk"""
+    from flask import request, Response
+
+    if request.headers.get('X-Profile') == '1' or request.args.get('_profile') == '1':
+        output = io.StringIO()
+        stats = pstats.Stats(profiler, stream=output)
+        stats.sort_stats('cumulative').print_stats(40)
+        return Response(output.getvalue(), mimetype='text/plain')
+
+    profile_dir = app.config.get('PROFILE_DIR', 'profiles')
+    os.makedirs(profile_dir, exist_ok=True)
+    filename = f"{request.endpoint or 'unknown'}-{int(time.time() * 1000)}.prof"
+    profiler.dump_stats(os.path.join(profile_dir, filename))
+    return response
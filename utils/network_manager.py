@@ -8,9 +8,20 @@ import socket
 import struct
 import json
 from datetime import datetime, timedelta
+from sqlalchemy.orm.exc import StaleDataError
 from models.router import Router
 from models.voucher import Voucher
+from models.voucher_plan import VoucherPlan
+from models.network import Network
 from utils.router_manager import get_router_manager
+from utils.drivers import revoke_on_routers, fetch_router_counters
+from utils.router_oplog import log_router_operation, replay_router_operations
+from utils.event_bus import event_bus, publish_event
+from utils.usage_store import usage_recorder, apply_retention
+from utils.metrics import monitor_stage, USAGE_POLLS
+from utils.plugins import PluginRegistry
+from utils.session_table import SessionTable, to_timestamp
+from utils.usage_scheduler import UsagePollScheduler
 import threading
 import time
 
@@ -20,8 +31,12 @@ class NetworkMonitor:
     def __init__(self, app=None):
         self.monitoring = False
         self.monitor_thread = None
-        self.active_sessions = {}
+        self.active_sessions = SessionTable()
+        self.usage_scheduler = UsagePollScheduler(app.config if app else None)
         self.app = app
+        self.last_retention_run = None
+        self.last_reconcile_run = None
+        self.last_archive_run = None
     
     def start_monitoring(self):
         """Start network monitoring in background"""
@@ -37,65 +52,342 @@ class NetworkMonitor:
         if self.monitor_thread:
             self.monitor_thread.join()
     
+    def run_forever(self):
+        """Run the monitoring loop in the calling thread (dedicated monitor process)"""
+        self.monitoring = True
+        self._monitor_loop()
+    
     def _monitor_loop(self):
         """Main monitoring loop"""
         while self.monitoring:
             try:
-                self._update_session_data()
-                self._check_session_expiry()
-                time.sleep(30)  # Update every 30 seconds
+                self.run_cycle()
+                # Full pass every 30 seconds; usage checks that fall due in
+                # between (sessions near their data limit) run on time
+                self._poll_usage_until(time.monotonic() + 30)
             except Exception as e:
                 print(f"Network monitor error: {e}")
                 time.sleep(60)
     
+    def run_cycle(self):
+        """Run one monitoring pass (also used by the benchmark suite)"""
+        with monitor_stage('cycle') as cycle_scope:
+            with monitor_stage('update_usage'):
+                self._update_session_data()
+            with monitor_stage('check_expiry'):
+                self._check_session_expiry()
+            with monitor_stage('maintenance'):
+                self._prune_change_log()
+                self._apply_usage_retention()
+                self._archive_vouchers()
+                self._reconcile_routers()
+            with monitor_stage('publish_stats'):
+                self._publish_stats()
+        self._audit_cycle(cycle_scope)
+    
+    def _poll_usage_until(self, deadline):
+        """Sleep until the deadline, running usage checks as they fall due"""
+        min_sleep = self.app.config.get('USAGE_POLL_MIN_SECONDS', 5)
+        while self.monitoring:
+            now = time.monotonic()
+            if now >= deadline:
+                return
+            wake = deadline
+            next_due = self.active_sessions.next_due()
+            if next_due is not None:
+                # Batch neighbouring checks instead of waking for each one
+                wait = max(min_sleep, next_due - to_timestamp(datetime.utcnow()))
+                wake = min(deadline, now + wait)
+            time.sleep(max(0.0, wake - now))
+            if wake < deadline:
+                with monitor_stage('update_usage'):
+                    self._update_session_data()
+    
     def _update_session_data(self):
-        """Update data usage for active sessions"""
+        """Update data usage for the sessions whose check is due"""
         from database import db
         
         with self.app.app_context():
-            # Get active vouchers
-            active_vouchers = Voucher.query.filter_by(status='used').filter(
-                Voucher.session_end > datetime.utcnow()
-            ).all()
+            sessions = self.active_sessions
+            sessions.sync(self.app.config.get('SESSION_TABLE_RESYNC_MINUTES', 10) * 60)
             
-            for voucher in active_vouchers:
-                if voucher.client_ip:
-                    try:
-                        # Simulate data usage calculation (in real implementation, 
-                        # this would interface with router APIs or network monitoring tools)
-                        data_used = self._get_client_data_usage(voucher.client_ip)
-                        if data_used > voucher.data_used_mb:
-                            voucher.data_used_mb = data_used
-                            
-                            # Check if data limit exceeded
-                            if voucher.data_limit_mb and data_used >= voucher.data_limit_mb:
-                                self._disconnect_voucher(voucher)
-                                voucher.status = 'expired'
-                                voucher.session_end = datetime.utcnow()
-                    
-                    except Exception as e:
-                        print(f"Error updating data for voucher {voucher.code}: {e}")
+            network_routers = dict(db.session.query(Network.id, Network.router_id).all())
+            now = datetime.utcnow()
+            now_ts = to_timestamp(now)
+            due = self.usage_scheduler.due_by_router(sessions, network_routers, now)
             
-            db.session.commit()
+            # With RADIUS accounting, routers that authenticate through our
+            # RADIUS server report usage themselves; the rest are still polled
+            if due and self.app.config.get('RADIUS_ACCOUNTING_ENABLED'):
+                radius_routers = {router_id for router_id, in db.session.query(Router.id).filter(Router.uses_radius)}
+                for router_id in radius_routers & set(due):
+                    for index in due.pop(router_id):
+                        self.usage_scheduler.defer(sessions, index, now_ts)
+            if not due:
+                return
+            
+            readings = {}
+            for index, data_used in self._fetch_usage(due):
+                if data_used is None:
+                    self.usage_scheduler.skip(sessions, index, now_ts)
+                    continue
+                self.usage_scheduler.observe(sessions, index, data_used, now_ts)
+                if data_used > sessions.data_used_mb[index]:
+                    readings[index] = data_used
+            
+            # Check if data limit exceeded
+            over_limit = {sessions.ids[index]: data_used for index, data_used in readings.items()
+                          if data_used >= sessions.data_limit_mb[index]}
+            usage_updates = [{
+                'voucher_id': sessions.ids[index],
+                'voucher_code': sessions.codes[index],
+                'data_used_mb': data_used
+            } for index, data_used in readings.items() if sessions.ids[index] not in over_limit]
+            
+            written = self._write_usage(usage_updates, over_limit)
+            if written is None:
+                return  # The table keeps the old totals; read again next check
+            ended_codes, revision = written
+            
+            # Committed: only now does the session table (and history) move on
+            for index, data_used in readings.items():
+                network_id = sessions.network_id(index)
+                usage_recorder.record(
+                    sessions.ids[index],
+                    data_used - sessions.data_used_mb[index],
+                    network_id=network_id,
+                    router_id=network_routers.get(network_id)
+                )
+                sessions.data_used_mb[index] = data_used
+            usage_recorder.flush()
+            
+            sessions.note_written([update['voucher_id'] for update in usage_updates], revision)
+            for voucher_id in over_limit:
+                sessions.remove(voucher_id)
+            self._disconnect_vouchers(ended_codes)
+            
+            if usage_updates:
+                publish_event('usage.updated', {'clients': [
+                    {'voucher_code': update['voucher_code'], 'data_used_mb': update['data_used_mb']}
+                    for update in usage_updates
+                ]})
+            if ended_codes:
+                publish_event('voucher.ended', {'codes': ended_codes})
+    
+    def _write_usage(self, usage_updates, over_limit, attempts=3):
+        """Store usage totals and end the over-limit sessions in one commit
+
+        Returns (ended codes, change log revision). Like _expire_sessions, a
+        voucher ended or extended concurrently fails the commit with
+        StaleDataError and the write is retried without it; None once the
+        attempts are used up.
+        """
+        from database import db
+        from sqlalchemy import bindparam
+        from models.voucher_change import VoucherChange, record_voucher_changes
+        
+        for _ in range(attempts):
+            # Plain usage totals in one statement; the change log is written
+            # here because the bulk UPDATE bypasses the ORM events
+            if usage_updates:
+                table = Voucher.__table__
+                db.session.execute(
+                    table.update().where(table.c.id == bindparam('v_id'), table.c.status == 'used')
+                    .values(data_used_mb=bindparam('v_used')),
+                    [{'v_id': update['voucher_id'], 'v_used': update['data_used_mb']} for update in usage_updates])
+                record_voucher_changes(
+                    [(update['voucher_id'], update['voucher_code'], 'updated') for update in usage_updates])
+            
+            # Ending a session goes through the ORM so the sales summaries see it
+            ended_codes = []
+            if over_limit:
+                ended = Voucher.query.filter(Voucher.id.in_(list(over_limit)), Voucher.status == 'used').all()
+                for voucher in ended:
+                    voucher.data_used_mb = over_limit[voucher.id]
+                    voucher.status = 'expired'
+                    voucher.session_end = datetime.utcnow()
+                    ended_codes.append(voucher.code)
+            
+            try:
+                # Autoflushes the ended sessions, so a conflict can surface here too
+                revision = db.session.query(db.func.max(VoucherChange.id)).scalar() or 0
+                db.session.commit()
+            except StaleDataError:
+                db.session.rollback()
+                continue
+            return ended_codes, revision
+        
+        print(f"Writing usage for {len(usage_updates) + len(over_limit)} sessions kept conflicting; retrying next check")
+        return None
     
     def _check_session_expiry(self):
         """Check for expired sessions and disconnect them"""
+        with self.app.app_context():
+            sessions = self.active_sessions
+            sessions.sync(self.app.config.get('SESSION_TABLE_RESYNC_MINUTES', 10) * 60)
+            now = datetime.utcnow()
+            expired_ids = sessions.expired(now)
+            
+            # Only the expired sessions are loaded, in chunks committed one by one
+            # so a conflict costs at most its own chunk
+            ended_codes = []
+            for start in range(0, len(expired_ids), 500):
+                chunk = expired_ids[start:start + 500]
+                codes = self._expire_sessions(chunk, now)
+                if codes is None:
+                    continue  # Still in the table; retried next cycle
+                ended_codes.extend(codes)
+                
+                # Ids that were not claimed had already ended or been extended
+                # elsewhere; the change log brings the extended ones back
+                for voucher_id in chunk:
+                    sessions.remove(voucher_id)
+            
+            # One connection per router for the whole batch instead of per voucher
+            self._disconnect_vouchers(ended_codes)
+            
+            if ended_codes:
+                publish_event('voucher.ended', {'codes': ended_codes})
+    
+    def _expire_sessions(self, voucher_ids, now, attempts=3):
+        """Claim the ended sessions among voucher_ids; returns their codes
+
+        A voucher disconnected or extended concurrently fails the commit with
+        StaleDataError. Reloading drops it (it no longer matches), so the
+        chunk is retried; None once the attempts are used up.
+        """
         from database import db
         
-        with self.app.app_context():
-            expired_vouchers = Voucher.query.filter_by(status='used').filter(
-                Voucher.session_end <= datetime.utcnow()
+        for _ in range(attempts):
+            vouchers = Voucher.query.filter(
+                Voucher.id.in_(voucher_ids),
+                Voucher.status == 'used',
+                Voucher.session_end <= now
             ).all()
+            codes = []
+            for voucher in vouchers:
+                voucher.status = 'expired'
+                codes.append(voucher.code)
+            try:
+                db.session.commit()
+            except StaleDataError:
+                db.session.rollback()
+                continue
+            for code in codes:
+                print(f"Disconnected expired voucher: {code}")
+            return codes
+        
+        print(f"Expiring {len(voucher_ids)} sessions kept conflicting; retrying next cycle")
+        return None
+    
+    def _prune_change_log(self):
+        """Drop change log entries older than the retention window"""
+        from database import db
+        from models.voucher_change import VoucherChange
+        
+        with self.app.app_context():
+            retention = timedelta(hours=self.app.config.get('VOUCHER_CHANGE_RETENTION_HOURS', 24))
+            latest = db.session.query(db.func.max(VoucherChange.id)).scalar()
+            if latest is None:
+                return
             
-            for voucher in expired_vouchers:
+            # Always keep the newest entry so revisions stay monotonic
+            VoucherChange.query.filter(
+                VoucherChange.changed_at < datetime.utcnow() - retention,
+                VoucherChange.id < latest
+            ).delete(synchronize_session=False)
+            db.session.commit()
+    
+    def _apply_usage_retention(self):
+        """Downsample usage history once an hour"""
+        now = datetime.utcnow()
+        if self.last_retention_run and now - self.last_retention_run < timedelta(hours=1):
+            return
+        
+        with self.app.app_context():
+            apply_retention(self.app.config, now)
+        self.last_retention_run = now
+    
+    def _archive_vouchers(self):
+        """Move old finished vouchers to the archive (VOUCHER_ARCHIVE_INTERVAL_HOURS, 0 disables)"""
+        interval = self.app.config.get('VOUCHER_ARCHIVE_INTERVAL_HOURS') or 0
+        now = datetime.utcnow()
+        if not interval or (self.last_archive_run and now - self.last_archive_run < timedelta(hours=interval)):
+            return
+        
+        from utils.archive import archive_vouchers
+        
+        self.last_archive_run = now
+        with self.app.app_context():
+            archive_vouchers()
+    
+    def _reconcile_routers(self):
+        """Periodic router reconciliation (RECONCILE_INTERVAL_MINUTES, 0 disables)"""
+        interval = self.app.config.get('RECONCILE_INTERVAL_MINUTES') or 0
+        now = datetime.utcnow()
+        if not interval or (self.last_reconcile_run and now - self.last_reconcile_run < timedelta(minutes=interval)):
+            return
+        
+        from utils.reconcile import reconcile_routers
+        
+        self.last_reconcile_run = now
+        with self.app.app_context():
+            result = reconcile_routers()
+        changed = sum(report.get('added', 0) + report.get('removed', 0) for report in result['routers'])
+        if changed:
+            print(f"Reconciliation fixed {changed} router users in {result['seconds']}s")
+    
+    def _publish_stats(self):
+        """Compute dashboard statistics once per cycle for all live subscribers"""
+        from utils.stats import get_dashboard_stats
+        from utils.replica import use_replica
+        
+        with self.app.app_context(), use_replica():
+            publish_event('stats.dashboard', get_dashboard_stats(), retain=True)
+    
+    def _fetch_usage(self, due):
+        """Usage readings for due sessions grouped by router: (index, data_used_mb or None)
+
+        Each router known for its sessions answers one bulk counter read, all
+        routers at once; other sessions fall back to the per-client lookup.
+        """
+        sessions = self.active_sessions
+        use_routers = self.app.config.get('ROUTER_DRIVER_MODE') == 'async'
+        counters = {}
+        router_ids = [router_id for router_id in due if router_id is not None]
+        if router_ids and use_routers:
+            routers = Router.query.filter(Router.id.in_(router_ids), Router.is_active == True).all()
+            try:
+                counters = fetch_router_counters(routers)
+            except Exception as e:
+                print(f"Error fetching router counters: {e}")
+        
+        readings = []
+        for router_id, indexes in due.items():
+            router_counters = counters.get(router_id)
+            if router_id is not None and use_routers:
+                # Unreachable routers and clients not online read as None
+                source = 'router' if router_counters is not None else 'unreachable'
+                for index in indexes:
+                    bytes_in_out = (router_counters or {}).get(sessions.codes[index])
+                    readings.append((index, sum(bytes_in_out) / (1024 * 1024) if bytes_in_out else None))
+                USAGE_POLLS.inc(len(indexes), source=source)
+                continue
+            
+            for index in indexes:
+                client_ip = sessions.client_ip(index)
+                if not client_ip:
+                    readings.append((index, None))
+                    continue
                 try:
-                    self._disconnect_voucher(voucher)
-                    voucher.status = 'expired'
-                    print(f"Disconnected expired voucher: {voucher.code}")
+                    # Simulate data usage calculation (in real implementation, 
+                    # this would interface with router APIs or network monitoring tools)
+                    readings.append((index, self._get_client_data_usage(client_ip)))
                 except Exception as e:
-                    print(f"Error disconnecting voucher {voucher.code}: {e}")
-            
-            db.session.commit()
+                    print(f"Error updating data for voucher {sessions.codes[index]}: {e}")
+                    readings.append((index, None))
+            USAGE_POLLS.inc(len(indexes), source='client')
+        return readings
     
     def _get_client_data_usage(self, client_ip):
         """Get data usage for specific client IP (simplified simulation)"""
@@ -107,18 +399,60 @@ class NetworkMonitor:
     
     def _disconnect_voucher(self, voucher):
         """Disconnect voucher from all routers"""
-        routers = Router.query.filter_by(is_active=True).all()
+        self._disconnect_vouchers([voucher.code])
+    
+    def _disconnect_vouchers(self, codes):
+        """Disconnect voucher codes from all routers, one connection per router"""
+        if not codes:
+            return
+        
+        # RADIUS routers hold no local users; Session-Timeout and accounting end their sessions
+        routers = [router for router in Router.query.filter_by(is_active=True).all()
+                   if not router.uses_radius]
+        if not routers:
+            return
+        
+        if self.app.config.get('ROUTER_OPLOG_ENABLED'):
+            # Durably logged; the replayer retries routers that are unreachable now
+            try:
+                log_router_operation('revoke', codes, routers)
+                replay_router_operations()
+            except Exception as e:
+                print(f"Error logging voucher disconnects: {e}")
+            return
+        
+        if self.app.config.get('ROUTER_DRIVER_MODE') == 'async':
+            # Every brand through the uniform driver API, all routers at once
+            try:
+                revoke_on_routers(routers, codes)
+            except Exception as e:
+                print(f"Error disconnecting vouchers: {e}")
+            return
         
         for router in routers:
             try:
                 manager = get_router_manager(router)
                 if manager.connect():
                     if router.brand == 'MikroTik':
-                        manager.remove_hotspot_user(voucher.code)
+                        manager.remove_hotspot_users(codes)
                     # Add other router types as needed
                 manager.disconnect()
             except Exception as e:
                 print(f"Error disconnecting from router {router.name}: {e}")
+    
+    def _audit_cycle(self, scope):
+        """Flag N+1 patterns and budget overruns in a monitor cycle (dev mode)"""
+        from utils.query_audit import audit_statements
+        
+        if not self.app.config.get('QUERY_AUDIT_ENABLED'):
+            return
+        
+        audit_statements(
+            'network monitor cycle',
+            scope.statements,
+            budget=self.app.config.get('MONITOR_QUERY_BUDGET'),
+            repeat_threshold=self.app.config.get('QUERY_AUDIT_REPEAT_THRESHOLD', 5)
+        )
 
 class NetworkConfiguration:
     """Handle network configuration and router setup"""
@@ -246,14 +580,20 @@ class VoucherManager:
         vouchers = []
         batch_id = f"BATCH_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
         
+        # One shared plan for the batch; QR URLs are derived from it
+        plan = VoucherPlan.get_or_create(
+            duration_hours=config.get('duration_hours', 24),
+            data_limit_mb=config.get('data_limit_mb'),
+            speed_limit_kbps=config.get('speed_limit_kbps'),
+            voucher_type=config.get('voucher_type', 'standard'),
+            price=config.get('price', 0),
+            allowed_networks=json.dumps(config['allowed_networks']) if config.get('allowed_networks') else None,
+            qr_base_url=config.get('base_url')
+        )
+        
         for i in range(config['quantity']):
-            voucher = Voucher()
+            voucher = Voucher(plan=plan)
             voucher.batch_id = batch_id
-            voucher.duration_hours = config.get('duration_hours', 24)
-            voucher.data_limit_mb = config.get('data_limit_mb')
-            voucher.speed_limit_kbps = config.get('speed_limit_kbps')
-            voucher.voucher_type = config.get('voucher_type', 'standard')
-            voucher.price = config.get('price', 0)
             voucher.created_by = config.get('created_by')
             
             # Custom expiration
@@ -262,14 +602,6 @@ class VoucherManager:
                     days=config['voucher_expires_days']
                 )
             
-            # Network restrictions
-            if config.get('allowed_networks'):
-                voucher.allowed_networks = json.dumps(config['allowed_networks'])
-            
-            # Generate QR code
-            base_url = config.get('base_url', 'http://localhost:5000')
-            voucher.generate_qr_data(base_url)
-            
             db.session.add(voucher)
             vouchers.append(voucher)
         
@@ -279,14 +611,9 @@ class VoucherManager:
     @staticmethod
     def export_vouchers(vouchers, format='csv'):
         """Export vouchers in various formats"""
-        if format == 'csv':
-            return VoucherManager._export_csv(vouchers)
-        elif format == 'json':
-            return VoucherManager._export_json(vouchers)
-        elif format == 'pdf':
-            return VoucherManager._export_pdf(vouchers)
-        else:
+        if format not in voucher_exporters:
             raise ValueError("Unsupported export format")
+        return voucher_exporters.get(format)(vouchers)
     
     @staticmethod
     def _export_csv(vouchers):
@@ -332,6 +659,13 @@ class VoucherManager:
         # For now, return a placeholder
         return "PDF export requires reportlab library"
 
+# Voucher export formats; extra formats (e.g. a reportlab-based PDF) can be
+# registered as 'module:function' paths and are imported on first export
+voucher_exporters = PluginRegistry('voucher exporter')
+voucher_exporters.register('csv', VoucherManager._export_csv)
+voucher_exporters.register('json', VoucherManager._export_json)
+voucher_exporters.register('pdf', VoucherManager._export_pdf)
+
 # Global network monitor instance
 network_monitor = None
 
@@ -340,6 +674,8 @@ def start_network_monitoring(app=None):
     global network_monitor
     if network_monitor is None:
         network_monitor = NetworkMonitor(app)
+    # Its events are published in this process, so streams here receive them
+    event_bus.monitor_in_process = True
     network_monitor.start_monitoring()
 
 def stop_network_monitoring():
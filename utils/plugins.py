@@ -0,0 +1,64 @@
+"""
+Plugin Registry
+Named extension points (router backends, exporters) whose implementations are
+imported on first use, so heavy optional dependencies stay out of startup
+"""
+
+import importlib
+import threading
+
+class PluginRegistry:
+    """Map names to implementations given as objects or 'module:attribute' paths"""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self._targets = {}
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, target):
+        """Register an implementation; strings are imported lazily by get()"""
+        with self._lock:
+            self._targets[name] = target
+            self._loaded.pop(name, None)
+
+    def get(self, name):
+        """Return the implementation for `name`, importing it if needed"""
+        try:
+            return self._loaded[name]
+        except KeyError:
+            pass
+
+        with self._lock:
+            target = self._targets.get(name)
+            if target is None:
+                raise KeyError(f"Unknown {self.kind}: {name}")
+            if isinstance(target, str):
+                module_name, _, attribute = target.partition(':')
+                target = importlib.import_module(module_name)
+                for part in attribute.split('.') if attribute else ():
+                    target = getattr(target, part)
+            self._loaded[name] = target
+            return target
+
+    def load_entry_points(self, group):
+        """Register implementations advertised by installed packages
+
+        Packages declare e.g. `[project.entry-points."<group>"] Ruckus = "pkg.mod:Driver"`;
+        nothing is imported until the name is requested.
+        """
+        from importlib.metadata import entry_points
+
+        try:
+            found = entry_points(group=group)
+        except TypeError:  # Python < 3.10
+            found = entry_points().get(group, [])
+        for entry_point in found:
+            self.register(entry_point.name, entry_point.value)
+        return [entry_point.name for entry_point in found]
+
+    def names(self):
+        return list(self._targets)
+
+    def __contains__(self, name):
+        return name in self._targets
@@ -1,7 +1,6 @@
-import qrcode
 from io import BytesIO
 import base64
-from PIL import Image
+from utils.metrics import QR_RENDER_LATENCY
 
 def generate_qr_code(data, size=10, border=4):
     """
@@ -15,7 +14,15 @@ def generate_qr_code(data, size=10, border=4):
     Returns:
         Base64 encoded PNG image
     """
+    with QR_RENDER_LATENCY.time():
+        return _render_qr_code(data, size, border)
+
+def _render_qr_code(data, size, border):
+    """Render a QR code to a base64 PNG data URI"""
     try:
+        # qrcode pulls in Pillow; import on first render rather than at startup
+        import qrcode
+        
         # Create QR code instance
         qr = qrcode.QRCode(
             version=1,
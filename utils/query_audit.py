@@ -0,0 +1,138 @@
+"""
+Query Auditor
+Development/test-mode detector for N+1 patterns and per-request query budgets,
+built on the SQL statement scopes from utils.metrics
+"""
+
+import re
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+from utils.metrics import install_sql_hooks, query_scope
+
+_WHITESPACE = re.compile(r'\s+')
+_IN_LIST = re.compile(r'\(\s*(?:\?|%\(\w+\)s|:\w+|%s)(?:\s*,\s*(?:\?|%\(\w+\)s|:\w+|%s))*\s*\)')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a request or block issues more SQL statements than allowed"""
+
+    def __init__(self, name, count, budget, report):
+        self.name = name
+        self.count = count
+        self.budget = budget
+        self.report = report
+        super().__init__(f"{name} executed {count} SQL statements (budget {budget})\n{report.format()}")
+
+def normalize_statement(statement):
+    """Reduce a SQL statement to its shape so repeated lookups compare equal"""
+    shape = _WHITESPACE.sub(' ', statement).strip()
+    shape = _STRING.sub('?', shape)
+    shape = _NUMBER.sub('?', shape)
+    return _IN_LIST.sub('(?)', shape)
+
+class QueryAuditReport:
+    """Statement shapes observed in one request or monitor stage"""
+
+    def __init__(self, name, statements):
+        self.name = name
+        self.count = len(statements)
+        self.shapes = Counter(normalize_statement(s) for s in statements)
+
+    def repeated(self, threshold):
+        """Shapes executed at least `threshold` times, most frequent first"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def format(self, threshold=2, limit=10):
+        lines = [f"{self.name}: {self.count} statements, {len(self.shapes)} distinct"]
+        for shape, count in self.repeated(threshold)[:limit]:
+            lines.append(f"  {count}x {shape[:200]}")
+        return '\n'.join(lines)
+
+def audit_statements(name, statements, budget=None, repeat_threshold=5, strict=False):
+    """Check a scope's statements against a budget and for repeated shapes
+
+    Returns the report; raises QueryBudgetExceeded in strict mode.
+    """
+    report = QueryAuditReport(name, statements)
+
+    if budget is not None and report.count > budget:
+        if strict:
+            raise QueryBudgetExceeded(name, report.count, budget, report)
+        print(f"Query budget exceeded: {report.format()}")
+
+    repeated = report.repeated(repeat_threshold) if repeat_threshold else []
+    if repeated:
+        print(f"Possible N+1 query pattern in {name}:")
+        for shape, count in repeated:
+            print(f"  {count}x {shape[:200]}")
+
+    return report
+
+@contextmanager
+def query_budget(max_queries, name='block', repeat_threshold=None):
+    """Fail if the block executes more than `max_queries` SQL statements
+
+    Intended for tests, e.g. `with query_budget(5): client.get('/api/...')`.
+    """
+    install_sql_hooks()
+    with query_scope(name) as scope:
+        yield scope
+    report = QueryAuditReport(name, scope.statements)
+    if report.count > max_queries:
+        raise QueryBudgetExceeded(name, report.count, max_queries, report)
+    if repeat_threshold:
+        repeated = report.repeated(repeat_threshold)
+        if repeated:
+            raise QueryBudgetExceeded(name, report.count, max_queries, report)
+
+def query_budget_limit(max_queries):
+    """Decorator overriding the per-request query budget for an endpoint"""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            return f(*args, **kwargs)
+        decorated.query_budget = max_queries
+        return decorated
+    return decorator
+
+def init_query_audit(app):
+    """Audit every request when QUERY_AUDIT_ENABLED is set (dev/test mode)"""
+    from flask import g, request
+
+    if not app.config.get('QUERY_AUDIT_ENABLED'):
+        return
+
+    install_sql_hooks()
+
+    @app.before_request
+    def _start_query_audit():
+        g.query_audit_cm = query_scope(request.endpoint or 'unknown')
+        g.query_audit_scope = g.query_audit_cm.__enter__()
+
+    @app.after_request
+    def _finish_query_audit(response):
+        scope_cm = g.pop('query_audit_cm', None)
+        scope = g.pop('query_audit_scope', None)
+        if scope_cm is None:
+            return response
+        scope_cm.__exit__(None, None, None)
+
+        view = app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', app.config.get('QUERY_BUDGET_PER_REQUEST'))
+        report = audit_statements(
+            f"{request.method} {request.path}",
+            scope.statements,
+            budget=budget,
+            repeat_threshold=app.config.get('QUERY_AUDIT_REPEAT_THRESHOLD', 5),
+            strict=app.testing or app.config.get('QUERY_AUDIT_STRICT', False)
+        )
+        response.headers['X-Query-Audit'] = f"{report.count} statements, {len(report.shapes)} distinct"
+        return response
+
+    @app.teardown_request
+    def _discard_query_audit(error=None):
+        scope_cm = g.pop('query_audit_cm', None)
+        if scope_cm is not None:
+            scope_cm.__exit__(None, None, None)
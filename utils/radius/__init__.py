@@ -0,0 +1,14 @@
+"""
+RADIUS
+Built-in RADIUS server: voucher authentication for routers that point their
+hotspot at this system instead of receiving local users, and accounting
+ingestion that replaces usage polling
+"""
+
+from utils.radius.packet import Packet, PacketError
+from utils.radius.index import VoucherIndex, VoucherEntry
+from utils.radius.server import RadiusServer, start_radius_server
+from utils.radius.accounting import AccountingAggregator
+
+__all__ = ['Packet', 'PacketError', 'VoucherIndex', 'VoucherEntry', 'RadiusServer', 'start_radius_server',
+           'AccountingAggregator']
@@ -0,0 +1,362 @@
+"""
+RADIUS Accounting
+Accounting receiver (RFC 2866): Start/Interim-Update/Stop packets are
+acknowledged straight away and coalesced per session in memory; a flusher
+writes the byte deltas to the vouchers in batched UPDATEs on a short interval
+and disconnects vouchers that exhausted their data limit in bulk
+(Disconnect-Message, RFC 5176).
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+from utils.radius import packet as rad
+from utils.radius.server import RadiusProtocol, normalize_mac
+from utils.metrics import RADIUS_REQUESTS, RADIUS_ACCT_FLUSH_LATENCY, RADIUS_DISCONNECTS
+
+# Acct-Status-Type values
+START = 1
+STOP = 2
+INTERIM_UPDATE = 3
+ACCOUNTING_ON = 7
+ACCOUNTING_OFF = 8
+
+ACCT_TERMINATE_CAUSE = 49
+TERMINATE_SESSION_TIMEOUT = 5
+
+MB = 1024 * 1024
+
+class SessionState:
+    """Latest counters of one accounting session and how much was already credited"""
+
+    __slots__ = ('voucher_id', 'code', 'router_id', 'bytes_total', 'credited', 'started_at',
+                 'start_pending', 'stopped_at', 'timed_out', 'mac', 'ip', 'session_id', 'nas_ip', 'dirty',
+                 'seen_at')
+
+    def __init__(self, voucher_id, code, router_id, session_id, nas_ip):
+        self.voucher_id = voucher_id
+        self.code = code
+        self.router_id = router_id
+        self.session_id = session_id
+        self.nas_ip = nas_ip
+        self.bytes_total = 0
+        self.credited = 0
+        self.started_at = None
+        self.start_pending = False
+        self.stopped_at = None
+        self.timed_out = False
+        self.mac = None
+        self.ip = None
+        self.dirty = False
+        self.seen_at = time.monotonic()
+
+def _octets(request, octets, gigawords):
+    return (request.get_int(gigawords, 0) << 32) + request.get_int(octets, 0)
+
+class AccountingProtocol(RadiusProtocol):
+    """Accounting-Request endpoint feeding the aggregator"""
+
+    kind = 'acct'
+
+    def __init__(self, server, aggregator):
+        super().__init__(server)
+        self.aggregator = aggregator
+
+    def datagram_received(self, data, addr):
+        # Accounting is answered inline: no awaiting, so thousands of packets a
+        # second stay on the fast path
+        nas = self.server.nas.get(addr[0])
+        if nas is None:
+            RADIUS_REQUESTS.inc(kind=self.kind, result='unknown_client')
+            return
+        try:
+            request = rad.Packet.decode(data)
+        except rad.PacketError:
+            RADIUS_REQUESTS.inc(kind=self.kind, result='malformed')
+            return
+        if request.code != rad.ACCOUNTING_REQUEST or not rad.verify_request_authenticator(data, nas.secret):
+            RADIUS_REQUESTS.inc(kind=self.kind, result='bad_authenticator')
+            return
+
+        # Retransmissions carry the same counters; recording them again is harmless
+        self.aggregator.record(nas, addr[0], request)
+        RADIUS_REQUESTS.inc(kind=self.kind, result='ok')
+        self.transport.sendto(request.reply(rad.ACCOUNTING_RESPONSE).encode_response(request.authenticator, nas.secret), addr)
+
+class AccountingAggregator:
+    """Coalesces accounting updates per session and flushes them in batches"""
+
+    def __init__(self, server):
+        self.server = server
+        self.app = server.app
+        self.config = server.app.config
+        self._sessions = {}
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _voucher_for(self, request):
+        """(voucher_id, code) from the Class we returned on accept, else the user name"""
+        code = request.get_string(rad.USER_NAME)
+        tag = request.get_string(rad.CLASS) or ''
+        if tag.startswith('wnm:') and tag[4:].isdigit():
+            return int(tag[4:]), code
+        entry = self.server.index.get(code) if code else None
+        return (entry.id, code) if entry is not None else (None, code)
+
+    def record(self, nas, nas_ip, request):
+        status = request.get_int(rad.ACCT_STATUS_TYPE)
+        if status in (ACCOUNTING_ON, ACCOUNTING_OFF):
+            # NAS rebooted: its open sessions are gone
+            for key in [key for key in self._sessions if key[0] == nas_ip]:
+                self._sessions[key].stopped_at = self._sessions[key].stopped_at or datetime.utcnow()
+                self._sessions[key].dirty = True
+            return
+
+        session_id = request.get_string(rad.ACCT_SESSION_ID)
+        if not session_id or status not in (START, STOP, INTERIM_UPDATE):
+            return
+
+        key = (nas_ip, session_id)
+        state = self._sessions.get(key)
+        total = (_octets(request, rad.ACCT_INPUT_OCTETS, rad.ACCT_INPUT_GIGAWORDS)
+                 + _octets(request, rad.ACCT_OUTPUT_OCTETS, rad.ACCT_OUTPUT_GIGAWORDS))
+        if state is None:
+            voucher_id, code = self._voucher_for(request)
+            if voucher_id is None:
+                return
+            state = self._sessions[key] = SessionState(voucher_id, code, nas.router_id, session_id, nas_ip)
+            session_time = request.get_int(rad.ACCT_SESSION_TIME, 0)
+            if status != START and session_time > 2 * self.config.get('RADIUS_ACCT_INTERIM_SECONDS', 60):
+                # Session predates this process (restart): earlier bytes were
+                # credited before, so count from here to avoid double counting
+                state.credited = total
+
+        state.seen_at = time.monotonic()
+        state.mac = normalize_mac(request.get_string(rad.CALLING_STATION_ID)) or state.mac
+        state.ip = request.get_ip(rad.FRAMED_IP_ADDRESS) or state.ip
+        state.bytes_total = max(state.bytes_total, total)  # Counters are cumulative per session
+        if status == START:
+            state.started_at = state.started_at or datetime.utcnow() - timedelta(
+                seconds=request.get_int(rad.ACCT_SESSION_TIME, 0))
+            state.start_pending = True
+        elif status == STOP:
+            state.stopped_at = datetime.utcnow()
+            state.timed_out = request.get_int(ACCT_TERMINATE_CAUSE) == TERMINATE_SESSION_TIMEOUT
+        state.dirty = True
+
+    def _collect(self):
+        """Take the pending deltas; runs on the event loop"""
+        taken = []
+        deltas = {}
+        starts = {}
+        stops = {}
+        for key, state in list(self._sessions.items()):
+            if not state.dirty:
+                if state.stopped_at or time.monotonic() - state.seen_at > 6 * self.config.get('RADIUS_ACCT_INTERIM_SECONDS', 60):
+                    del self._sessions[key]  # Finished or silently gone
+                continue
+            state.dirty = False
+            delta = state.bytes_total - state.credited
+            state.credited = state.bytes_total
+            taken.append((state, delta))
+            usage = deltas.setdefault(state.voucher_id, [0, state.router_id])
+            usage[0] += delta
+            if state.start_pending:
+                state.start_pending = False
+                starts[state.voucher_id] = (state.started_at, state.mac, state.ip)
+            if state.stopped_at and state.timed_out:
+                stops[state.voucher_id] = state.stopped_at
+        return taken, deltas, starts, stops
+
+    @staticmethod
+    def _restore(taken):
+        """Un-credit a batch after a failed write so the next flush retries it"""
+        for state, delta in taken:
+            state.credited -= delta
+            state.dirty = True
+
+    def _write(self, deltas, starts, stops):
+        """Apply a batch to the database (blocking)
+
+        Returns (over-limit (id, code) pairs, usage updates, ended codes).
+        """
+        from database import db
+        from sqlalchemy import bindparam
+        from models.voucher import Voucher
+        from models.voucher_plan import VoucherPlan
+        from models.voucher_change import record_voucher_changes
+        from utils.usage_store import usage_recorder
+
+        table = Voucher.__table__
+        now = datetime.utcnow()
+        with self.app.app_context():
+            try:
+                usage_rows = [{'v_id': voucher_id, 'v_delta': delta / MB}
+                              for voucher_id, (delta, _) in deltas.items() if delta > 0]
+                if usage_rows:
+                    db.session.execute(
+                        table.update().where(table.c.id == bindparam('v_id')).values(
+                            data_used_mb=db.func.coalesce(table.c.data_used_mb, 0.0) + bindparam('v_delta')),
+                        usage_rows)
+
+                start_rows = [{'v_id': voucher_id, 'v_start': started_at, 'v_mac': mac, 'v_ip': ip}
+                              for voucher_id, (started_at, mac, ip) in starts.items()]
+                if start_rows:
+                    db.session.execute(
+                        table.update().where(table.c.id == bindparam('v_id')).values(
+                            session_start=db.func.coalesce(table.c.session_start, bindparam('v_start')),
+                            client_mac=db.func.coalesce(table.c.client_mac, bindparam('v_mac')),
+                            client_ip=db.func.coalesce(bindparam('v_ip'), table.c.client_ip)),
+                        start_rows)
+
+                ids = set(deltas) | set(starts) | set(stops)
+                rows = db.session.query(
+                    Voucher.id, Voucher.code, Voucher.status, Voucher.data_used_mb, VoucherPlan.data_limit_mb
+                ).outerjoin(VoucherPlan, Voucher.plan_id == VoucherPlan.id).filter(
+                    Voucher.id.in_(ids)).all() if ids else []
+
+                # Sessions cut at Session-Timeout and vouchers out of data end now.
+                # Ending a session goes through the ORM so the sales summaries and
+                # the change log see it; a concurrent end fails the batch, which
+                # is then retried
+                ended = [row for row in rows if row.status == 'used' and (
+                    row.id in stops or (row.data_limit_mb and (row.data_used_mb or 0) >= row.data_limit_mb))]
+                ended_ids = set()
+                if ended:
+                    for voucher in Voucher.query.filter(
+                            Voucher.id.in_([row.id for row in ended]), Voucher.status == 'used').all():
+                        voucher.status = 'expired'
+                        voucher.session_end = now
+                        ended_ids.add(voucher.id)
+                    ended = [row for row in ended if row.id in ended_ids]
+
+                # The usage UPDATEs bypass the ORM change-log events
+                record_voucher_changes(
+                    [(row.id, row.code, 'updated') for row in rows
+                     if row.status == 'used' and row.id not in ended_ids])
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+            # Usage history only after the totals are committed, so a retried batch is not counted twice
+            for voucher_id, (delta, router_id) in deltas.items():
+                if delta > 0:
+                    usage_recorder.record(voucher_id, delta / MB, router_id=router_id, recorded_at=now)
+            usage_recorder.flush()
+
+        over_limit = [(row.id, row.code) for row in ended if row.id not in stops]
+        updates = [{'voucher_code': row.code, 'data_used_mb': row.data_used_mb}
+                   for row in rows if row.status == 'used' and row.id not in ended_ids]
+        return over_limit, updates, [row.code for row in ended]
+
+    async def flush(self):
+        """Write pending deltas and disconnect exhausted vouchers; returns vouchers written"""
+        taken, deltas, starts, stops = self._collect()
+        if not taken:
+            return 0
+
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            over_limit, updates, ended_codes = await loop.run_in_executor(None, self._write, deltas, starts, stops)
+        except Exception:
+            self._restore(taken)
+            raise
+        RADIUS_ACCT_FLUSH_LATENCY.observe(time.perf_counter() - start)
+
+        from utils.event_bus import publish_event
+        if updates:
+            publish_event('usage.updated', {'clients': updates})
+        if ended_codes:
+            publish_event('voucher.ended', {'codes': ended_codes})
+        if over_limit:
+            await self.disconnect([voucher_id for voucher_id, _ in over_limit])
+        return len(deltas)
+
+    async def disconnect(self, voucher_ids):
+        """Send Disconnect-Requests for every live session of the vouchers, all at once
+
+        Returns {session_id: 'ack' | 'nak' | 'timeout'}.
+        """
+        wanted = set(voucher_ids)
+        targets = [state for state in self._sessions.values()
+                   if state.voucher_id in wanted and not state.stopped_at and self.server.nas.get(state.nas_ip)]
+        results = {}
+        # Identifiers are one byte, so each socket carries at most 256 requests
+        for offset in range(0, len(targets), 256):
+            results.update(await self._disconnect_batch(targets[offset:offset + 256]))
+
+        for state in targets:
+            RADIUS_DISCONNECTS.inc(result=results[state.session_id])
+            if results[state.session_id] != 'ack':
+                print(f"Disconnect of {state.code} on {state.nas_ip} failed: {results[state.session_id]}")
+        return results
+
+    async def _disconnect_batch(self, targets):
+        loop = asyncio.get_running_loop()
+        port = self.config.get('RADIUS_COA_PORT', 3799)
+        timeout = self.config.get('RADIUS_COA_TIMEOUT_SECONDS', 2)
+
+        requests = {}
+        for identifier, state in enumerate(targets):
+            nas = self.server.nas.get(state.nas_ip)
+            request = rad.Packet(rad.DISCONNECT_REQUEST, identifier)
+            request.add(rad.USER_NAME, state.code)
+            request.add(rad.ACCT_SESSION_ID, state.session_id)
+            if state.mac:
+                request.add(rad.CALLING_STATION_ID, state.mac)
+            data = request.encode_request(nas.secret)
+            requests[identifier] = (state, data, nas.secret)
+
+        transport, protocol = await loop.create_datagram_endpoint(
+            lambda: _DisconnectClient(requests), local_addr=('0.0.0.0', 0))
+        try:
+            for attempt in range(2):
+                for identifier, (state, data, _) in requests.items():
+                    if identifier not in protocol.results:
+                        transport.sendto(data, (state.nas_ip, port))
+                try:
+                    await asyncio.wait_for(protocol.done.wait(), timeout)
+                    break
+                except asyncio.TimeoutError:
+                    continue
+        finally:
+            transport.close()
+
+        return {state.session_id: protocol.results.get(identifier, 'timeout')
+                for identifier, (state, _, _) in requests.items()}
+
+    async def run(self):
+        """Flush on a short interval until cancelled"""
+        interval = self.config.get('RADIUS_ACCT_FLUSH_MS', 1000) / 1000.0
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"RADIUS accounting flush error: {e}")
+
+class _DisconnectClient(asyncio.DatagramProtocol):
+    """Collects Disconnect-ACK/NAK replies for one bulk disconnect"""
+
+    def __init__(self, requests):
+        self.requests = requests
+        self.results = {}
+        self.done = asyncio.Event()
+
+    def datagram_received(self, data, addr):
+        try:
+            response = rad.Packet.decode(data)
+        except rad.PacketError:
+            return
+        request = self.requests.get(response.identifier)
+        if request is None:
+            return
+        state, sent, secret = request
+        if addr[0] != state.nas_ip or not rad.verify_response(data, sent[4:20], secret):
+            return
+        self.results[response.identifier] = 'ack' if response.code == rad.DISCONNECT_ACK else 'nak'
+        if len(self.results) == len(self.requests):
+            self.done.set()
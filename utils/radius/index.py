@@ -0,0 +1,134 @@
+"""
+Voucher Index
+In-memory snapshot of redeemable and in-session vouchers keyed by code, so
+RADIUS authentication answers from memory. Kept fresh from the voucher change
+log, with a read-through lookup for vouchers created after the last load.
+"""
+
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+INDEXED_STATUSES = ('active', 'used')
+
+VoucherEntry = namedtuple('VoucherEntry', [
+    'id', 'code', 'status', 'session_token', 'duration_hours', 'speed_limit_kbps',
+    'data_limit_mb', 'data_used_mb', 'expires_at', 'session_start', 'session_end',
+    'client_mac', 'allowed_networks'
+])
+
+def entry_from_voucher(voucher):
+    """Index entry for a Voucher (or a row with the same columns)"""
+    return VoucherEntry(*(getattr(voucher, field) for field in VoucherEntry._fields))
+
+class VoucherIndex:
+    """Vouchers by code; blocking methods, run them off the event loop"""
+
+    def __init__(self, app, miss_ttl=5.0):
+        self.app = app
+        self.miss_ttl = miss_ttl
+        self._entries = {}
+        self._misses = {}
+        self._revision = 0
+        self._lock = threading.Lock()
+        self.loaded_at = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _query(self, session):
+        """Entry columns, with the shared settings read from the voucher's plan"""
+        from models.voucher import Voucher
+        from models.voucher_plan import VoucherPlan, PLAN_FIELDS
+        columns = [getattr(VoucherPlan if field in PLAN_FIELDS else Voucher, field)
+                   for field in VoucherEntry._fields]
+        return session.query(*columns).outerjoin(VoucherPlan, Voucher.plan_id == VoucherPlan.id)
+
+    def load(self):
+        """Rebuild the index from the database"""
+        from database import db
+        from models.voucher import Voucher
+        from models.voucher_change import settled_revision
+
+        with self.app.app_context():
+            revision = settled_revision()
+            rows = self._query(db.session).filter(Voucher.status.in_(INDEXED_STATUSES)).all()
+            db.session.rollback()
+
+        entries = {row.code: entry_from_voucher(row) for row in rows}
+        with self._lock:
+            self._entries = entries
+            self._misses = {}
+            self._revision = revision
+        self.loaded_at = datetime.utcnow()
+        return len(entries)
+
+    def refresh(self):
+        """Re-read vouchers whose sessions changed since the last refresh"""
+        from database import db
+        from models.voucher import Voucher
+        from models.voucher_change import VoucherChange, settled_revision
+
+        with self.app.app_context():
+            # Changes past the settled revision may still have earlier ones in flight
+            revision = settled_revision()
+            changes = db.session.query(VoucherChange.id, VoucherChange.code).filter(
+                VoucherChange.id > self._revision,
+                VoucherChange.id <= revision
+            ).order_by(VoucherChange.id).all()
+            if not changes:
+                db.session.rollback()
+                self._revision = max(self._revision, revision)
+                return 0
+            codes = {change.code for change in changes}
+            rows = self._query(db.session).filter(Voucher.code.in_(codes)).all()
+            db.session.rollback()
+
+        fresh = {row.code: entry_from_voucher(row) for row in rows}
+        with self._lock:
+            for code in codes:
+                entry = fresh.get(code)
+                if entry is not None and entry.status in INDEXED_STATUSES:
+                    self._entries[code] = entry
+                else:
+                    self._entries.pop(code, None)
+                self._misses.pop(code, None)
+            self._revision = max(self._revision, revision)
+        return len(codes)
+
+    def get(self, code):
+        """Cached entry or None, without touching the database"""
+        return self._entries.get(code)
+
+    def lookup(self, code):
+        """Entry for a code, reading through to the database on a miss"""
+        entry = self._entries.get(code)
+        if entry is not None:
+            return entry
+
+        missed_at = self._misses.get(code)
+        if missed_at is not None and time.monotonic() - missed_at < self.miss_ttl:
+            return None
+
+        from database import db
+        from models.voucher import Voucher
+
+        with self.app.app_context():
+            row = self._query(db.session).filter(Voucher.code == code).first()
+            db.session.rollback()
+
+        with self._lock:
+            if row is None or row.status not in INDEXED_STATUSES:
+                self._misses[code] = time.monotonic()
+                return None
+            entry = self._entries[code] = entry_from_voucher(row)
+            return entry
+
+    def put(self, entry):
+        """Store an entry the caller just wrote to the database"""
+        with self._lock:
+            if entry.status in INDEXED_STATUSES:
+                self._entries[entry.code] = entry
+            else:
+                self._entries.pop(entry.code, None)
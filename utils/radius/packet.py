@@ -0,0 +1,257 @@
+"""
+RADIUS Packets
+RFC 2865/2866 packet encoding and decoding, User-Password and CHAP checks,
+and the response/Message-Authenticator signatures
+"""
+
+import hashlib
+import hmac
+import struct
+
+# Packet codes
+ACCESS_REQUEST = 1
+ACCESS_ACCEPT = 2
+ACCESS_REJECT = 3
+ACCOUNTING_REQUEST = 4
+ACCOUNTING_RESPONSE = 5
+DISCONNECT_REQUEST = 40
+DISCONNECT_ACK = 41
+DISCONNECT_NAK = 42
+COA_REQUEST = 43
+COA_ACK = 44
+COA_NAK = 45
+
+# Standard attributes
+USER_NAME = 1
+USER_PASSWORD = 2
+CHAP_PASSWORD = 3
+NAS_IP_ADDRESS = 4
+FRAMED_IP_ADDRESS = 8
+REPLY_MESSAGE = 18
+CLASS = 25
+VENDOR_SPECIFIC = 26
+SESSION_TIMEOUT = 27
+IDLE_TIMEOUT = 28
+CALLING_STATION_ID = 31
+NAS_IDENTIFIER = 32
+ACCT_STATUS_TYPE = 40
+ACCT_INPUT_OCTETS = 42
+ACCT_OUTPUT_OCTETS = 43
+ACCT_SESSION_ID = 44
+ACCT_SESSION_TIME = 46
+ACCT_INPUT_GIGAWORDS = 52
+ACCT_OUTPUT_GIGAWORDS = 53
+CHAP_CHALLENGE = 60
+MESSAGE_AUTHENTICATOR = 80
+ACCT_INTERIM_INTERVAL = 85
+
+# Vendor-specific attributes: (vendor id, vendor type)
+MIKROTIK_VENDOR = 14988
+MIKROTIK_RATE_LIMIT = (MIKROTIK_VENDOR, 8)
+MIKROTIK_TOTAL_LIMIT = (MIKROTIK_VENDOR, 17)
+MIKROTIK_TOTAL_LIMIT_GIGAWORDS = (MIKROTIK_VENDOR, 18)
+WISPR_VENDOR = 14122
+WISPR_BANDWIDTH_MAX_UP = (WISPR_VENDOR, 7)
+WISPR_BANDWIDTH_MAX_DOWN = (WISPR_VENDOR, 8)
+
+MAX_PACKET_SIZE = 4096
+
+class PacketError(ValueError):
+    """Malformed RADIUS packet"""
+
+class Packet:
+    """A RADIUS packet; attributes keep wire order and may repeat
+
+    `attributes` is a list of (type, value-bytes); vendor-specific attributes
+    are stored as ((vendor, vendor_type), value-bytes).
+    """
+
+    def __init__(self, code, identifier, authenticator=b'\x00' * 16, attributes=None):
+        self.code = code
+        self.identifier = identifier
+        self.authenticator = authenticator
+        self.attributes = attributes or []
+
+    @classmethod
+    def decode(cls, data):
+        if len(data) < 20:
+            raise PacketError('Packet shorter than header')
+        code, identifier, length = struct.unpack('!BBH', data[:4])
+        if length < 20 or length > len(data) or length > MAX_PACKET_SIZE:
+            raise PacketError('Bad packet length')
+
+        attributes = []
+        offset = 20
+        while offset < length:
+            if offset + 2 > length:
+                raise PacketError('Truncated attribute')
+            attr_type, attr_length = data[offset], data[offset + 1]
+            if attr_length < 2 or offset + attr_length > length:
+                raise PacketError('Bad attribute length')
+            value = data[offset + 2:offset + attr_length]
+            if attr_type == VENDOR_SPECIFIC and len(value) >= 6:
+                vendor = struct.unpack('!I', value[:4])[0]
+                sub = 4
+                while sub + 2 <= len(value):
+                    vendor_type, vendor_length = value[sub], value[sub + 1]
+                    if vendor_length < 2 or sub + vendor_length > len(value):
+                        break
+                    attributes.append(((vendor, vendor_type), value[sub + 2:sub + vendor_length]))
+                    sub += vendor_length
+            else:
+                attributes.append((attr_type, value))
+            offset += attr_length
+
+        return cls(code, identifier, data[4:20], attributes)
+
+    def get(self, attr_type, default=None):
+        for key, value in self.attributes:
+            if key == attr_type:
+                return value
+        return default
+
+    def get_string(self, attr_type, default=None):
+        value = self.get(attr_type)
+        return value.decode('utf-8', 'replace') if value is not None else default
+
+    def get_int(self, attr_type, default=None):
+        value = self.get(attr_type)
+        return struct.unpack('!I', value)[0] if value is not None and len(value) == 4 else default
+
+    def get_ip(self, attr_type, default=None):
+        value = self.get(attr_type)
+        return '.'.join(str(b) for b in value) if value is not None and len(value) == 4 else default
+
+    def add(self, attr_type, value):
+        """Append an attribute; ints are encoded as 32-bit, strings as UTF-8"""
+        if isinstance(value, int):
+            value = struct.pack('!I', value & 0xFFFFFFFF)
+        elif isinstance(value, str):
+            value = value.encode('utf-8')
+        self.attributes.append((attr_type, value))
+        return self
+
+    def _encode_attributes(self):
+        chunks = []
+        for key, value in self.attributes:
+            value = value[:247]
+            if isinstance(key, tuple):
+                vendor, vendor_type = key
+                sub = struct.pack('!BB', vendor_type, len(value) + 2) + value
+                chunks.append(struct.pack('!BBI', VENDOR_SPECIFIC, len(sub) + 6, vendor) + sub)
+            else:
+                chunks.append(struct.pack('!BB', key, len(value) + 2) + value)
+        return b''.join(chunks)
+
+    def encode(self, authenticator=None):
+        attributes = self._encode_attributes()
+        header = struct.pack('!BBH', self.code, self.identifier, 20 + len(attributes))
+        return header + (authenticator or self.authenticator) + attributes
+
+    def reply(self, code):
+        """Empty response packet for this request"""
+        return Packet(code, self.identifier, self.authenticator)
+
+    def _sign_message_authenticator(self, authenticator, secret):
+        """Append an HMAC-MD5 Message-Authenticator over the packet (RFC 3579)"""
+        self.attributes = [(k, v) for k, v in self.attributes if k != MESSAGE_AUTHENTICATOR]
+        self.attributes.append((MESSAGE_AUTHENTICATOR, b'\x00' * 16))
+        unsigned = self.encode(authenticator)
+        self.attributes[-1] = (MESSAGE_AUTHENTICATOR, hmac.new(secret, unsigned, hashlib.md5).digest())
+
+    def encode_access_request(self, secret, message_authenticator=True):
+        """Encode an Access-Request with its random authenticator"""
+        if message_authenticator:
+            self._sign_message_authenticator(self.authenticator, secret)
+        return self.encode()
+
+    def encode_response(self, request_authenticator, secret, message_authenticator=False):
+        """Sign and encode a response to a request (RFC 2865 section 3)
+
+        Pass `message_authenticator` when the request carried one, so the
+        reply is protected the same way.
+        """
+        if message_authenticator:
+            self._sign_message_authenticator(request_authenticator, secret)
+        unsigned = self.encode(request_authenticator)
+        signature = hashlib.md5(unsigned + secret).digest()
+        return unsigned[:4] + signature + unsigned[20:]
+
+    def encode_request(self, secret):
+        """Encode an Accounting/CoA/Disconnect request with its MD5 authenticator (RFC 2866)"""
+        unsigned = self.encode(b'\x00' * 16)
+        signature = hashlib.md5(unsigned + secret).digest()
+        return unsigned[:4] + signature + unsigned[20:]
+
+def verify_message_authenticator(data, packet, secret, request_authenticator=None, required=False):
+    """Check the HMAC-MD5 Message-Authenticator; an absent one passes unless required
+
+    Access-Requests without it can be forged by an MD5 chosen-prefix attack
+    on the response authenticator (Blast-RADIUS, CVE-2024-3596).
+    """
+    received = packet.get(MESSAGE_AUTHENTICATOR)
+    if received is None:
+        return not required
+    offset = 20
+    length = struct.unpack('!H', data[2:4])[0]
+    zeroed = bytearray(data[:length])
+    while offset < length:
+        attr_type, attr_length = zeroed[offset], zeroed[offset + 1]
+        if attr_type == MESSAGE_AUTHENTICATOR and attr_length == 18:
+            zeroed[offset + 2:offset + 18] = b'\x00' * 16
+        offset += max(attr_length, 2)
+    if request_authenticator is not None:
+        zeroed[4:20] = request_authenticator
+    expected = hmac.new(secret, bytes(zeroed), hashlib.md5).digest()
+    return hmac.compare_digest(expected, received)
+
+def verify_request_authenticator(data, secret):
+    """Check an Accounting/CoA request authenticator (RFC 2866 section 3)"""
+    length = struct.unpack('!H', data[2:4])[0]
+    unsigned = data[:4] + b'\x00' * 16 + data[20:length]
+    return hmac.compare_digest(hashlib.md5(unsigned + secret).digest(), data[4:20])
+
+def verify_response(data, request_authenticator, secret):
+    """Check a response authenticator against the request we sent"""
+    length = struct.unpack('!H', data[2:4])[0]
+    unsigned = data[:4] + request_authenticator + data[20:length]
+    return hmac.compare_digest(hashlib.md5(unsigned + secret).digest(), data[4:20])
+
+def encrypt_password(password, secret, authenticator):
+    """User-Password hiding (RFC 2865 section 5.2)"""
+    if isinstance(password, str):
+        password = password.encode('utf-8')
+    padded = password.ljust(max(16, -(-len(password) // 16) * 16), b'\x00')
+    result = b''
+    previous = authenticator
+    for i in range(0, len(padded), 16):
+        digest = hashlib.md5(secret + previous).digest()
+        block = bytes(a ^ b for a, b in zip(padded[i:i + 16], digest))
+        result += block
+        previous = block
+    return result
+
+def decrypt_password(hidden, secret, authenticator):
+    if not hidden or len(hidden) % 16:
+        raise PacketError('Bad User-Password length')
+    result = b''
+    previous = authenticator
+    for i in range(0, len(hidden), 16):
+        digest = hashlib.md5(secret + previous).digest()
+        result += bytes(a ^ b for a, b in zip(hidden[i:i + 16], digest))
+        previous = hidden[i:i + 16]
+    return result.rstrip(b'\x00').decode('utf-8', 'replace')
+
+def check_chap(packet, candidates):
+    """True if the CHAP-Password response matches one of the candidate secrets"""
+    chap = packet.get(CHAP_PASSWORD)
+    if chap is None or len(chap) != 17:
+        return False
+    challenge = packet.get(CHAP_CHALLENGE) or packet.authenticator
+    for candidate in candidates:
+        if not candidate:
+            continue
+        expected = hashlib.md5(chap[:1] + candidate.encode('utf-8') + challenge).digest()
+        if hmac.compare_digest(expected, chap[1:]):
+            return True
+    return False
@@ -0,0 +1,359 @@
+"""
+RADIUS Server
+Asyncio UDP RADIUS authentication (RFC 2865) for routers configured with a
+`radius_secret`: guests log in with their voucher code and get
+Session-Timeout, rate-limit and quota attributes from the voucher, so no
+per-activation router writes are needed. Accounting (utils/radius/accounting)
+shares the same loop and client list.
+"""
+
+import asyncio
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from utils.radius import packet as rad
+from utils.radius.index import VoucherIndex, entry_from_voucher
+from utils.rate_limits import get_voucher_rate_limit
+from utils.metrics import RADIUS_REQUESTS, RADIUS_LATENCY
+
+NasClient = namedtuple('NasClient', ['router_id', 'name', 'brand', 'secret', 'networks', 'require_authenticator'])
+NetworkLimits = namedtuple('NetworkLimits', ['id', 'is_active', 'max_download_mbps', 'max_upload_mbps'])
+
+# Retransmissions of a request within this window get the original reply
+DUPLICATE_WINDOW_SECONDS = 10
+
+REJECT_MESSAGE = 'كارت الاتصال منتهي الصلاحية أو مستخدم'
+
+def normalize_mac(value):
+    """Calling-Station-Id as AA:BB:CC:DD:EE:FF (routers use -, : or none)"""
+    if not value:
+        return None
+    digits = ''.join(c for c in value if c.isalnum()).upper()
+    if len(digits) != 12:
+        return value.upper()
+    return ':'.join(digits[i:i + 2] for i in range(0, 12, 2))
+
+class NasDirectory:
+    """RADIUS clients (routers) by source IP with their secrets and network caps"""
+
+    def __init__(self, app):
+        self.app = app
+        self._clients = {}
+
+    def get(self, ip):
+        return self._clients.get(ip)
+
+    def __len__(self):
+        return len(self._clients)
+
+    def load(self):
+        """Reload clients from the routers table (blocking)"""
+        from database import db
+        from models.router import Router
+        from sqlalchemy.orm import selectinload
+
+        # NAS that cannot send Message-Authenticator yet, by IP address
+        require = self.app.config.get('RADIUS_REQUIRE_MESSAGE_AUTHENTICATOR', True)
+        exempt = {ip.strip() for ip in (self.app.config.get('RADIUS_MESSAGE_AUTHENTICATOR_EXEMPT') or '').split(',')}
+
+        with self.app.app_context():
+            routers = Router.query.options(selectinload(Router.networks)).filter(
+                Router.is_active == True, Router.uses_radius
+            ).all()
+            clients = {
+                router.ip_address: NasClient(
+                    router.id, router.name, router.brand, router.radius_secret.encode('utf-8'),
+                    tuple(NetworkLimits(n.id, n.is_active, n.max_download_mbps, n.max_upload_mbps)
+                          for n in router.networks),
+                    require and router.ip_address not in exempt
+                )
+                for router in routers
+            }
+            db.session.rollback()
+        self._clients = clients
+        return len(clients)
+
+class RadiusProtocol(asyncio.DatagramProtocol):
+    """UDP endpoint that verifies the NAS, drops duplicates and dispatches requests"""
+
+    kind = 'radius'
+
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self._recent = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        nas = self.server.nas.get(addr[0])
+        if nas is None:
+            RADIUS_REQUESTS.inc(kind=self.kind, result='unknown_client')
+            return  # RFC 2865: silently discard requests from unknown clients
+        try:
+            request = rad.Packet.decode(data)
+        except rad.PacketError:
+            RADIUS_REQUESTS.inc(kind=self.kind, result='malformed')
+            return
+
+        key = (addr, request.identifier, request.authenticator)
+        recent = self._recent.get(key)
+        if recent is not None:
+            if recent[1] is not None:
+                self.transport.sendto(recent[1], addr)
+            return  # Still being answered
+        self._recent[key] = (time.monotonic(), None)
+        asyncio.ensure_future(self._answer(key, nas, data, request, addr))
+
+    async def _answer(self, key, nas, data, request, addr):
+        start = time.perf_counter()
+        try:
+            response = await self.handle(nas, data, request)
+        except Exception as e:
+            print(f"RADIUS {self.kind} error for {addr[0]}: {e}")
+            response = None
+        if response is None:
+            self._recent.pop(key, None)
+            return
+        self._recent[key] = (time.monotonic(), response)
+        self.transport.sendto(response, addr)
+        RADIUS_LATENCY.observe(time.perf_counter() - start, kind=self.kind)
+
+    def prune(self):
+        cutoff = time.monotonic() - DUPLICATE_WINDOW_SECONDS
+        for key in [key for key, (at, response) in self._recent.items() if at < cutoff and response is not None]:
+            del self._recent[key]
+
+    async def handle(self, nas, data, request):
+        raise NotImplementedError
+
+class AuthProtocol(RadiusProtocol):
+    """Access-Request handling against the voucher index"""
+
+    kind = 'auth'
+
+    async def handle(self, nas, data, request):
+        if request.code != rad.ACCESS_REQUEST:
+            return None
+        has_authenticator = request.get(rad.MESSAGE_AUTHENTICATOR) is not None
+        if not rad.verify_message_authenticator(data, request, nas.secret,
+                                                required=nas.require_authenticator):
+            RADIUS_REQUESTS.inc(kind=self.kind, result='bad_authenticator')
+            return None
+
+        reply = await self.server.authorize(nas, request)
+        result = 'accept' if reply.code == rad.ACCESS_ACCEPT else 'reject'
+        RADIUS_REQUESTS.inc(kind=self.kind, result=result)
+        return reply.encode_response(request.authenticator, nas.secret, has_authenticator)
+
+class RadiusServer:
+    """Voucher-backed RADIUS service on its own event loop"""
+
+    def __init__(self, app):
+        self.app = app
+        self.config = app.config
+        self.index = VoucherIndex(app)
+        self.nas = NasDirectory(app)
+        self.accounting = None
+        self._protocols = []
+        self._transports = []
+        self._loop = None
+        self._thread = None
+
+    async def _in_thread(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def authorize(self, nas, request):
+        """Access-Accept with session attributes, or Access-Reject"""
+        reject = request.reply(rad.ACCESS_REJECT).add(rad.REPLY_MESSAGE, REJECT_MESSAGE)
+        code = (request.get_string(rad.USER_NAME) or '').strip()
+        if not code:
+            return reject
+
+        entry = self.index.get(code) or await self._in_thread(self.index.lookup, code)
+        if entry is None or not self._password_matches(nas, request, entry):
+            return reject
+
+        now = datetime.utcnow()
+        mac = normalize_mac(request.get_string(rad.CALLING_STATION_ID))
+        if entry.status == 'active':
+            if entry.expires_at and entry.expires_at < now:
+                return reject
+            # First login is the activation
+            entry = await self._in_thread(self._claim, entry.id, mac, request.get_ip(rad.FRAMED_IP_ADDRESS))
+            if entry is None:
+                return reject
+        elif entry.status == 'used':
+            if entry.session_end and entry.session_end <= now:
+                return reject
+            if entry.client_mac and mac and normalize_mac(entry.client_mac) != mac:
+                return reject  # Voucher is bound to another device
+        else:
+            return reject
+
+        if entry.data_limit_mb and (entry.data_used_mb or 0) >= entry.data_limit_mb:
+            return reject
+        return self._accept(nas, request, entry, now)
+
+    @staticmethod
+    def _password_matches(nas, request, entry):
+        """PAP or CHAP with the voucher code (or the portal's session token) as password"""
+        candidates = [entry.code, entry.session_token]
+        hidden = request.get(rad.USER_PASSWORD)
+        if hidden is not None:
+            try:
+                password = rad.decrypt_password(hidden, nas.secret, request.authenticator)
+            except rad.PacketError:
+                return False
+            return password in [candidate for candidate in candidates if candidate]
+        return rad.check_chap(request, candidates)
+
+    def _claim(self, voucher_id, client_mac, client_ip):
+        """Start the voucher's session in the database; returns the new entry or None"""
+        from database import db
+        from models.voucher import Voucher
+        from sqlalchemy.orm.exc import StaleDataError
+        from utils.event_bus import publish_event
+
+        with self.app.app_context():
+            voucher = Voucher.query.get(voucher_id)
+            if voucher is None or not voucher.is_valid():
+                entry = entry_from_voucher(voucher) if voucher is not None else None
+                db.session.rollback()
+                # A concurrent login from the same device already claimed it
+                if entry is not None and entry.status == 'used' and normalize_mac(entry.client_mac) == client_mac:
+                    return entry
+                return None
+            voucher.start_session(client_mac, client_ip)
+            try:
+                db.session.commit()
+            except StaleDataError:
+                db.session.rollback()
+                return None
+            entry = entry_from_voucher(voucher)
+            publish_event('voucher.activated', voucher.to_client_dict())
+
+        self.index.put(entry)
+        return entry
+
+    def _accept(self, nas, request, entry, now):
+        accept = request.reply(rad.ACCESS_ACCEPT)
+        accept.add(rad.CLASS, f"wnm:{entry.id}")  # Echoed in accounting
+        if self.config.get('RADIUS_ACCOUNTING_ENABLED'):
+            accept.add(rad.ACCT_INTERIM_INTERVAL, self.config.get('RADIUS_ACCT_INTERIM_SECONDS', 60))
+
+        if entry.session_end:
+            accept.add(rad.SESSION_TIMEOUT, max(1, int((entry.session_end - now).total_seconds())))
+
+        limit = get_voucher_rate_limit(entry, nas.networks)
+        if limit is not None:
+            accept.add(rad.MIKROTIK_RATE_LIMIT, limit.mikrotik_rate_limit)
+            if limit.upload_kbps:
+                accept.add(rad.WISPR_BANDWIDTH_MAX_UP, limit.upload_kbps * 1000)
+            if limit.download_kbps:
+                accept.add(rad.WISPR_BANDWIDTH_MAX_DOWN, limit.download_kbps * 1000)
+
+        if entry.data_limit_mb:
+            remaining = int((entry.data_limit_mb - (entry.data_used_mb or 0)) * 1024 * 1024)
+            accept.add(rad.MIKROTIK_TOTAL_LIMIT, remaining & 0xFFFFFFFF)
+            if remaining >> 32:
+                accept.add(rad.MIKROTIK_TOTAL_LIMIT_GIGAWORDS, remaining >> 32)
+        return accept
+
+    async def _maintain(self):
+        """Keep the voucher index and client list fresh; prune duplicate caches"""
+        refresh = self.config.get('RADIUS_INDEX_REFRESH_SECONDS', 1)
+        reload_every = self.config.get('RADIUS_INDEX_RELOAD_SECONDS', 300)
+        nas_every = self.config.get('RADIUS_NAS_REFRESH_SECONDS', 30)
+        last_reload = last_nas = time.monotonic()
+        while True:
+            await asyncio.sleep(refresh)
+            try:
+                now = time.monotonic()
+                if now - last_reload >= reload_every:
+                    await self._in_thread(self.index.load)
+                    last_reload = now
+                else:
+                    await self._in_thread(self.index.refresh)
+                if now - last_nas >= nas_every:
+                    await self._in_thread(self.nas.load)
+                    last_nas = now
+                for protocol in self._protocols:
+                    protocol.prune()
+            except Exception as e:
+                print(f"RADIUS index refresh error: {e}")
+
+    async def start(self):
+        """Load state and bind the UDP endpoints on the running loop"""
+        loop = asyncio.get_running_loop()
+        await self._in_thread(self.nas.load)
+        vouchers = await self._in_thread(self.index.load)
+
+        bind = self.config.get('RADIUS_BIND', '0.0.0.0')
+        port = self.config.get('RADIUS_AUTH_PORT', 1812)
+        transport, protocol = await loop.create_datagram_endpoint(lambda: AuthProtocol(self), local_addr=(bind, port))
+        self._transports.append(transport)
+        self._protocols.append(protocol)
+        self.auth_port = transport.get_extra_info('sockname')[1]
+        loop.create_task(self._maintain())
+
+        if self.config.get('RADIUS_ACCOUNTING_ENABLED'):
+            from utils.radius.accounting import AccountingProtocol, AccountingAggregator
+
+            self.accounting = AccountingAggregator(self)
+            transport, protocol = await loop.create_datagram_endpoint(
+                lambda: AccountingProtocol(self, self.accounting),
+                local_addr=(bind, self.config.get('RADIUS_ACCT_PORT', 1813)))
+            self._transports.append(transport)
+            self._protocols.append(protocol)
+            self.acct_port = transport.get_extra_info('sockname')[1]
+            loop.create_task(self.accounting.run())
+            print(f"RADIUS accounting listening on {bind}:{self.acct_port}")
+
+        print(f"RADIUS server listening on {bind}:{self.auth_port} "
+              f"({len(self.nas)} clients, {vouchers} vouchers indexed)")
+
+    def stop(self):
+        for transport in self._transports:
+            transport.close()
+        self._transports = []
+        self._protocols = []
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def run_forever(self):
+        """Serve in the calling thread (dedicated RADIUS process)"""
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self.start())
+        self._loop.run_forever()
+
+    def start_background(self):
+        """Serve on a daemon thread; returns once the sockets are bound"""
+        started = threading.Event()
+        errors = []
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            try:
+                self._loop.run_until_complete(self.start())
+            except Exception as e:
+                errors.append(e)
+                started.set()
+                return
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name='radius-server', daemon=True)
+        self._thread.start()
+        started.wait()
+        if errors:
+            raise errors[0]
+        return self
+
+def start_radius_server(app):
+    """Start the RADIUS server inside this process (development)"""
+    return RadiusServer(app).start_background()
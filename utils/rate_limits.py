@@ -0,0 +1,144 @@
+"""
+Rate Limit Provisioning
+Maps voucher and network speed limits onto a small set of shared router
+profiles, so thousands of users reuse a handful of queue templates
+"""
+
+import json
+import threading
+from collections import defaultdict, namedtuple
+
+DEFAULT_PROFILE = 'voucher_profile'
+
+class RateLimit(namedtuple('RateLimit', ['download_kbps', 'upload_kbps'])):
+    """Per-user bandwidth limit in kbit/s (0 means unlimited)"""
+
+    __slots__ = ()
+
+    @property
+    def profile_name(self):
+        """Name of the shared router profile for this limit"""
+        return f"wnm_{self.download_kbps}k_{self.upload_kbps}k"
+
+    @property
+    def mikrotik_rate_limit(self):
+        """RouterOS rate-limit value (client upload/download)"""
+        return f"{self.upload_kbps}k/{self.download_kbps}k"
+
+def _cap(limit, cap):
+    if not cap:
+        return limit
+    if not limit:
+        return cap
+    return min(limit, cap)
+
+def get_allowed_network_ids(voucher):
+    """Decode the voucher's network restriction list, or None if unrestricted"""
+    if not voucher.allowed_networks:
+        return None
+    try:
+        return set(json.loads(voucher.allowed_networks))
+    except ValueError:
+        return None
+
+def get_voucher_rate_limit(voucher, networks=()):
+    """Effective limit for a voucher on a router serving the given networks
+
+    `Voucher.speed_limit_kbps` is in KB/s and applies in both directions;
+    the strictest cap of the networks the voucher may join also applies.
+    Returns None when the user is unlimited.
+    """
+    voucher_kbps = (voucher.speed_limit_kbps or 0) * 8
+    download_kbps = voucher_kbps
+    upload_kbps = voucher_kbps
+
+    allowed = get_allowed_network_ids(voucher)
+    for network in networks:
+        if not network.is_active or (allowed is not None and network.id not in allowed):
+            continue
+        download_kbps = _cap(download_kbps, (network.max_download_mbps or 0) * 1000)
+        upload_kbps = _cap(upload_kbps, (network.max_upload_mbps or 0) * 1000)
+
+    if not download_kbps and not upload_kbps:
+        return None
+    return RateLimit(download_kbps, upload_kbps)
+
+class RateLimitProvisioner:
+    """Push users to a router grouped by shared rate-limit profile"""
+
+    # Profiles known to exist per router id, so they are listed once per process
+    _known_profiles = defaultdict(set)
+    _lock = threading.Lock()
+
+    def __init__(self, router, manager):
+        self.router = router
+        self.manager = manager
+
+    def provision(self, vouchers):
+        """Add vouchers to the router; returns {code: success}"""
+        networks = list(self.router.networks)
+        groups = defaultdict(list)
+        for voucher in vouchers:
+            groups[get_voucher_rate_limit(voucher, networks)].append(voucher)
+
+        if self.router.brand == 'MikroTik':
+            return self._provision_mikrotik(groups)
+        if self.router.brand == 'Ubiquiti':
+            return self._provision_unifi(groups)
+        return {voucher.code: False for voucher in vouchers}
+
+    def _ensure_mikrotik_profiles(self, limits):
+        with self._lock:
+            known = self._known_profiles[self.router.id]
+            missing = [limit for limit in limits if limit.profile_name not in known]
+
+        if missing:
+            existing = self.manager.get_hotspot_profiles()
+            to_create = [limit for limit in missing if limit.profile_name not in existing]
+            created = self.manager.add_hotspot_profiles(
+                [(limit.profile_name, limit.mikrotik_rate_limit) for limit in to_create]
+            )
+            with self._lock:
+                self._known_profiles[self.router.id].update(existing)
+                self._known_profiles[self.router.id].update(created)
+
+        with self._lock:
+            known = self._known_profiles[self.router.id]
+            return {limit for limit in limits if limit.profile_name in known}
+
+    def _provision_mikrotik(self, groups):
+        limits = [limit for limit in groups if limit is not None]
+        available = self._ensure_mikrotik_profiles(limits) if limits else set()
+
+        users = []
+        for limit, vouchers in groups.items():
+            # Fall back to the default profile rather than failing activation
+            profile = limit.profile_name if limit in available else DEFAULT_PROFILE
+            users.extend((v.code, v.session_token, profile) for v in vouchers)
+
+        return self.manager.add_hotspot_users(users)
+
+    def _provision_unifi(self, groups):
+        guests = []
+        for limit, vouchers in groups.items():
+            for voucher in vouchers:
+                duration_minutes, quota_mb = voucher.session_allowance()
+                guests.append({
+                    'username': voucher.code,
+                    'password': voucher.session_token,
+                    'duration_minutes': duration_minutes,
+                    'down_kbps': limit.download_kbps if limit else 0,
+                    'up_kbps': limit.upload_kbps if limit else 0,
+                    'quota_mb': quota_mb
+                })
+        return self.manager.add_guest_users(guests)
+
+    @classmethod
+    def forget_router(cls, router_id):
+        """Drop cached profile names (e.g. after a router was reset)"""
+        with cls._lock:
+            cls._known_profiles.pop(router_id, None)
+
+def provision_vouchers(router, manager, vouchers):
+    """Provision vouchers on a connected router with shared rate-limit profiles"""
+    return RateLimitProvisioner(router, manager).provision(vouchers)
@@ -0,0 +1,176 @@
+"""
+Router Reconciliation
+Brings each router's local user list back in line with the database: one bulk
+read per router, set differences against the vouchers in session, then the
+minimal batch of adds and removes, throttled per router
+"""
+
+import asyncio
+import time
+from datetime import datetime
+from flask import current_app
+from database import db
+from models.voucher import Voucher
+from models.router import Router
+from sqlalchemy.orm import selectinload, joinedload
+from utils.drivers import RouterEndpoint, HotspotUser, driver_runtime
+from utils.rate_limits import get_voucher_rate_limit
+
+# IN-list size for code lookups
+LOOKUP_CHUNK = 500
+
+# Codes listed per router in the report
+REPORT_SAMPLE = 20
+
+def _chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def expected_codes(now=None):
+    """Codes of vouchers whose session is open, i.e. that routers should know"""
+    now = now or datetime.utcnow()
+    rows = db.session.query(Voucher.code).filter(
+        Voucher.status == 'used',
+        db.or_(Voucher.session_end.is_(None), Voucher.session_end > now)
+    ).all()
+    return {code for code, in rows}
+
+def _stale_codes(candidates):
+    """Which router usernames are our vouchers that are no longer in session
+
+    Usernames the database does not know (router admins, manual accounts)
+    are never touched.
+    """
+    stale = set()
+    for chunk in _chunks(candidates, LOOKUP_CHUNK):
+        stale.update(code for code, in db.session.query(Voucher.code).filter(
+            Voucher.code.in_(chunk), Voucher.status != 'used'
+        ).all())
+    return stale
+
+def _load_vouchers(codes):
+    vouchers = {}
+    for chunk in _chunks(codes, LOOKUP_CHUNK):
+        for voucher in Voucher.query.options(joinedload(Voucher.plan)).filter(Voucher.code.in_(chunk)).all():
+            vouchers[voucher.code] = voucher
+    return vouchers
+
+async def _throttled(endpoint, operation, items, batch_size, max_per_second):
+    """Run a driver operation over items in batches, at most max_per_second items a second"""
+    outcome = {}
+    for batch in _chunks(items, batch_size):
+        start = time.monotonic()
+        outcome.update(await driver_runtime.call(endpoint, operation, batch))
+        if max_per_second:
+            pause = len(batch) / max_per_second - (time.monotonic() - start)
+            if pause > 0:
+                await asyncio.sleep(pause)
+    return outcome
+
+async def _apply(plans, batch_size, max_per_second, concurrency):
+    limit = asyncio.Semaphore(concurrency)
+
+    async def apply_router(router_id, endpoint, users, removals):
+        async with limit:
+            try:
+                # Removals first: they free names a re-issued code may need
+                removed = await _throttled(endpoint, 'revoke', removals, batch_size, max_per_second) if removals else {}
+                added = await _throttled(endpoint, 'provision', users, batch_size, max_per_second) if users else {}
+                return router_id, (added, removed)
+            except Exception as e:
+                return router_id, e
+
+    return dict(await asyncio.gather(*(
+        apply_router(router_id, endpoint, users, removals)
+        for router_id, (endpoint, users, removals) in plans.items()
+    )))
+
+def reconcile_routers(router_ids=None, dry_run=False, batch_size=None, max_per_second=None):
+    """Reconcile routers with the database; returns a report per router
+
+    Must be called inside an application context. RADIUS routers hold no
+    local users and are skipped. With `dry_run` nothing is changed and the
+    report lists what would be added and removed.
+    """
+    config = current_app.config
+    batch_size = batch_size or config.get('RECONCILE_BATCH_SIZE', 1000)
+    max_per_second = config.get('RECONCILE_MAX_OPS_PER_SECOND', 5000) if max_per_second is None else max_per_second
+    started = time.perf_counter()
+    query = Router.query.options(selectinload(Router.networks)).filter_by(is_active=True)
+    if router_ids:
+        query = query.filter(Router.id.in_(router_ids))
+    routers = [router for router in query.all() if not router.uses_radius]
+    if not routers:
+        return {'dry_run': dry_run, 'routers': [], 'seconds': 0.0}
+
+    expected = expected_codes()
+
+    # One bulk read per router, all routers concurrently
+    endpoints = {router.id: RouterEndpoint.from_router(router) for router in routers}
+    listed = driver_runtime.run(driver_runtime.fan_out(
+        [(endpoint, ()) for endpoint in endpoints.values()], 'list_users'))
+
+    # Set differences per router; foreign usernames are resolved in one pass
+    diffs = {}
+    candidates = set()
+    for router in routers:
+        users = listed.get(router.id)
+        if isinstance(users, Exception) or users is None:
+            continue
+        users = set(users)
+        diffs[router.id] = (users, expected - users, users - expected)
+        candidates |= users - expected
+    stale = _stale_codes(candidates) if candidates else set()
+
+    reports = []
+    plans = {}
+    missing_all = set()
+    for router in routers:
+        report = {'router_id': router.id, 'name': router.name, 'brand': router.brand}
+        reports.append(report)
+        if router.id not in diffs:
+            report['error'] = str(listed.get(router.id))
+            continue
+        users, missing, extra = diffs[router.id]
+        extra &= stale
+        report.update({
+            'router_users': len(users),
+            'expected': len(expected),
+            'missing': len(missing),
+            'extra': len(extra),
+            'missing_sample': sorted(missing)[:REPORT_SAMPLE],
+            'extra_sample': sorted(extra)[:REPORT_SAMPLE]
+        })
+        if missing or extra:
+            plans[router.id] = (missing, extra)
+            missing_all |= missing
+
+    if dry_run or not plans:
+        db.session.rollback()
+        return {'dry_run': dry_run, 'routers': reports, 'seconds': round(time.perf_counter() - started, 3)}
+
+    vouchers = _load_vouchers(missing_all)
+    by_id = {router.id: router for router in routers}
+    jobs = {}
+    for router_id, (missing, extra) in plans.items():
+        networks = list(by_id[router_id].networks)
+        users = [HotspotUser.from_voucher(vouchers[code], get_voucher_rate_limit(vouchers[code], networks))
+                 for code in sorted(missing) if code in vouchers]
+        jobs[router_id] = (endpoints[router_id], users, sorted(extra))
+    db.session.rollback()
+
+    results = driver_runtime.run(_apply(jobs, batch_size, max_per_second, config.get('ROUTER_DRIVER_CONCURRENCY', 100)))
+    for report in reports:
+        result = results.get(report['router_id'])
+        if result is None:
+            continue
+        if isinstance(result, Exception):
+            report['error'] = str(result)
+            continue
+        added, removed = result
+        report['added'] = sum(1 for ok in added.values() if ok)
+        report['removed'] = sum(1 for ok in removed.values() if ok)
+        report['failed'] = sum(1 for ok in list(added.values()) + list(removed.values()) if not ok)
+
+    return {'dry_run': False, 'routers': reports, 'seconds': round(time.perf_counter() - started, 3)}
@@ -0,0 +1,177 @@
+"""
+Read Replica Routing
+Sends read-only work (dashboards, listings, reports and exports) to a
+PostgreSQL streaming replica configured as the 'replica' bind, so reporting
+load never competes with redemptions for the primary's connection pool.
+Reads fall back to the primary while the replica lags or is unreachable
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from utils.metrics import REPLICA_QUERIES, REPLICA_LAG
+
+REPLICA_BIND = 'replica'
+
+# Zero when the replica has replayed everything it received, otherwise the
+# age of the last replayed transaction (an idle primary is not lag)
+LAG_QUERY = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() "
+    "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+def _pool_options(config, prefix):
+    options = {
+        'pool_size': config.get(f'{prefix}_POOL_SIZE'),
+        'max_overflow': config.get(f'{prefix}_MAX_OVERFLOW'),
+        'pool_timeout': config.get(f'{prefix}_POOL_TIMEOUT'),
+        'pool_recycle': config.get(f'{prefix}_POOL_RECYCLE')
+    }
+    return {key: value for key, value in options.items() if value is not None}
+
+def configure_database_pools(app):
+    """Size the primary pool and register the replica bind; call before db.init_app"""
+    config = app.config
+    primary_uri = config.get('SQLALCHEMY_DATABASE_URI') or ''
+
+    # SQLite keeps its own pool settings (see utils/sqlite_writer)
+    if not primary_uri.startswith('sqlite'):
+        options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+        for key, value in _pool_options(config, 'SQLALCHEMY').items():
+            options.setdefault(key, value)
+        options.setdefault('pool_pre_ping', True)
+        config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    replica_uri = config.get('DATABASE_REPLICA_URL')
+    if not replica_uri:
+        replica_router.configure(None)
+        return False
+
+    binds = dict(config.get('SQLALCHEMY_BINDS') or {})
+    replica = {'url': replica_uri, 'pool_pre_ping': True}
+    if not replica_uri.startswith('sqlite'):
+        replica.update(_pool_options(config, 'REPLICA'))
+    binds[REPLICA_BIND] = replica
+    config['SQLALCHEMY_BINDS'] = binds
+    replica_router.configure(config)
+    return True
+
+class ReplicaRouter:
+    """Decides per statement whether a session may read from the replica"""
+
+    def __init__(self):
+        self.enabled = False
+        self.max_lag = 5.0
+        self.check_interval = 2.0
+        self._healthy = False
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def configure(self, config):
+        self.enabled = config is not None
+        if config is not None:
+            self.max_lag = config.get('REPLICA_MAX_LAG_SECONDS', 5.0)
+            self.check_interval = config.get('REPLICA_LAG_CHECK_SECONDS', 2.0)
+        self._healthy = False
+        self._checked_at = None
+
+    def engine_for(self, session, clause):
+        """Replica engine for this statement, or None to use the primary
+
+        Only plain SELECTs qualify: writes, SELECT ... FOR UPDATE and raw SQL
+        stay on the primary, as does every read in a transaction that has
+        written, so a session never reads around its own writes.
+        """
+        if not self.enabled or clause is None or not getattr(clause, 'is_select', False):
+            return None
+        if getattr(clause, '_for_update_arg', None) is not None:
+            return None
+        if session.info.get('replica_pinned') or session.new or session.dirty or session.deleted:
+            return None
+
+        engine = session._db.engines.get(REPLICA_BIND)
+        if engine is None:
+            return None
+        if not self.is_healthy(engine):
+            REPLICA_QUERIES.inc(target='primary')
+            return None
+        REPLICA_QUERIES.inc(target='replica')
+        return engine
+
+    def is_healthy(self, engine):
+        """Whether replica lag is under the limit, re-checked every few seconds"""
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return self._healthy
+        # One thread measures; the others keep the previous answer meanwhile
+        if not self._lock.acquire(blocking=False):
+            return self._healthy
+        try:
+            lag = self.measure_lag(engine)
+            healthy = lag is not None and lag <= self.max_lag
+            if healthy != self._healthy and self._checked_at is not None:
+                state = 'back in use' if healthy else 'bypassed'
+                print(f"Read replica {state} (lag: {'unreachable' if lag is None else f'{lag:.1f}s'})")
+            self._healthy = healthy
+            self._checked_at = time.monotonic()
+        finally:
+            self._lock.release()
+        return self._healthy
+
+    @staticmethod
+    def measure_lag(engine):
+        """Replica lag in seconds, or None if it cannot be reached"""
+        try:
+            with engine.connect() as connection:
+                if connection.dialect.name != 'postgresql':
+                    lag = 0.0
+                else:
+                    lag = float(connection.execute(LAG_QUERY).scalar() or 0)
+        except Exception as e:
+            print(f"Read replica check failed: {e}")
+            return None
+        REPLICA_LAG.observe(lag)
+        return lag
+
+# Global router instance
+replica_router = ReplicaRouter()
+
+@contextmanager
+def use_replica(session=None):
+    """Route this session's eligible reads to the replica inside the block"""
+    if session is None:
+        from database import db
+        session = db.session()
+    previous = session.info.get('use_replica', False)
+    session.info['use_replica'] = True
+    try:
+        yield session
+    finally:
+        session.info['use_replica'] = previous
+
+def replica_reads(f):
+    """Decorator for read-only endpoints; place it below the auth decorator
+    so the user lookup still reads the primary"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        with use_replica():
+            return f(*args, **kwargs)
+    return decorated
+
+@event.listens_for(Session, 'before_flush')
+def _pin_for_flush(session, flush_context, instances):
+    session.info['replica_pinned'] = True
+
+@event.listens_for(Session, 'do_orm_execute')
+def _pin_for_statement(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['replica_pinned'] = True
+
+@event.listens_for(Session, 'after_transaction_end')
+def _unpin(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('replica_pinned', None)
@@ -1,9 +1,14 @@
 import socket
-import paramiko
-import requests
-from requests.auth import HTTPBasicAuth
 import json
+import threading
+import time
 from datetime import datetime
+from config import Config
+from utils.metrics import timed_router_call
+from utils.plugins import PluginRegistry
+
+# Client libraries (librouteros, requests, paramiko) are imported by the
+# backend that needs them, on first connection, to keep startup light
 
 class RouterManager:
     """Base class for router management"""
@@ -22,6 +27,7 @@ class RouterManager:
             self.connection.close()
             self.connection = None
     
+    @timed_router_call('test_connection')
     def test_connection(self):
         """Test connection to router"""
         try:
@@ -37,6 +43,7 @@ class RouterManager:
 class MikroTikManager(RouterManager):
     """MikroTik RouterOS management"""
     
+    @timed_router_call('connect')
     def connect(self):
         """Connect to MikroTik router via API"""
         try:
@@ -52,6 +59,7 @@ class MikroTikManager(RouterManager):
             print(f"MikroTik connection error: {e}")
             return False
     
+    @timed_router_call('add_user')
     def add_hotspot_user(self, username, password, profile='default'):
         """Add hotspot user"""
         try:
@@ -70,6 +78,73 @@ class MikroTikManager(RouterManager):
             print(f"Error adding hotspot user: {e}")
             return False
     
+    @timed_router_call('add_users')
+    def add_hotspot_users(self, users):
+        """Add several hotspot users over one connection
+
+        `users` is a list of (username, password, profile) tuples.
+        Returns {username: success}.
+        """
+        results = {username: False for username, _, _ in users}
+        try:
+            if not self.connection:
+                if not self.connect():
+                    return results
+            
+            hotspot_users = self.connection.path('/ip/hotspot/user')
+            for username, password, profile in users:
+                try:
+                    hotspot_users.add(name=username, password=password, profile=profile)
+                    results[username] = True
+                except Exception as e:
+                    if 'already have' in str(e):
+                        results[username] = True  # Provisioned by an earlier attempt
+                        continue
+                    print(f"Error adding hotspot user {username}: {e}")
+            return results
+        except Exception as e:
+            print(f"Error adding hotspot users: {e}")
+            return results
+    
+    @timed_router_call('list_profiles')
+    def get_hotspot_profiles(self):
+        """Get hotspot user profile names"""
+        try:
+            if not self.connection:
+                if not self.connect():
+                    return set()
+            
+            profiles = self.connection.path('/ip/hotspot/user/profile').select('name')
+            return {profile['name'] for profile in profiles}
+        except Exception as e:
+            print(f"Error listing hotspot profiles: {e}")
+            return set()
+    
+    @timed_router_call('add_profiles')
+    def add_hotspot_profiles(self, profiles):
+        """Create shared hotspot user profiles
+
+        `profiles` is a list of (name, rate_limit) tuples. Returns the names created.
+        """
+        created = set()
+        try:
+            if not self.connection:
+                if not self.connect():
+                    return created
+            
+            user_profiles = self.connection.path('/ip/hotspot/user/profile')
+            for name, rate_limit in profiles:
+                try:
+                    user_profiles.add(name=name, **{'rate-limit': rate_limit})
+                    created.add(name)
+                except Exception as e:
+                    print(f"Error adding hotspot profile {name}: {e}")
+            return created
+        except Exception as e:
+            print(f"Error adding hotspot profiles: {e}")
+            return created
+    
+    @timed_router_call('remove_user')
     def remove_hotspot_user(self, username):
         """Remove hotspot user"""
         try:
@@ -88,75 +163,232 @@ class MikroTikManager(RouterManager):
             print(f"Error removing hotspot user: {e}")
             return False
 
+    @timed_router_call('remove_users')
+    def remove_hotspot_users(self, usernames):
+        """Remove several hotspot users with a single user listing
+
+        Returns the set of usernames removed.
+        """
+        removed = set()
+        try:
+            if not self.connection:
+                if not self.connect():
+                    return removed
+            
+            wanted = set(usernames)
+            hotspot_users = self.connection.path('/ip/hotspot/user')
+            ids = {user['name']: user['.id'] for user in hotspot_users.select('name', '.id') if user['name'] in wanted}
+            if ids:
+                hotspot_users.remove(*ids.values())
+                removed.update(ids)
+            return removed
+        except Exception as e:
+            print(f"Error removing hotspot users: {e}")
+            return removed
+
+class UnifiControllerSession:
+    """Logged-in HTTP session and cached site for one UniFi controller
+
+    Shared by every UbiquitiManager for the same controller and credentials,
+    so the cookie, keep-alive connections and site lookup survive across calls.
+    """
+    
+    def __init__(self, base_url, username, password):
+        import requests
+        from requests.adapters import HTTPAdapter
+        
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self.http = requests.Session()
+        self.http.verify = False  # Disable SSL verification for local controllers
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=Config.UNIFI_MAX_CONNECTIONS)
+        self.http.mount('http://', adapter)
+        self.http.mount('https://', adapter)
+        self.logged_in = False
+        self.site = None
+        self.site_fetched_at = 0.0
+        self.lock = threading.Lock()
+    
+    def login(self):
+        response = self.http.post(f"{self.base_url}/api/login", json={
+            'username': self.username,
+            'password': self.password
+        }, timeout=10)
+        self.logged_in = response.status_code == 200
+        return self.logged_in
+    
+    def ensure_login(self):
+        with self.lock:
+            return self.logged_in or self.login()
+    
+    def request(self, method, path, **kwargs):
+        """Call the API, logging in again only when the controller answers 401"""
+        if not self.ensure_login():
+            return None
+        kwargs.setdefault('timeout', 10)
+        response = self.http.request(method, f"{self.base_url}{path}", **kwargs)
+        if response.status_code == 401:
+            with self.lock:
+                self.logged_in = False
+                if not self.login():
+                    return response
+            response = self.http.request(method, f"{self.base_url}{path}", **kwargs)
+        return response
+    
+    def get_site(self):
+        """Site name (usually 'default'), cached for UNIFI_SITE_CACHE_SECONDS"""
+        if self.site and time.monotonic() - self.site_fetched_at < Config.UNIFI_SITE_CACHE_SECONDS:
+            return self.site
+        response = self.request('GET', '/api/self/sites')
+        if response is None or response.status_code != 200:
+            return None
+        sites = response.json().get('data') or []
+        self.site = sites[0]['name'] if sites else 'default'
+        self.site_fetched_at = time.monotonic()
+        return self.site
+
 class UbiquitiManager(RouterManager):
     """Ubiquiti UniFi management"""
     
+    # Controller sessions by (base_url, username, password)
+    _controller_sessions = {}
+    _sessions_lock = threading.Lock()
+    
     def __init__(self, router):
         super().__init__(router)
-        self.session = requests.Session()
-        self.session.verify = False  # Disable SSL verification for local controllers
-        self.base_url = f"https://{router.ip_address}:{router.get_api_port()}"
+        self.base_url = f"{Config.UNIFI_SCHEME}://{router.ip_address}:{router.get_api_port()}"
+        key = (self.base_url, router.username, router.password)
+        with self._sessions_lock:
+            controller = self._controller_sessions.get(key)
+            if controller is None:
+                controller = self._controller_sessions[key] = UnifiControllerSession(*key)
+        self.controller = controller
+        self.session = controller.http
     
+    @timed_router_call('connect')
     def connect(self):
-        """Connect to UniFi controller"""
+        """Connect to UniFi controller (reuses an existing login)"""
         try:
-            # Login to UniFi controller
-            login_data = {
-                'username': self.router.username,
-                'password': self.router.password
-            }
-            
-            response = self.session.post(
-                f"{self.base_url}/api/login",
-                json=login_data,
-                timeout=10
-            )
-            
-            return response.status_code == 200
+            return self.controller.ensure_login()
         except Exception as e:
             print(f"UniFi connection error: {e}")
             return False
     
-    def add_guest_user(self, username, password, duration_minutes=1440):
+    def add_guest_user(self, username, password, duration_minutes=1440, down_kbps=0, up_kbps=0, quota_mb=0):
         """Add guest user"""
+        results = self.add_guest_users([{
+            'username': username,
+            'password': password,
+            'duration_minutes': duration_minutes,
+            'down_kbps': down_kbps,
+            'up_kbps': up_kbps,
+            'quota_mb': quota_mb
+        }])
+        return results.get(username, False)
+    
+    @timed_router_call('add_users')
+    def add_guest_users(self, guests):
+        """Add several guest users; each costs one POST on a warm session
+
+        Returns {username: success}.
+        """
+        results = {guest['username']: False for guest in guests}
         try:
-            if not self.connect():
-                return False
+            site_name = self.controller.get_site()
+            if not site_name:
+                return results
             
-            # Get site info (usually 'default')
-            sites_response = self.session.get(f"{self.base_url}/api/self/sites")
-            if sites_response.status_code != 200:
-                return False
+            for guest in guests:
+                # Create guest user (0 means unlimited)
+                user_data = {
+                    'name': guest['username'],
+                    'password': guest['password'],
+                    'duration': guest.get('duration_minutes', 1440),
+                    'quota': 0,
+                    'bytes': guest.get('quota_mb', 0),
+                    'up': guest.get('up_kbps', 0),
+                    'down': guest.get('down_kbps', 0)
+                }
+                
+                try:
+                    response = self.controller.request(
+                        'POST', f"/api/s/{site_name}/cmd/hotspot",
+                        json={'cmd': 'create-voucher', **user_data}
+                    )
+                    results[guest['username']] = response is not None and response.status_code == 200
+                except Exception as e:
+                    print(f"Error adding guest user {guest['username']}: {e}")
             
-            sites = sites_response.json()
-            site_name = sites['data'][0]['name'] if sites['data'] else 'default'
+            return results
+        except Exception as e:
+            print(f"Error adding guest users: {e}")
+            return results
+    
+    @timed_router_call('create_vouchers')
+    def create_vouchers(self, count, duration_minutes=1440, quota_mb=0, down_kbps=0, up_kbps=0, note=None):
+        """Create `count` controller-generated vouchers in one request
+
+        Returns the created voucher records (with their codes), or [] on failure.
+        """
+        try:
+            site_name = self.controller.get_site()
+            if not site_name:
+                return []
             
-            # Create guest user
-            user_data = {
-                'name': username,
-                'password': password,
-                'duration': duration_minutes,
-                'quota': 0,  # Unlimited data
-                'up': 0,     # Unlimited upload
-                'down': 0    # Unlimited download
-            }
+            response = self.controller.request('POST', f"/api/s/{site_name}/cmd/hotspot", json={
+                'cmd': 'create-voucher',
+                'n': count,
+                'quota': 1,
+                'expire': duration_minutes,
+                'bytes': quota_mb,
+                'up': up_kbps,
+                'down': down_kbps,
+                'note': note
+            })
+            if response is None or response.status_code != 200:
+                return []
             
-            response = self.session.post(
-                f"{self.base_url}/api/s/{site_name}/cmd/hotspot",
-                json={'cmd': 'create-voucher', **user_data}
-            )
+            # The controller returns the batch's create_time; fetch its vouchers in one read
+            data = response.json().get('data') or []
+            create_time = data[0].get('create_time') if data else None
+            vouchers = self.controller.request('GET', f"/api/s/{site_name}/stat/voucher")
+            if vouchers is None or vouchers.status_code != 200:
+                return []
+            return [voucher for voucher in vouchers.json().get('data') or []
+                    if create_time is None or voucher.get('create_time') == create_time]
+        except Exception as e:
+            print(f"Error creating UniFi vouchers: {e}")
+            return []
+    
+    @timed_router_call('list_stations')
+    def get_stations(self, macs=None):
+        """Connected stations in one read; optionally only the given MACs"""
+        try:
+            site_name = self.controller.get_site()
+            if not site_name:
+                return []
             
-            return response.status_code == 200
+            if macs:
+                response = self.controller.request('POST', f"/api/s/{site_name}/stat/sta", json={'macs': list(macs)})
+            else:
+                response = self.controller.request('GET', f"/api/s/{site_name}/stat/sta")
+            if response is None or response.status_code != 200:
+                return []
+            return response.json().get('data') or []
         except Exception as e:
-            print(f"Error adding guest user: {e}")
-            return False
+            print(f"Error listing UniFi stations: {e}")
+            return []
 
 class CiscoManager(RouterManager):
     """Cisco router management via SSH"""
     
+    @timed_router_call('connect')
     def connect(self):
         """Connect to Cisco router via SSH"""
         try:
+            import paramiko
+            
             self.connection = paramiko.SSHClient()
             self.connection.set_missing_host_key_policy(paramiko.AutoAddPolicy())
             self.connection.connect(
@@ -171,6 +403,7 @@ class CiscoManager(RouterManager):
             print(f"Cisco connection error: {e}")
             return False
     
+    @timed_router_call('execute_command')
     def execute_command(self, command):
         """Execute command on Cisco router"""
         try:
@@ -184,18 +417,19 @@ class CiscoManager(RouterManager):
             print(f"Error executing command: {e}")
             return None
 
+# Router backends by brand; other brands can register a 'module:Class' path
+# that is only imported when a router of that brand is used
+router_backends = PluginRegistry('router backend')
+router_backends.register('MikroTik', MikroTikManager)
+router_backends.register('Ubiquiti', UbiquitiManager)
+router_backends.register('Cisco', CiscoManager)
+
 def get_router_manager(router):
     """Factory function to get appropriate router manager"""
-    managers = {
-        'MikroTik': MikroTikManager,
-        'Ubiquiti': UbiquitiManager,
-        'Cisco': CiscoManager
-    }
-    
-    manager_class = managers.get(router.brand)
-    if not manager_class:
+    if router.brand not in router_backends:
         raise ValueError(f"Unsupported router brand: {router.brand}")
     
+    manager_class = router_backends.get(router.brand)
     return manager_class(router)
 
 def test_router_connection(router):
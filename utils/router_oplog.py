@@ -0,0 +1,411 @@
+"""
+Router Operation Log
+Local append-only write-ahead log of intended router changes. Activation
+logs its intent (made durable by a group-commit fsync) and returns at once;
+a replayer thread applies pending entries to the routers, retries the ones
+that failed and compacts the log, so routers and the database converge after
+outages and restarts.
+"""
+
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from utils.metrics import ROUTER_OPLOG_FSYNC_LATENCY, ROUTER_OPLOG_FSYNC_BATCH, ROUTER_OPLOG_APPLIED
+
+SEGMENT_PREFIX = 'segment-'
+LOCK_NAME = 'LOCK'
+
+# A logged activation whose voucher claim is not visible yet is only treated
+# as cancelled after this long (the claim commit may still be in flight)
+CLAIM_GRACE_SECONDS = 60
+
+def _segment_number(name):
+    return int(name[len(SEGMENT_PREFIX):-len('.log')])
+
+def _read_directory(directory):
+    """Pending entries recorded in a log directory, oldest first
+
+    Records are JSON lines: an operation `{"seq", "op", "codes", "routers",
+    "at"}` or an acknowledgement `{"ack": seq}` (whole entry) /
+    `{"ack": seq, "router": id}` (one router done). A torn final line from a
+    crash mid-write is ignored.
+    """
+    pending = OrderedDict()
+    names = sorted((name for name in os.listdir(directory)
+                    if name.startswith(SEGMENT_PREFIX) and name.endswith('.log')), key=_segment_number)
+    for name in names:
+        with open(os.path.join(directory, name), 'r', encoding='utf-8') as segment:
+            for line in segment:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if 'op' in record:
+                    pending.setdefault(record['seq'], record)
+                    continue
+                entry = pending.get(record.get('ack'))
+                if entry is None:
+                    continue
+                if 'router' in record:
+                    entry['routers'] = [r for r in entry['routers'] if r != record['router']]
+                if 'router' not in record or not entry['routers']:
+                    del pending[record['ack']]
+    return pending
+
+class RouterOpLog:
+    """Segmented write-ahead log owned by one process
+
+    Each process writes to its own directory under `base_dir`, held with an
+    exclusive flock. A directory whose lock is free belongs to a process that
+    died; the next replayer adopts its pending entries. Opened lazily, so a
+    preloaded app forks cleanly into workers.
+    """
+
+    def __init__(self, base_dir='router-oplog', fsync_interval=0.002, segment_bytes=4 * 1024 * 1024):
+        self.base_dir = base_dir
+        self.fsync_interval = fsync_interval
+        self.segment_bytes = segment_bytes
+        self.directory = None
+        self._pid = None
+        self._cond = threading.Condition()
+        self._syncing = False
+        self._file = None
+        self._lock_file = None
+        self._segment = 0
+        self._next_seq = 1
+        self._written_seq = 0
+        self._synced_seq = 0
+        self._pending = OrderedDict()
+
+    def configure(self, base_dir, fsync_interval, segment_bytes):
+        self.base_dir = base_dir
+        self.fsync_interval = fsync_interval
+        self.segment_bytes = segment_bytes
+
+    def _ensure_open(self):
+        # Called with self._cond held
+        if self._file is not None and self._pid == os.getpid():
+            return
+        os.makedirs(self.base_dir, exist_ok=True)
+        self.directory = os.path.join(self.base_dir, f"{os.getpid()}-{uuid.uuid4().hex[:8]}")
+        os.makedirs(self.directory)
+        self._lock_file = open(os.path.join(self.directory, LOCK_NAME), 'w')
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._pid = os.getpid()
+        self._segment = 1
+        self._file = open(os.path.join(self.directory, f"{SEGMENT_PREFIX}{self._segment:08d}.log"), 'a', encoding='utf-8')
+        self._syncing = False
+        self._next_seq = 1
+        self._written_seq = 0
+        self._synced_seq = 0
+        self._pending = OrderedDict()
+
+    def append(self, op, codes, router_ids):
+        """Log an intended operation and wait until it is durable; returns its sequence number"""
+        with self._cond:
+            self._ensure_open()
+            seq = self._next_seq
+            self._next_seq += 1
+            record = {'seq': seq, 'op': op, 'codes': list(codes), 'routers': list(router_ids),
+                      'at': datetime.utcnow().isoformat()}
+            self._file.write(json.dumps(record, separators=(',', ':')) + '\n')
+            self._written_seq = seq
+            self._pending[seq] = record
+        self._wait_durable(seq)
+        return seq
+
+    def _wait_durable(self, seq):
+        """Group commit: the first waiter fsyncs on behalf of everyone queued behind it"""
+        with self._cond:
+            while self._synced_seq < seq:
+                if not self._syncing:
+                    self._syncing = True
+                    break
+                self._cond.wait()
+            else:
+                return
+
+        target = None
+        try:
+            if self.fsync_interval:
+                time.sleep(self.fsync_interval)  # Let concurrent activations join this fsync
+            with self._cond:
+                self._file.flush()
+                target = self._written_seq
+                batch = target - self._synced_seq
+                fd = self._file.fileno()
+            with ROUTER_OPLOG_FSYNC_LATENCY.time():
+                os.fsync(fd)
+            ROUTER_OPLOG_FSYNC_BATCH.observe(batch)
+        finally:
+            with self._cond:
+                self._syncing = False
+                if target is not None:
+                    self._synced_seq = max(self._synced_seq, target)
+                self._cond.notify_all()
+
+    def ack(self, seq, router_id=None):
+        """Record that an entry (or one router of it) is done or cancelled
+
+        Not fsynced: a lost acknowledgement only means the work is repeated.
+        """
+        with self._cond:
+            entry = self._pending.get(seq)
+            if entry is None or self._pid != os.getpid():
+                return
+            record = {'ack': seq}
+            if router_id is not None:
+                record['router'] = router_id
+                entry['routers'] = [r for r in entry['routers'] if r != router_id]
+            if router_id is None or not entry['routers']:
+                del self._pending[seq]
+            self._file.write(json.dumps(record, separators=(',', ':')) + '\n')
+            self._file.flush()
+
+    def pending(self):
+        """Snapshot of entries still to apply, oldest first"""
+        with self._cond:
+            if self._pid != os.getpid():
+                return []
+            return [dict(entry, routers=list(entry['routers'])) for entry in self._pending.values()]
+
+    def size(self):
+        with self._cond:
+            if self._file is None or self._pid != os.getpid():
+                return 0
+            return self._file.tell()
+
+    def compact(self):
+        """Rewrite the log as just its pending entries and drop the old segment"""
+        with self._cond:
+            if self._file is None or self._pid != os.getpid():
+                return
+            while self._syncing:
+                self._cond.wait()
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._synced_seq = self._written_seq
+
+            old_path = self._file.name
+            self._segment += 1
+            path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{self._segment:08d}.log")
+            with open(path + '.tmp', 'w', encoding='utf-8') as snapshot:
+                for entry in self._pending.values():
+                    snapshot.write(json.dumps(entry, separators=(',', ':')) + '\n')
+                snapshot.flush()
+                os.fsync(snapshot.fileno())
+            os.rename(path + '.tmp', path)
+            self._fsync_directory()
+
+            self._file.close()
+            self._file = open(path, 'a', encoding='utf-8')
+            os.remove(old_path)
+
+    def _fsync_directory(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def adopt_orphans(self):
+        """Move pending entries of dead processes' logs into this one; returns how many"""
+        if not os.path.isdir(self.base_dir):
+            return 0
+        with self._cond:
+            self._ensure_open()
+        adopted = 0
+        for name in os.listdir(self.base_dir):
+            directory = os.path.join(self.base_dir, name)
+            if directory == self.directory or not os.path.isdir(directory):
+                continue
+            try:
+                lock_file = open(os.path.join(directory, LOCK_NAME), 'a')
+            except OSError:
+                continue
+            try:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue  # Owner still alive
+                for entry in _read_directory(directory).values():
+                    self.append(entry['op'], entry['codes'], entry['routers'])
+                    adopted += 1
+                # Entries are durable here now; the orphan can go
+                shutil.rmtree(directory, ignore_errors=True)
+            finally:
+                lock_file.close()
+        return adopted
+
+def apply_router_operation(app, op, routers, vouchers):
+    """Apply one logged operation to routers; returns {router_id: success}"""
+    from utils.drivers import provision_on_routers, revoke_on_routers
+    from utils.router_manager import get_router_manager
+    from utils.rate_limits import provision_vouchers
+
+    codes = [voucher.code for voucher in vouchers]
+
+    if app.config.get('ROUTER_DRIVER_MODE') == 'async':
+        # All routers concurrently on the shared driver loop
+        if op == 'provision':
+            results = provision_on_routers(routers, vouchers)
+        else:
+            results = revoke_on_routers(routers, codes)
+        return {router.id: bool(results.get(router.id)) and all(results[router.id].values())
+                for router in routers}
+
+    outcome = {}
+    for router in routers:
+        outcome[router.id] = False
+        try:
+            manager = get_router_manager(router)
+            if manager.connect():
+                if op == 'provision':
+                    # Add users to the router's hotspot/guest system with shared rate-limit profiles
+                    results = provision_vouchers(router, manager, vouchers)
+                    outcome[router.id] = all(results.get(code, False) for code in codes)
+                else:
+                    if router.brand == 'MikroTik':
+                        manager.remove_hotspot_users(codes)
+                    # Add other router types as needed
+                    outcome[router.id] = True
+            manager.disconnect()
+        except Exception as e:
+            print(f"Error applying {op} to router {router.name}: {e}")
+    return outcome
+
+class OpLogReplayer:
+    """Background thread applying pending log entries to the routers"""
+
+    def __init__(self, app, log):
+        self.app = app
+        self.log = log
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def kick(self):
+        """Apply pending entries now rather than at the next retry tick"""
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                # A forked worker inherits the object but not the thread
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='router-oplog', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _run(self):
+        retry = self.app.config.get('ROUTER_OPLOG_RETRY_SECONDS', 15)
+        while True:
+            try:
+                # Logs left behind by crashed or restarted processes
+                self.log.adopt_orphans()
+                self.replay_once()
+            except Exception as e:
+                print(f"Router operation log replay error: {e}")
+            self._wake.wait(retry)
+            self._wake.clear()
+
+    def replay_once(self):
+        """Apply every pending entry once; returns the number still pending"""
+        from database import db
+        from models.voucher import Voucher
+        from models.router import Router
+        from sqlalchemy.orm import selectinload
+
+        with self.app.app_context():
+            # Entries belong to this database; wait until init-db has created it
+            if not db.inspect(db.engine).has_table(Voucher.__tablename__):
+                return len(self.log.pending())
+            
+            for entry in self.log.pending():
+                try:
+                    vouchers = Voucher.query.filter(Voucher.code.in_(entry['codes'])).all()
+                    if entry['op'] == 'provision':
+                        vouchers = [voucher for voucher in vouchers if voucher.status == 'used']
+                        if not vouchers:
+                            age = datetime.utcnow() - datetime.fromisoformat(entry['at'])
+                            if age.total_seconds() >= CLAIM_GRACE_SECONDS:
+                                self.log.ack(entry['seq'])  # Claim rolled back or session already over
+                            continue
+                    if not vouchers:
+                        self.log.ack(entry['seq'])
+                        continue
+
+                    routers = Router.query.options(selectinload(Router.networks)).filter(
+                        Router.id.in_(entry['routers']), Router.is_active == True
+                    ).all()
+                    # Deleted, disabled and RADIUS routers hold no local users to change
+                    routers = [router for router in routers if not router.uses_radius]
+                    for router_id in set(entry['routers']) - {router.id for router in routers}:
+                        self.log.ack(entry['seq'], router_id)
+                    if not routers:
+                        self.log.ack(entry['seq'])
+                        continue
+
+                    results = apply_router_operation(self.app, entry['op'], routers, vouchers)
+                    for router in routers:
+                        if results.get(router.id):
+                            router.last_seen = datetime.utcnow()
+                            router.status = 'connected'
+                            self.log.ack(entry['seq'], router.id)
+                        ROUTER_OPLOG_APPLIED.inc(operation=entry['op'],
+                                                 result='ok' if results.get(router.id) else 'error')
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Error replaying router operation {entry['seq']}: {e}")
+
+        if self.log.size() > self.log.segment_bytes:
+            self.log.compact()
+        return len(self.log.pending())
+
+# Global log instance; the replayer is attached by init_router_oplog
+router_oplog = RouterOpLog()
+_replayer = None
+
+def init_router_oplog(app):
+    """Configure the operation log for an app (files are opened on first use)"""
+    global _replayer
+    # Next to the default SQLite database, so entries are never replayed against another one
+    base_dir = app.config.get('ROUTER_OPLOG_DIR') or os.path.join(app.instance_path, 'router-oplog')
+    router_oplog.configure(
+        base_dir,
+        app.config.get('ROUTER_OPLOG_FSYNC_MS', 2) / 1000.0,
+        app.config.get('ROUTER_OPLOG_SEGMENT_BYTES', 4 * 1024 * 1024)
+    )
+    _replayer = OpLogReplayer(app, router_oplog)
+
+def recover_router_operations():
+    """Apply what a previous run left unapplied without waiting for new work
+
+    Call once the database schema exists.
+    """
+    base_dir = router_oplog.base_dir
+    if _replayer is not None and os.path.isdir(base_dir) and os.listdir(base_dir):
+        _replayer.kick()
+
+def log_router_operation(op, codes, routers):
+    """Durably log an intended 'provision' or 'revoke' for routers
+
+    Returns its sequence number, or None when there is no router to apply it to.
+    """
+    if not routers:
+        return None
+    return router_oplog.append(op, codes, [router.id for router in routers])
+
+def cancel_router_operation(seq):
+    """Drop a logged operation that must not be applied (e.g. its claim failed)"""
+    router_oplog.ack(seq)
+
+def replay_router_operations():
+    """Wake the replayer to apply newly logged operations"""
+    if _replayer is not None:
+        _replayer.kick()
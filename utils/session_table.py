@@ -0,0 +1,396 @@
+"""
+Active Session Table
+Compact in-memory table of the open voucher sessions the network monitor
+works on. Columns are flat arrays (struct-of-arrays) indexed by code, client
+IP and MAC, built once from the database and then kept current from the
+voucher change log, so a monitor cycle no longer loads every active Voucher
+and can sweep 100k+ sessions with vectorized comparisons (NumPy when it is
+installed, a plain loop over the arrays otherwise)
+"""
+
+import json
+import math
+import socket
+import struct
+import time
+from array import array
+from datetime import datetime
+
+_numpy = False  # Not looked up yet
+
+def _load_numpy():
+    """NumPy, or None when it is not installed
+
+    Imported on the first sweep rather than with the module, so web workers
+    (which never sweep) start without it.
+    """
+    global _numpy
+    if _numpy is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy = numpy
+    return _numpy
+
+EPOCH = datetime(1970, 1, 1)
+NAN = float('nan')
+
+# Voucher columns the table is built from
+LOAD_COLUMNS = ('id', 'code', 'client_ip', 'client_mac', 'session_end',
+                'data_limit_mb', 'data_used_mb', 'allowed_networks')
+
+def to_timestamp(value):
+    """Naive UTC datetime to epoch seconds (NaN for None)"""
+    return (value - EPOCH).total_seconds() if value else NAN
+
+def pack_ip(ip):
+    """IPv4 string to int, 0 when missing or not IPv4"""
+    if not ip:
+        return 0
+    try:
+        return struct.unpack('!I', socket.inet_aton(ip))[0]
+    except (OSError, ValueError):
+        return 0
+
+def unpack_ip(value):
+    return socket.inet_ntoa(struct.pack('!I', value)) if value else None
+
+def pack_mac(mac):
+    """MAC string (any of the usual separators) to int, 0 when missing or invalid"""
+    if not mac:
+        return 0
+    try:
+        value = int(mac.replace(':', '').replace('-', '').replace('.', ''), 16)
+    except ValueError:
+        return 0
+    return value if value < 1 << 48 else 0
+
+def unpack_mac(value):
+    if not value:
+        return None
+    digits = f"{value:012X}"
+    return ':'.join(digits[i:i + 2] for i in range(0, 12, 2))
+
+def single_network(allowed_networks):
+    """Network id a voucher is restricted to, if it is exactly one"""
+    if not allowed_networks:
+        return -1
+    try:
+        network_ids = json.loads(allowed_networks)
+    except ValueError:
+        return -1
+    return int(network_ids[0]) if len(network_ids) == 1 else -1
+
+class SessionTable:
+    """Open sessions (status 'used') as parallel arrays, one row per voucher
+
+    Rows are kept dense: removing a row moves the last row into its slot,
+    so row indexes are only stable until the next removal. Missing session
+    ends and data limits are stored as NaN, which compares false both ways,
+    so such sessions are neither active nor expired, as in the queries this
+    table replaces.
+    """
+
+    def __init__(self):
+        self.ids = array('q')
+        self.codes = []
+        self.ips = array('I')
+        self.macs = array('Q')
+        self.session_end = array('d')
+        self.data_limit_mb = array('d')
+        self.data_used_mb = array('d')
+        self.network_ids = array('q')
+        # Usage polling schedule (utils/usage_scheduler), epoch seconds
+        self.next_check = array('d')
+        self.checked_at = array('d')
+        self.rate_mb_s = array('d')
+        self.by_id = {}
+        self.by_code = {}
+        self.by_ip = {}
+        self.by_mac = {}
+        self.revision = None
+        self.built_at = None
+        self._written = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, code):
+        return code in self.by_code
+
+    # -- rows ----------------------------------------------------------------
+
+    def upsert(self, row):
+        """Insert or refresh a session from a row with LOAD_COLUMNS"""
+        index = self.by_id.get(row.id)
+        if index is None:
+            index = len(self.ids)
+            self.ids.append(row.id)
+            self.codes.append(row.code)
+            self.ips.append(0)
+            self.macs.append(0)
+            self.session_end.append(NAN)
+            self.data_limit_mb.append(NAN)
+            self.data_used_mb.append(0.0)
+            self.network_ids.append(-1)
+            self.next_check.append(0.0)  # Due at once
+            self.checked_at.append(NAN)
+            self.rate_mb_s.append(NAN)
+            self.by_id[row.id] = index
+        else:
+            self._unindex(index)
+            self.codes[index] = row.code
+            limit = float(row.data_limit_mb) if row.data_limit_mb else NAN
+            if limit != self.data_limit_mb[index] and not (math.isnan(limit) and math.isnan(self.data_limit_mb[index])):
+                self.next_check[index] = 0.0  # Limit changed: re-plan now
+
+        self.ips[index] = pack_ip(row.client_ip)
+        self.macs[index] = pack_mac(row.client_mac)
+        self.session_end[index] = to_timestamp(row.session_end)
+        self.data_limit_mb[index] = float(row.data_limit_mb) if row.data_limit_mb else NAN
+        self.data_used_mb[index] = row.data_used_mb or 0.0
+        self.network_ids[index] = single_network(row.allowed_networks)
+        self._index(index)
+        return index
+
+    def remove(self, voucher_id):
+        index = self.by_id.pop(voucher_id, None)
+        if index is None:
+            return False
+        self._unindex(index)
+        last = len(self.ids) - 1
+        if index != last:
+            # Move the last row into the gap
+            for column in self._columns():
+                column[index] = column[last]
+            self.codes[index] = self.codes[last]
+            self._unindex(index, last)
+            self._index(index)
+            self.by_id[self.ids[index]] = index
+        for column in self._columns():
+            column.pop()
+        self.codes.pop()
+        return True
+
+    def _columns(self):
+        return (self.ids, self.ips, self.macs, self.session_end, self.data_limit_mb,
+                self.data_used_mb, self.network_ids, self.next_check, self.checked_at, self.rate_mb_s)
+
+    def _index(self, index):
+        self.by_code[self.codes[index]] = index
+        if self.ips[index]:
+            self.by_ip[self.ips[index]] = index
+        if self.macs[index]:
+            self.by_mac[self.macs[index]] = index
+
+    def _unindex(self, index, stored_at=None):
+        # stored_at: the slot the index entries still point to
+        stored_at = index if stored_at is None else stored_at
+        for lookup, key in ((self.by_code, self.codes[index]), (self.by_ip, self.ips[index]),
+                            (self.by_mac, self.macs[index])):
+            if key and lookup.get(key) == stored_at:
+                del lookup[key]
+
+    def find(self, code=None, ip=None, mac=None):
+        """Row index of a session by code, client IP or MAC, or None"""
+        if code is not None:
+            return self.by_code.get(code)
+        if ip is not None:
+            return self.by_ip.get(pack_ip(ip))
+        if mac is not None:
+            return self.by_mac.get(pack_mac(mac))
+        return None
+
+    def client_ip(self, index):
+        return unpack_ip(self.ips[index])
+
+    def client_mac(self, index):
+        return unpack_mac(self.macs[index])
+
+    def network_id(self, index):
+        network_id = self.network_ids[index]
+        return network_id if network_id >= 0 else None
+
+    def to_dict(self, index):
+        end = self.session_end[index]
+        limit = self.data_limit_mb[index]
+        return {
+            'id': self.ids[index],
+            'code': self.codes[index],
+            'client_ip': self.client_ip(index),
+            'client_mac': self.client_mac(index),
+            'session_end': None if math.isnan(end) else datetime.utcfromtimestamp(end),
+            'data_limit_mb': None if math.isnan(limit) else limit,
+            'data_used_mb': self.data_used_mb[index],
+            'network_id': self.network_id(index)
+        }
+
+    @property
+    def nbytes(self):
+        """Approximate size of the array columns (indexes and codes excluded)"""
+        return sum(column.itemsize * len(column) for column in self._columns())
+
+    # -- sweeps --------------------------------------------------------------
+
+    def due(self, now=None):
+        """Indexes of running sessions whose next usage check is due"""
+        if not self.ids:
+            return []
+        now = to_timestamp(now or datetime.utcnow())
+        numpy = _load_numpy()
+        if numpy is not None:
+            ends = numpy.frombuffer(self.session_end, dtype=numpy.float64)
+            checks = numpy.frombuffer(self.next_check, dtype=numpy.float64)
+            return numpy.flatnonzero((ends > now) & (checks <= now)).tolist()
+        return [index for index, (end, check) in enumerate(zip(self.session_end, self.next_check))
+                if end > now and check <= now]
+
+    def next_due(self, now=None):
+        """Earliest next usage check of a running session (epoch seconds), or None"""
+        if not self.ids:
+            return None
+        now = to_timestamp(now or datetime.utcnow())
+        numpy = _load_numpy()
+        if numpy is not None:
+            ends = numpy.frombuffer(self.session_end, dtype=numpy.float64)
+            checks = numpy.frombuffer(self.next_check, dtype=numpy.float64)[ends > now]
+            return float(checks.min()) if checks.size else None
+        return min((check for end, check in zip(self.session_end, self.next_check) if end > now), default=None)
+
+    def expired(self, now=None):
+        """Voucher ids whose session end has passed"""
+        if not self.ids:
+            return []
+        now = to_timestamp(now or datetime.utcnow())
+        numpy = _load_numpy()
+        if numpy is not None:
+            ends = numpy.frombuffer(self.session_end, dtype=numpy.float64)
+            return numpy.frombuffer(self.ids, dtype=numpy.int64)[ends <= now].tolist()
+        return [self.ids[index] for index, end in enumerate(self.session_end) if end <= now]
+
+    def over_limit(self, indexes=None):
+        """Indexes (of those given, or all) whose usage reached the data limit"""
+        if not self.ids:
+            return []
+        numpy = _load_numpy()
+        if numpy is not None:
+            used = numpy.frombuffer(self.data_used_mb, dtype=numpy.float64)
+            limits = numpy.frombuffer(self.data_limit_mb, dtype=numpy.float64)
+            if indexes is None:
+                return numpy.flatnonzero(used >= limits).tolist()
+            selected = numpy.asarray(indexes, dtype=numpy.intp)
+            return selected[used[selected] >= limits[selected]].tolist()
+        if indexes is None:
+            indexes = range(len(self.ids))
+        return [index for index in indexes if self.data_used_mb[index] >= self.data_limit_mb[index]]
+
+    # -- database sync -------------------------------------------------------
+
+    def sync(self, resync_seconds=600):
+        """Bring the table up to date; needs an application context
+
+        Applies the change log since the last sync, or rebuilds from the
+        vouchers table the first time, every `resync_seconds`, and whenever
+        the log no longer reaches back to the table's revision.
+        """
+        if (self.revision is None or (resync_seconds and time.monotonic() - self.built_at >= resync_seconds)
+                or not self.apply_changes()):
+            self.rebuild()
+
+    @staticmethod
+    def _load_query():
+        """Core select of LOAD_COLUMNS; limits and networks come from the voucher's plan"""
+        from database import db
+        from models.voucher import Voucher
+        from models.voucher_plan import VoucherPlan, PLAN_FIELDS
+
+        table = Voucher.__table__
+        plans = VoucherPlan.__table__
+        return db.select(*((plans if column in PLAN_FIELDS else table).c[column]
+                           for column in LOAD_COLUMNS)).select_from(
+            table.outerjoin(plans, table.c.plan_id == plans.c.id))
+
+    def rebuild(self):
+        from database import db
+        from models.voucher import Voucher
+        from models.voucher_change import settled_revision
+
+        table = Voucher.__table__
+        revision = settled_revision()
+        self.__init__()
+        result = db.session.execute(
+            self._load_query()
+            .where(table.c.status == 'used')
+            .execution_options(yield_per=10000)
+        )
+        for row in result:
+            self.upsert(row)
+        self.revision = revision
+        self.built_at = time.monotonic()
+
+    def apply_changes(self):
+        """Apply change log entries after the current revision; False if a rebuild is needed"""
+        from database import db
+        from models.voucher import Voucher
+        from models.voucher_change import VoucherChange, settled_revision
+
+        oldest = db.session.query(db.func.min(VoucherChange.id)).scalar()
+        if oldest is not None and self.revision < oldest - 1:
+            return False
+
+        # Stop where an earlier change may still be in flight
+        horizon = settled_revision()
+        changes = db.session.query(VoucherChange.id, VoucherChange.voucher_id, VoucherChange.change_type).filter(
+            VoucherChange.id > self.revision,
+            VoucherChange.id <= horizon
+        ).order_by(VoucherChange.id).all()
+        if not changes:
+            return True
+
+        latest = {}
+        transitions = set()
+        for revision, voucher_id, change_type in changes:
+            latest[voucher_id] = (revision, change_type)
+            if change_type != 'updated':
+                transitions.add(voucher_id)
+
+        reload_ids = []
+        for voucher_id, (revision, change_type) in latest.items():
+            if change_type == 'ended':
+                self.remove(voucher_id)
+            elif change_type == 'updated' and voucher_id not in transitions and self._wrote(voucher_id, revision):
+                continue  # Our own usage write, already in the table
+            else:
+                reload_ids.append(voucher_id)
+
+        table = Voucher.__table__
+        for start in range(0, len(reload_ids), 500):
+            chunk = reload_ids[start:start + 500]
+            found = set()
+            for row in db.session.execute(
+                self._load_query()
+                .where(table.c.id.in_(chunk), table.c.status == 'used')
+            ):
+                self.upsert(row)
+                found.add(row.id)
+            for voucher_id in set(chunk) - found:
+                self.remove(voucher_id)
+
+        self.revision = max(self.revision, horizon)
+        self._written = {voucher_id: revision for voucher_id, revision in self._written.items()
+                         if revision > self.revision}
+        return True
+
+    def note_written(self, voucher_ids, revision):
+        """Record usage writes already applied to the table
+
+        Their 'updated' log entries (at or below `revision`) are skipped by
+        the next apply_changes instead of reloading the rows.
+        """
+        for voucher_id in voucher_ids:
+            self._written[voucher_id] = revision
+
+    def _wrote(self, voucher_id, revision):
+        written = self._written.get(voucher_id)
+        return written is not None and revision <= written
@@ -0,0 +1,239 @@
+"""
+SQLite Production Mode
+WAL journaling and tuned pragmas for file-backed SQLite, plus a single writer
+thread per process: ORM commits with pending writes are handed to it, so
+concurrent redemptions queue in Python instead of spinning in SQLite's busy
+handler, and queued core write operations are group-committed together
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from utils.metrics import SQLITE_WRITE_WAIT, SQLITE_WRITE_BATCH
+
+def is_file_sqlite(uri):
+    """True for on-disk SQLite URIs (in-memory databases cannot use WAL)"""
+    uri = uri or ''
+    return uri.startswith('sqlite') and ':memory:' not in uri and uri.rstrip('/') not in ('sqlite:', 'sqlite://')
+
+_pragmas = []
+
+def configure_sqlite(app):
+    """Enable the SQLite profile for this app; call before db.init_app"""
+    if not app.config.get('SQLITE_PRODUCTION_MODE') or not is_file_sqlite(app.config.get('SQLALCHEMY_DATABASE_URI')):
+        return False
+
+    busy_ms = app.config.get('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    connect_args = dict(options.get('connect_args') or {})
+    connect_args.setdefault('timeout', busy_ms / 1000)
+    # Connections are used from the writer thread as well as their own
+    connect_args.setdefault('check_same_thread', False)
+    options['connect_args'] = connect_args
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    _pragmas[:] = [
+        'PRAGMA journal_mode=WAL',
+        f"PRAGMA synchronous={app.config.get('SQLITE_SYNCHRONOUS', 'NORMAL')}",
+        f"PRAGMA busy_timeout={int(busy_ms)}",
+        f"PRAGMA cache_size=-{int(app.config.get('SQLITE_CACHE_SIZE_KIB', 65536))}",
+        f"PRAGMA mmap_size={int(app.config.get('SQLITE_MMAP_SIZE_MB', 256)) * 1024 * 1024}",
+        'PRAGMA temp_store=MEMORY'
+    ]
+    sqlite_writer.configure(app)
+    return True
+
+@event.listens_for(Engine, 'connect')
+def _apply_pragmas(dbapi_connection, connection_record):
+    if not _pragmas or not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in _pragmas:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
+class SQLiteWriter:
+    """The one thread per process that commits writes
+
+    Sessions that already wrote (an autoflush or a bulk statement) hold the
+    write gate and commit inline; the writer takes the same gate for each
+    batch, so the two never wait on each other inside SQLite.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.app = None
+        self.batch_size = 64
+        self.window = 0.002
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._gate = threading.Lock()
+        self._gate_owner = None
+
+    def configure(self, app):
+        self.app = app
+        self.enabled = True
+        self.batch_size = app.config.get('SQLITE_WRITE_BATCH_SIZE', 64)
+        self.window = app.config.get('SQLITE_WRITE_WINDOW_MS', 2) / 1000
+
+    def _ensure_thread(self):
+        with self._lock:
+            # A forked worker inherits the object but not the thread
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._queue = queue.Queue()
+            self._gate = threading.Lock()
+            self._gate_owner = None
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+            self._thread.start()
+
+    def on_writer_thread(self):
+        return threading.current_thread() is self._thread
+
+    def holds_gate(self):
+        return self._gate_owner == threading.get_ident()
+
+    def hold(self, session):
+        """Take the write gate for a session that is about to write"""
+        if not self.enabled or self.on_writer_thread() or session.info.get('sqlite_write_gate'):
+            return
+        self._gate.acquire()
+        self._gate_owner = threading.get_ident()
+        session.info['sqlite_write_gate'] = True
+
+    def release(self, session):
+        if session.info.pop('sqlite_write_gate', False):
+            self._gate_owner = None
+            self._gate.release()
+
+    def should_queue(self, session):
+        return (self.enabled and not self.on_writer_thread() and not session.info.get('sqlite_write_gate')
+                and bool(session.new or session.dirty or session.deleted))
+
+    def _enqueue(self, kind, fn):
+        self._ensure_thread()
+        future = Future()
+        self._queue.put((kind, fn, future, time.perf_counter()))
+        return future
+
+    def commit(self, commit):
+        """Run a session's commit on the writer thread and wait for it"""
+        return self._enqueue('commit', commit).result()
+
+    def submit(self, fn):
+        """Queue fn(connection) for the next group commit; returns a Future"""
+        return self._enqueue('op', fn)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            with self._gate:
+                self._gate_owner = threading.get_ident()
+                try:
+                    now = time.perf_counter()
+                    for _, _, _, queued_at in batch:
+                        SQLITE_WRITE_WAIT.observe(now - queued_at)
+                    SQLITE_WRITE_BATCH.observe(len(batch))
+                    with self.app.app_context():
+                        for kind, fn, future, _ in batch:
+                            if kind == 'commit':
+                                self._resolve(future, fn)
+                        ops = [(fn, future) for kind, fn, future, _ in batch if kind == 'op']
+                        if ops:
+                            self._group_commit(ops)
+                finally:
+                    self._gate_owner = None
+
+    @staticmethod
+    def _resolve(future, fn, *args):
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    def _group_commit(self, ops):
+        """Run queued operations in one transaction, each under its own savepoint"""
+        from database import db
+
+        results = []
+        connection = db.engine.connect()
+        try:
+            with connection.begin():
+                # Explicit BEGIN: pysqlite would otherwise let the first
+                # RELEASE SAVEPOINT commit the whole batch
+                connection.exec_driver_sql('BEGIN IMMEDIATE')
+                for fn, future in ops:
+                    savepoint = connection.begin_nested()
+                    try:
+                        result = fn(connection)
+                        savepoint.commit()
+                        results.append((future, result, None))
+                    except Exception as e:
+                        savepoint.rollback()
+                        results.append((future, None, e))
+        except Exception as e:
+            for _, future in ops:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            connection.close()
+
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+# Global writer instance
+sqlite_writer = SQLiteWriter()
+
+def run_write(fn):
+    """Run fn(connection) and commit: group-committed by the writer in SQLite mode
+
+    Must be called inside an application context.
+    """
+    from database import db
+
+    if sqlite_writer.enabled and not sqlite_writer.on_writer_thread() and not sqlite_writer.holds_gate():
+        return sqlite_writer.submit(fn).result()
+    try:
+        result = fn(db.session.connection())
+        db.session.commit()
+        return result
+    except Exception:
+        db.session.rollback()
+        raise
+
+@event.listens_for(Session, 'before_flush')
+def _hold_for_flush(session, flush_context, instances):
+    sqlite_writer.hold(session)
+
+@event.listens_for(Session, 'do_orm_execute')
+def _hold_for_statement(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        sqlite_writer.hold(orm_execute_state.session)
+
+@event.listens_for(Session, 'after_transaction_end')
+def _release_gate(session, transaction):
+    # Commit, rollback and close all end the outermost transaction here
+    if transaction.parent is None:
+        sqlite_writer.release(session)
@@ -0,0 +1,35 @@
+"""
+Statistics Utilities
+Shared dashboard aggregates, computed once and reused by the API and the live event stream
+"""
+
+from models.voucher import Voucher
+from models.network import Network
+from models.router import Router
+from utils.archive import archived_count
+
+
+def get_dashboard_stats():
+    """Compute dashboard statistics"""
+    total_vouchers = Voucher.query.count() + archived_count()
+    active_vouchers = Voucher.query.filter_by(status='active').count()
+    used_vouchers = Voucher.query.filter_by(status='used').count()
+    total_networks = Network.query.count()
+    total_routers = Router.query.count()
+    
+    # Recent activity
+    recent_vouchers = Voucher.query.order_by(Voucher.created_at.desc()).limit(5).all()
+    
+    return {
+        'total_vouchers': total_vouchers,
+        'active_vouchers': active_vouchers,
+        'used_vouchers': used_vouchers,
+        'total_networks': total_networks,
+        'total_routers': total_routers,
+        'recent_vouchers': [{
+            'id': v.id,
+            'code': v.code,
+            'status': v.status,
+            'created_at': v.created_at.isoformat()
+        } for v in recent_vouchers]
+    }
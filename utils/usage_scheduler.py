@@ -0,0 +1,71 @@
+"""
+Adaptive Usage Polling
+Plans each session's next usage check from its remaining data quota and
+observed consumption rate: sessions close to their limit are checked within
+seconds, idle or unlimited ones every few minutes. Due checks are grouped
+per router so each router answers one bulk counter read per round
+"""
+
+import math
+from collections import defaultdict
+from utils.metrics import USAGE_POLL_INTERVAL
+
+class UsagePollScheduler:
+    """Scheduling policy over the columns of a utils.session_table.SessionTable"""
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.adaptive = config.get('USAGE_POLL_ADAPTIVE', True)
+        self.default_interval = config.get('USAGE_POLL_DEFAULT_SECONDS', 30)
+        self.min_interval = config.get('USAGE_POLL_MIN_SECONDS', 5)
+        self.max_interval = config.get('USAGE_POLL_MAX_SECONDS', 300)
+        self.safety = config.get('USAGE_POLL_SAFETY_FACTOR', 0.5)
+        self.smoothing = config.get('USAGE_POLL_RATE_SMOOTHING', 0.5)
+
+    def due_by_router(self, sessions, network_routers, now):
+        """Due session indexes grouped by router id (None when the router is unknown)"""
+        groups = defaultdict(list)
+        for index in sessions.due(now):
+            groups[network_routers.get(sessions.network_id(index))].append(index)
+        return groups
+
+    def interval(self, remaining_mb, rate_mb_s):
+        """Seconds until the next check for a session"""
+        if not self.adaptive:
+            return self.default_interval
+        if remaining_mb is None:
+            return self.max_interval  # No data limit: only usage history depends on it
+        if math.isnan(rate_mb_s):
+            return min(self.default_interval, self.max_interval)
+        if rate_mb_s <= 0:
+            return self.max_interval
+        # Check again after a fraction of the time the quota would last at
+        # the current rate, so a burst cannot run far past the limit
+        seconds = remaining_mb / rate_mb_s * self.safety
+        return max(self.min_interval, min(self.max_interval, seconds))
+
+    def observe(self, sessions, index, data_used_mb, now_ts):
+        """Record a usage reading for a session and plan its next check"""
+        checked_at = sessions.checked_at[index]
+        if not math.isnan(checked_at) and now_ts > checked_at:
+            rate = max(0.0, data_used_mb - sessions.data_used_mb[index]) / (now_ts - checked_at)
+            previous = sessions.rate_mb_s[index]
+            sessions.rate_mb_s[index] = rate if math.isnan(previous) else (
+                self.smoothing * rate + (1 - self.smoothing) * previous)
+        sessions.checked_at[index] = now_ts
+        self._plan(sessions, index, max(data_used_mb, sessions.data_used_mb[index]), now_ts)
+
+    def skip(self, sessions, index, now_ts):
+        """No reading this round (router unreachable, client not online); retry later"""
+        self._plan(sessions, index, sessions.data_used_mb[index], now_ts)
+
+    def defer(self, sessions, index, now_ts):
+        """Usage arrives another way (RADIUS accounting); look again much later"""
+        sessions.next_check[index] = now_ts + self.max_interval
+
+    def _plan(self, sessions, index, data_used_mb, now_ts):
+        limit = sessions.data_limit_mb[index]
+        remaining = None if math.isnan(limit) else max(0.0, limit - data_used_mb)
+        interval = self.interval(remaining, sessions.rate_mb_s[index])
+        sessions.next_check[index] = now_ts + interval
+        USAGE_POLL_INTERVAL.observe(interval)
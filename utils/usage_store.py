@@ -0,0 +1,211 @@
+"""
+Usage Time-Series Store
+Buffers per-session usage deltas, writes them to the append-only samples table
+in batches and maintains minute/hour/day rollups incrementally
+"""
+
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from database import db
+from models.usage import UsageSample, UsageRollup
+from utils.sqlite_writer import run_write
+
+RESOLUTIONS = ('minute', 'hour', 'day')
+SCOPES = ('voucher', 'network', 'router')
+
+def bucket_start(timestamp, resolution):
+    """Truncate a timestamp to the start of its rollup bucket"""
+    if resolution == 'minute':
+        return timestamp.replace(second=0, microsecond=0)
+    if resolution == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if resolution == 'day':
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unsupported resolution: {resolution}")
+
+class UsageRecorder:
+    """Collect usage deltas in memory and flush them as one batch"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buffer = []
+
+    def record(self, voucher_id, data_mb, network_id=None, router_id=None, recorded_at=None):
+        """Buffer a usage delta for a session"""
+        if data_mb <= 0:
+            return
+
+        with self._lock:
+            self._buffer.append({
+                'voucher_id': voucher_id,
+                'network_id': network_id,
+                'router_id': router_id,
+                'recorded_at': recorded_at or datetime.utcnow(),
+                'data_mb': data_mb
+            })
+
+    def pending(self):
+        """Number of buffered samples"""
+        with self._lock:
+            return len(self._buffer)
+
+    def flush(self):
+        """Write buffered samples and fold them into the rollups
+
+        Must be called inside an application context. Returns the number of
+        samples written.
+        """
+        with self._lock:
+            samples, self._buffer = self._buffer, []
+
+        if not samples:
+            return 0
+
+        def write(connection):
+            connection.execute(UsageSample.__table__.insert(), samples)
+            _apply_rollup_deltas(connection, _aggregate(samples))
+
+        try:
+            run_write(write)
+        except Exception:
+            # Keep the samples for the next flush
+            with self._lock:
+                self._buffer = samples + self._buffer
+            raise
+
+        return len(samples)
+
+def _aggregate(samples):
+    """Sum samples per (resolution, scope, scope_id, bucket)"""
+    deltas = defaultdict(lambda: [0.0, 0])
+
+    for sample in samples:
+        scope_ids = {
+            'voucher': sample['voucher_id'],
+            'network': sample['network_id'],
+            'router': sample['router_id']
+        }
+        for resolution in RESOLUTIONS:
+            bucket = bucket_start(sample['recorded_at'], resolution)
+            for scope, scope_id in scope_ids.items():
+                if scope_id is None:
+                    continue
+                delta = deltas[(resolution, scope, scope_id, bucket)]
+                delta[0] += sample['data_mb']
+                delta[1] += 1
+
+    return deltas
+
+def _upsert(connection):
+    """Dialect INSERT supporting ON CONFLICT / ON DUPLICATE KEY, or None"""
+    name = connection.dialect.name
+    if name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif name in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert
+        return insert(UsageRollup.__table__), True
+    else:
+        return None, False
+    return insert(UsageRollup.__table__), False
+
+def _apply_rollup_deltas(connection, deltas):
+    """Add aggregated deltas to the rollup rows, creating missing buckets
+
+    The monitor and the RADIUS accounting flusher both write rollups, so the
+    rows are incremented in SQL and new buckets are upserted: concurrent
+    flushes neither lose increments nor collide on uq_usage_rollup_bucket.
+    """
+    rows = [{
+        'resolution': resolution,
+        'scope': scope,
+        'scope_id': scope_id,
+        'bucket_start': bucket,
+        'data_mb': delta[0],
+        'samples': delta[1]
+    } for (resolution, scope, scope_id, bucket), delta in deltas.items()]
+    if not rows:
+        return
+
+    table = UsageRollup.__table__
+    statement, mysql = _upsert(connection)
+    if statement is not None:
+        if mysql:
+            statement = statement.on_duplicate_key_update(
+                data_mb=table.c.data_mb + statement.inserted.data_mb,
+                samples=table.c.samples + statement.inserted.samples)
+        else:
+            statement = statement.on_conflict_do_update(
+                index_elements=['resolution', 'scope', 'scope_id', 'bucket_start'],
+                set_={'data_mb': table.c.data_mb + statement.excluded.data_mb,
+                      'samples': table.c.samples + statement.excluded.samples})
+        connection.execute(statement, rows)
+        return
+
+    # Other databases: relative updates, then insert the buckets that were missing
+    missing = []
+    for row in rows:
+        result = connection.execute(table.update().where(
+            table.c.resolution == row['resolution'],
+            table.c.scope == row['scope'],
+            table.c.scope_id == row['scope_id'],
+            table.c.bucket_start == row['bucket_start']
+        ).values(data_mb=table.c.data_mb + row['data_mb'], samples=table.c.samples + row['samples']))
+        if result.rowcount == 0:
+            missing.append(row)
+    if missing:
+        connection.execute(table.insert(), missing)
+
+def apply_retention(config, now=None):
+    """Delete raw samples and fine-grained rollups past their retention window
+
+    Coarser rollups are maintained at write time, so dropping finer data is
+    all the downsampling needed. A retention of 0 days keeps data forever.
+    """
+    now = now or datetime.utcnow()
+    removed = 0
+
+    sample_days = config.get('USAGE_SAMPLE_RETENTION_DAYS', 7)
+    if sample_days:
+        removed += UsageSample.query.filter(
+            UsageSample.recorded_at < now - timedelta(days=sample_days)
+        ).delete(synchronize_session=False)
+
+    for resolution in RESOLUTIONS:
+        days = config.get(f'USAGE_{resolution.upper()}_RETENTION_DAYS', 0)
+        if days:
+            removed += UsageRollup.query.filter(
+                UsageRollup.resolution == resolution,
+                UsageRollup.bucket_start < now - timedelta(days=days)
+            ).delete(synchronize_session=False)
+
+    db.session.commit()
+    return removed
+
+def query_usage(scope, scope_id, resolution='hour', start=None, end=None):
+    """Get bandwidth buckets for a voucher, network or router"""
+    if scope not in SCOPES:
+        raise ValueError(f"Unsupported scope: {scope}")
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unsupported resolution: {resolution}")
+
+    query = UsageRollup.query.filter_by(resolution=resolution, scope=scope, scope_id=scope_id)
+    if start:
+        query = query.filter(UsageRollup.bucket_start >= bucket_start(start, resolution))
+    if end:
+        query = query.filter(UsageRollup.bucket_start < end)
+
+    buckets = query.order_by(UsageRollup.bucket_start).all()
+
+    return {
+        'scope': scope,
+        'scope_id': scope_id,
+        'resolution': resolution,
+        'total_mb': sum(b.data_mb or 0.0 for b in buckets),
+        'buckets': [b.to_dict() for b in buckets]
+    }
+
+# Global usage recorder instance
+usage_recorder = UsageRecorder()
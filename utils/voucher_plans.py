@@ -0,0 +1,108 @@
+"""
+Voucher Plan Migration
+Moves the settings every card of a batch repeats (duration, limits, type,
+price, allowed networks and the QR redemption URL) out of the vouchers and
+archive tables into shared voucher_plans rows. Databases created before plans
+existed are backfilled in chunks; the old columns can then be dropped
+"""
+
+from sqlalchemy import inspect
+from database import db
+from models.voucher_plan import VoucherPlan, PLAN_FIELDS
+
+# Columns replaced by plan_id, in the tables that still have them
+LEGACY_COLUMNS = [field for field in PLAN_FIELDS if field != 'qr_base_url'] + ['qr_code_data']
+TABLES = ('vouchers', 'vouchers_archive')
+DEFAULT_QR_BASE_URL = 'http://localhost:5000'
+
+def _qr_base_url(qr_code_data, code, configured):
+    """Portal URL a stored QR link was built with, or None when the default applies"""
+    suffix = f"/captive?code={code}"
+    if not qr_code_data or not qr_code_data.endswith(suffix):
+        return None
+    base_url = qr_code_data[:-len(suffix)]
+    return None if base_url in (DEFAULT_QR_BASE_URL, configured) else base_url
+
+def _add_plan_column(connection, table_name):
+    connection.exec_driver_sql(
+        f"ALTER TABLE {table_name} ADD COLUMN plan_id INTEGER REFERENCES voucher_plans (id)"
+    )
+    if table_name == 'vouchers':
+        connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_vouchers_plan_id ON vouchers (plan_id)")
+
+def backfill_table(table_name, chunk_size=5000, configured_base_url=None):
+    """Point every row without a plan at the plan matching its old columns"""
+    columns = {column['name'] for column in inspect(db.engine).get_columns(table_name)}
+    legacy = [column for column in LEGACY_COLUMNS if column in columns]
+    if not legacy:
+        return 0
+
+    table = db.Table(table_name, db.MetaData(), autoload_with=db.engine)
+    plan_fields = [column for column in legacy if column in PLAN_FIELDS]
+    selected = [table.c.id, table.c.code] + [table.c[column] for column in legacy]
+
+    updated = 0
+    last_id = None
+    while True:
+        query = db.select(*selected).where(table.c.plan_id.is_(None)).order_by(table.c.id).limit(chunk_size)
+        if last_id is not None:
+            query = query.where(table.c.id > last_id)
+        rows = db.session.execute(query).all()
+        if not rows:
+            break
+
+        ids_by_plan = {}
+        for row in rows:
+            fields = {field: getattr(row, field) for field in plan_fields}
+            if 'qr_code_data' in legacy:
+                fields['qr_base_url'] = _qr_base_url(row.qr_code_data, row.code, configured_base_url)
+            plan = VoucherPlan.get_or_create(**fields)
+            ids_by_plan.setdefault(plan, []).append(row.id)
+        db.session.flush()
+
+        for plan, ids in ids_by_plan.items():
+            db.session.execute(table.update().where(table.c.id.in_(ids)).values(plan_id=plan.id))
+        db.session.commit()
+
+        updated += len(rows)
+        last_id = rows[-1].id
+    return updated
+
+def drop_legacy_columns(table_name):
+    """Drop the columns plans replaced (SQLite needs 3.35 or newer)"""
+    columns = {column['name'] for column in inspect(db.engine).get_columns(table_name)}
+    dropped = []
+    with db.engine.begin() as connection:
+        for column in LEGACY_COLUMNS:
+            if column in columns:
+                connection.exec_driver_sql(f"ALTER TABLE {table_name} DROP COLUMN {column}")
+                dropped.append(column)
+    return dropped
+
+def migrate_voucher_plans(chunk_size=5000, drop_columns=False, configured_base_url=None):
+    """Create voucher_plans, backfill plan_id on both voucher tables and
+    optionally drop the old per-voucher columns. Safe to run again."""
+    VoucherPlan.__table__.create(db.engine, checkfirst=True)
+
+    report = {}
+    for table_name in TABLES:
+        inspector = inspect(db.engine)
+        if not inspector.has_table(table_name):
+            continue
+        if 'plan_id' not in {column['name'] for column in inspector.get_columns(table_name)}:
+            with db.engine.begin() as connection:
+                _add_plan_column(connection, table_name)
+
+        entry = report[table_name] = {'backfilled': backfill_table(table_name, chunk_size, configured_base_url)}
+        if drop_columns:
+            table = db.Table(table_name, db.MetaData(), autoload_with=db.engine)
+            missing = db.session.execute(
+                db.select(db.func.count()).select_from(table).where(table.c.plan_id.is_(None))
+            ).scalar()
+            db.session.rollback()
+            if missing:
+                entry['error'] = f"{missing} rows still have no plan; columns kept"
+            else:
+                entry['dropped'] = drop_legacy_columns(table_name)
+    report['plans'] = VoucherPlan.query.count()
+    return report
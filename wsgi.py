@@ -0,0 +1,17 @@
+"""
+WSGI Entry Point
+Production app instance with no per-worker side effects: tables and the admin
+user come from `flask --app wsgi init-db` / `seed-admin`, and the network
+monitor and RADIUS server run as their own processes (`flask --app wsgi
+monitor`, `flask --app wsgi radius`).
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+from app import create_app
+
+app = create_app({
+    'AUTO_INIT_DB': False,
+    'NETWORK_MONITOR_ENABLED': False,
+    'RADIUS_ENABLED': False
+})